@@ -6,6 +6,7 @@ from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
+from .config import Config
 from .state_models import State
 from .chat_agent import ChatAgent
 from .strategist_agent import StrategistAgent
@@ -21,8 +22,9 @@ class AgentGraph:
         # Initialize agents
         chat_agent = ChatAgent(user_id)
         strategist_agent = StrategistAgent(user_id)
-        voice_agent = VoiceAgent(user_id)
         analyst_agent = AnalystAgent(user_id)
+        # The analyst keeps a running ranking as calls complete, see Config.ANALYST_INCREMENTAL
+        voice_agent = VoiceAgent(user_id, on_quote=analyst_agent.add_quote if Config.ANALYST_INCREMENTAL else None)
 
         # Create workflow graph
         workflow = StateGraph(State)
@@ -48,18 +50,12 @@ class AgentGraph:
                 return "voice"
             return "strategist"
 
-        # define when to analyze the call transcripts
-        def should_analyze(state: State) -> str:
-            if state.get("call_transcripts"):
-                print("\n MOVING ON TO ANALYST \n")
-                return "analyst"
-            return END
-
 
         # Add edges
         workflow.add_conditional_edges("chat", should_continue_chat, ["chat", "strategist", END])
         workflow.add_conditional_edges("strategist", should_make_calls, ["voice"])
-        workflow.add_conditional_edges("voice", should_analyze, ["analyst"])
+        # The analyst runs on whatever quotes the voice stage has by its deadline, even none
+        workflow.add_edge("voice", "analyst")
         workflow.add_edge("analyst", END)
 
         # Set entry point
@@ -1,57 +1,164 @@
-from typing import Dict
+import threading
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
 
+from integrations.rate_limiter import Priority, chat_model_limits
 from .config import Config
+from .quote_comparison import QuoteScore, compare_quotes, customer_needs, leads_on_every_criterion
+from .state_models import CallTranscript, CustomerInfo
 from . import firebase
 
-analyst_system_prompt = """You are a moving services analyst. Your task is to:
-1. Review all call transcripts
-2. Compare quotes and services offered
-3. Analyze the negotiation results
-4. Make a final recommendation based on:
-   - Price
-   - Services included
-   - Customer needs
-   - Other factors (e.g., mover's reputation, reviews, etc.)
+# The recommendation is made by the quote comparison, the LLM only explains it
+analyst_system_prompt = """You are a moving services analyst explaining a recommendation that has already been made
+by comparing the quotes movers gave on the phone.
+In at most 4 sentences, explain why the recommended mover was chosen over the others, weighing price, the
+customer's needs the quoted services cover and the mover's rating. Only use the figures given.
+Quotes marked partial are from calls cut off at their time limit, say when the recommended quote is incomplete.
+Never recommend a different mover. Output only the explanation."""
 
-Format your response as a clear recommendation on who to choose with supporting evidence, if no clear evidence, respond with INCONCLUSIVE.
-List the vendors you contacted and explain their differences on how you arrived at your final recommendation.
-The final output should be in the following format:
-
-Final Recomendation: Vendor name
-
-**Rationale**
-[Evidence supporting recommendation]
-"""
+def _same_quotes(quotes: List[CallTranscript], others: List[CallTranscript]) -> bool:
+    return sorted(quote.model_dump_json() for quote in quotes) == sorted(quote.model_dump_json() for quote in others)
 
 class AnalystAgent:
-    def __init__(self, user_id: str, model: str = Config.ANALYST_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id: str, model: str = Config.ANALYST_MODEL, database_path: str = "./agents/movers_database.csv", narration: str = Config.ANALYST_NARRATION):
+        self.llm = ChatOpenAI(model=model, **chat_model_limits(model, Priority.BACKGROUND))
         self.user_id = user_id
+        self.narration = narration
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", analyst_system_prompt),
-            ("human", "Customer Info: {customer_info}\nCall Transcripts: {transcripts}")
+            ("human", "Customer needs: {needs}\nRecommended mover: {mover}\nQuotes, best first:\n{quotes}")
         ])
+        # Catalog ratings, to weigh quotes by the mover's reputation
+        movers_db = pd.read_csv(database_path)
+        self.ratings = dict(zip(movers_db["name"], movers_db["rating"]))
+        # Running ranking of the current run's quotes, see add_quote
+        self._lock = threading.Lock()
+        self._draft_quotes: List[CallTranscript] = []
+        self._draft: Optional[Tuple[List[CallTranscript], List[QuoteScore], str]] = None
+        self._narrated: Optional[Tuple[str, str]] = None
+
+    def add_quote(self, quote: CallTranscript, customer_info: Optional[CustomerInfo] = None):
+        """
+        Rank a quote as soon as its call completes, and store the draft recommendation for live leaderboards.
+
+        Called from the voice agent's worker threads. The final recommendation then only covers
+        the quotes that came in since the last draft. Only the ranking holds the lock, so a
+        narration call never keeps the other completing calls waiting.
+        """
+        with self._lock:
+            self._draft_quotes.append(quote)
+            quotes = list(self._draft_quotes)
+            ranking = compare_quotes(quotes, customer_info, self.ratings)
+        content = self._recommend(ranking, customer_info)
+        with self._lock:
+            if self._draft is not None and len(self._draft[0]) >= len(quotes):
+                # A draft with more quotes was stored while this one was narrated
+                return
+            self._draft = (quotes, ranking, content)
+
+        print(f"Draft recommendation after {len(ranking)} quotes: {ranking[0].quote.mover_name}")
+        firebase.update_data(self.user_id, {
+            "ranking": [score.model_dump() for score in ranking],
+            "recommendationDraft": content,
+        })
 
     def __call__(self, state: Dict) -> Dict:
         customer_info = state.get("customer_info", None)
-        transcripts = state.get("call_transcripts", None)
+        quotes = state.get("call_transcripts", None) or []
 
         print(f"Analysing quotes")
 
-        chain = self.prompt | self.llm
-        response = chain.invoke({"customer_info": customer_info,"transcripts": transcripts})
+        with self._lock:
+            draft = self._draft if self._draft is not None and _same_quotes(self._draft[0], quotes) else None
+            self._draft_quotes, self._draft = [], None
+        if draft is not None:
+            # Every quote was ranked as its call completed, in whatever order they came in
+            _, ranking, content = draft
+        else:
+            ranking = compare_quotes(quotes, customer_info, self.ratings)
+            content = self._recommend(ranking, customer_info)
 
+        response = AIMessage(content=content)
         print(f"FINAL RECOMMENDATION: {response.content}")
 
         firebase.update_data(self.user_id, {
             "status": firebase.AppStatus.COMPLETED,
             "recommendation": response.content,
+            "ranking": [score.model_dump() for score in ranking],
             # "messages": response,
         })
 
         return {
             "messages": response,
             "final_recommendation": response.content
-        }
\ No newline at end of file
+        }
+
+    def _recommend(self, ranking: List[QuoteScore], customer_info: Optional[CustomerInfo]) -> str:
+        """Write the recommendation for ranked quotes, may call the LLM."""
+        if not ranking or ranking[0].price is None:
+            # No call got far enough to quote a price, still finish the run
+            rationale = "No call to a mover produced a quote." if not ranking else "No mover quoted a price."
+            return self._format("INCONCLUSIVE", rationale, ranking)
+
+        rationale = self._template_rationale(ranking)
+        if self.narration == "llm" or (self.narration == "auto" and not leads_on_every_criterion(ranking)):
+            rationale = self._narrate(ranking, customer_info) or rationale
+        return self._format(ranking[0].quote.mover_name, rationale, ranking)
+
+    def _narrate(self, ranking: List[QuoteScore], customer_info) -> str:
+        """Rationale for the recommendation written by the LLM, empty if it fails. Reused while the table is unchanged."""
+        inputs = {
+            "needs": ", ".join(customer_needs(customer_info)) or "none given",
+            "mover": ranking[0].quote.mover_name,
+            "quotes": "\n".join(self._quote_line(score) for score in ranking),
+        }
+        key = "\n".join(inputs.values())
+        if self._narrated is not None and self._narrated[0] == key:
+            return self._narrated[1]
+
+        chain = self.prompt | self.llm
+        try:
+            rationale = chain.invoke(inputs).content.strip()
+        except Exception as e:
+            print(f"Error writing the rationale, using the template: {e}")
+            return ""
+        self._narrated = (key, rationale)
+        return rationale
+
+    @staticmethod
+    def _template_rationale(ranking: List[QuoteScore]) -> str:
+        best, others = ranking[0], ranking[1:]
+        reasons = []
+        if best.price_score == 1:
+            reasons.append("quoted the lowest price" if others else f"quoted ${best.price:,.2f}")
+        if best.covered and not best.missing:
+            reasons.append("covers all of your needs")
+        if best.rating is not None and all(best.rating >= (other.rating or 0) for other in others):
+            reasons.append(f"has the {'highest ' if others else ''}rating ({best.rating}/5)")
+        if not reasons:
+            reasons.append("has the best balance of price, services and rating")
+        rationale = f"{best.quote.mover_name} " + (", ".join(reasons[:-1]) + " and " if len(reasons) > 1 else "") + reasons[-1] + "."
+        if best.missing:
+            rationale += f" Check with them about {', '.join(best.missing)}, it was not part of the quote."
+        if best.quote.partial:
+            rationale += " The call was cut off, the quote may be incomplete."
+        return rationale
+
+    @staticmethod
+    def _quote_line(score: QuoteScore) -> str:
+        price = f"${score.price:,.2f}" if score.price is not None else "no price"
+        covered = f"covers {', '.join(score.covered)}" if score.covered else "covers none of your needs"
+        if not score.covered and not score.missing:
+            covered = "no special needs"
+        rating = f"rating {score.rating}/5" if score.rating is not None else "no rating"
+        partial = ", call cut off" if score.quote.partial else ""
+        return f"- {score.quote.mover_name}: {price}, {covered}, {rating}{partial} (score {score.score:.2f})"
+
+    def _format(self, mover_name: str, rationale: str, ranking: List[QuoteScore]) -> str:
+        content = f"Final Recomendation: {mover_name}\n\n**Rationale**\n{rationale}"
+        if ranking:
+            content += "\n\n**Quotes**\n" + "\n".join(self._quote_line(score) for score in ranking)
+        return content
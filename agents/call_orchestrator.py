@@ -0,0 +1,504 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+
+from integrations.answer_rates import AnswerRates
+from voice_server import TERMINAL_CALL_STATUSES, check_call_status, get_call_data, hangup_call, wait_for_call_completion
+from .config import Config
+from .state_models import CallTranscript
+
+
+class CallResult(BaseModel):
+    """Outcome of one outbound call to a mover"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    mover: Dict = Field(description="The mover that was called")
+    strategy: str = Field(description="The negotiation strategy the call was placed with")
+    call_sid: Optional[str] = Field(default=None, description="The Twilio call SID")
+    status: Optional[str] = Field(default=None, description="The final Twilio call status")
+    attempts: int = Field(default=0, description="Calls placed to the mover, retries included")
+    attempt_statuses: List[str] = Field(default_factory=list, description="The final Twilio status of each attempt")
+    transcript: Optional[Dict] = Field(default=None, description="The call data stored by the voice server")
+    quote: Optional[CallTranscript] = Field(default=None, description="The quote extracted from the call transcript")
+    cancelled: bool = Field(default=False, description="Whether the call was cancelled")
+    timed_out: bool = Field(default=False, description="Whether the call was hung up or skipped at a deadline, its transcript may be partial")
+
+    _cancel_event: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _cancelled_at: Optional[float] = PrivateAttr(default=None)
+    _retry_at: Optional[float] = PrivateAttr(default=None)
+
+
+class CallOrchestrator:
+    """
+    Places mover calls concurrently, in waves.
+
+    All calls in a wave run at the same time (bounded by `max_concurrent_calls`), and the next
+    wave is dialed as soon as they end. Extracting a call's quote and adapting the strategy to
+    the quotes so far are LLM round trips, they run in the background instead of between
+    calls: a wave is dialed with the latest strategy ready, and a strategy adapted while calls
+    are live is handed to them through `update_strategy`. Later movers still benefit from what
+    earlier ones quoted, but only the calls themselves are on the critical path.
+
+    Calls ending `busy`, `no-answer` or `failed` are retried up to `max_attempts` times, after
+    a delay that depends on the status and doubles with every attempt. A retry only takes a
+    worker once it is due, so waiting for it never holds up the other movers; it is dialed
+    with the latest strategy. An attempt that raises, e.g. Twilio rejecting the call, counts
+    as `failed`, and errors raised by the callbacks are logged rather than ending the run.
+    With `answer_rates`, every attempt's outcome is recorded and movers most likely to pick
+    up are dialed first.
+
+    Calls are hung up `call_timeout` seconds after dialing, and the whole run ends after
+    `stage_timeout`: calls still running are hung up, movers not dialed yet and pending
+    retries are skipped, and the results hold whatever transcripts were recorded by then.
+    A call that does not end within `hangup_grace` of being hung up is abandoned rather
+    than waited for.
+    """
+
+    def __init__(
+        self,
+        dial: Callable[[Dict, str], str],
+        extract_quote: Callable[[CallResult], CallTranscript],
+        modify_strategy: Callable[[List[CallTranscript], str], str],
+        max_concurrent_calls: int = Config.MAX_CONCURRENT_CALLS,
+        wave_size: Optional[int] = Config.CALL_WAVE_SIZE,
+        status_check_interval: float = Config.CALL_STATUS_CHECK_INTERVAL,
+        call_timeout: Optional[float] = Config.CALL_TIMEOUT,
+        stage_timeout: Optional[float] = Config.NEGOTIATION_STAGE_TIMEOUT,
+        hangup_grace: float = Config.CALL_HANGUP_GRACE,
+        max_attempts: int = Config.CALL_MAX_ATTEMPTS,
+        retry_statuses: Tuple[str, ...] = Config.CALL_RETRY_STATUSES,
+        retry_delays: Dict[str, float] = Config.CALL_RETRY_DELAYS,
+        retry_jitter: float = Config.CALL_RETRY_JITTER,
+        answer_rates: Optional[AnswerRates] = None,
+        update_strategy: Optional[Callable[[CallResult, str], None]] = None,
+    ):
+        """
+        :param dial: Places a call to a mover with a strategy and returns the call SID.
+        :param extract_quote: Extracts the quote from a completed call's transcript, given its result.
+        :param modify_strategy: Adapts the strategy given the quotes of completed calls.
+        :param max_concurrent_calls: Upper bound on calls in flight at once.
+        :param wave_size: Calls per wave. Defaults to `max_concurrent_calls`.
+        :param status_check_interval: Seconds without a status callback after which Twilio is asked directly.
+        :param call_timeout: Seconds from dialing after which a call is hung up. None for no limit.
+        :param stage_timeout: Seconds after which `run` hangs up all calls and returns. None for no limit.
+        :param hangup_grace: Seconds a hung up call gets to end and have its quote extracted before it is abandoned.
+        :param max_attempts: Calls placed per mover at most, including the first.
+        :param retry_statuses: Final call statuses after which a mover is called again.
+        :param retry_delays: Seconds before the first retry, per status. Doubled for each later retry.
+        :param retry_jitter: Random share added to each retry delay.
+        :param answer_rates: Answer-rate statistics to record outcomes in and order movers by.
+        :param update_strategy: Hands an adapted strategy to a call already dialed, given its result.
+        """
+        self.dial = dial
+        self.extract_quote = extract_quote
+        self.modify_strategy = modify_strategy
+        self.max_concurrent_calls = max(1, max_concurrent_calls)
+        self.wave_size = max(1, wave_size or self.max_concurrent_calls)
+        self.status_check_interval = status_check_interval
+        self.call_timeout = call_timeout
+        self.stage_timeout = stage_timeout
+        self.hangup_grace = hangup_grace
+        self.max_attempts = max(1, max_attempts)
+        self.retry_statuses = retry_statuses
+        self.retry_delays = retry_delays
+        self.retry_jitter = retry_jitter
+        self.answer_rates = answer_rates
+        self.update_strategy = update_strategy
+        self._results: List[CallResult] = []
+        self._lock = threading.Lock()
+
+        # State of the current run, only touched by the thread calling `run`
+        self._strategy = ""
+        self._stage_deadline: Optional[float] = None
+        self._on_strategy: Optional[Callable[[str], None]] = None
+        self._on_call_completed: Optional[Callable[[CallResult], None]] = None
+        self._calls: Optional[ThreadPoolExecutor] = None
+        self._background: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Dict[Future, CallResult] = {}
+        self._extracting: Dict[Future, CallResult] = {}
+        self._retries: List[Tuple[float, int, CallResult]] = []
+        self._retry_order = itertools.count()
+        self._quotes: List[CallTranscript] = []
+        self._replanning: Optional[Future] = None
+        self._planned_quotes = 0
+        self._undialed = 0
+
+    def run(
+        self,
+        movers: List[Dict],
+        strategy: str,
+        on_strategy: Optional[Callable[[str], None]] = None,
+        on_call_completed: Optional[Callable[[CallResult], None]] = None,
+    ) -> List[CallResult]:
+        """
+        Call every mover and return the results in the order they were first dialed.
+
+        Returns once every call has ended and had its quote extracted, or by the stage deadline (plus
+        `hangup_grace`) with the calls it cut short marked `timed_out`. Their transcripts hold
+        what was said up to the hang up.
+
+        :param movers: The movers to call.
+        :param strategy: The initial negotiation strategy.
+        :param on_strategy: Called with each adapted strategy, as soon as it is ready.
+        :param on_call_completed: Called from a worker thread once a mover's last attempt has ended and its quote was extracted.
+        """
+        self._strategy = str(strategy)
+        self._stage_deadline = None if self.stage_timeout is None else time.monotonic() + self.stage_timeout
+        self._on_strategy = on_strategy
+        self._on_call_completed = on_call_completed
+        if self.answer_rates is not None:
+            movers = self.answer_rates.rank(movers)
+        self._undialed = len(movers)
+        self._calls = ThreadPoolExecutor(max_workers=self.max_concurrent_calls, thread_name_prefix="mover-call")
+        # Quote extractions and strategy updates, at most one of each per call in flight
+        self._background = ThreadPoolExecutor(max_workers=self.max_concurrent_calls + 1, thread_name_prefix="mover-call-quote")
+        abandoned = False
+        try:
+            for start in range(0, len(movers), self.wave_size):
+                wave = movers[start:start + self.wave_size]
+
+                if self._remaining(self._stage_deadline) == 0:
+                    self._skip(movers[start:])
+                    break
+
+                # Whatever strategy is ready now, a better one reaches the calls once adapted
+                wave_results = [CallResult(mover=mover, strategy=self._strategy) for mover in wave]
+                with self._lock:
+                    self._results.extend(wave_results)
+                self._undialed -= len(wave)
+
+                futures = [self._submit(result) for result in wave_results]
+                if not self._wait(futures):
+                    self._skip(movers[start + self.wave_size:])
+                    break
+            else:
+                # Every mover has been dialed, see the retries and quote extractions through
+                self._wait()
+
+            # Only left over when the stage deadline passed
+            if self._in_flight or self._retries or self._extracting:
+                abandoned = not self._stop()
+        finally:
+            self._calls.shutdown(wait=not abandoned, cancel_futures=True)
+            # A strategy update still running is of no use to anyone any more
+            self._background.shutdown(wait=False, cancel_futures=True)
+
+        return list(self._results)
+
+    def _skip(self, movers: List[Dict]):
+        if not movers:
+            return
+        print(f"Negotiation stage deadline passed, skipping {len(movers)} movers")
+        self._undialed = 0
+        with self._lock:
+            self._results.extend(
+                CallResult(mover=mover, strategy=self._strategy, cancelled=True, timed_out=True)
+                for mover in movers
+            )
+
+    def _submit(self, result: CallResult) -> Future:
+        if result.attempts:
+            # A retry, placed with what was learned from the calls since
+            result.strategy = self._strategy
+            result.call_sid = None
+            result.status = None
+            result._retry_at = None
+            result._cancelled_at = None
+        future = self._calls.submit(self._place_call, result)
+        self._in_flight[future] = result
+        return future
+
+    def _wait(self, futures: Optional[List[Future]] = None) -> bool:
+        """
+        Wait until the calls `futures` have ended (every call, retry and quote extraction, if None),
+        dialing retries as they come due and adapting the strategy as quotes come in.
+
+        Returns False if the stage deadline passed first.
+        """
+        while True:
+            now = time.monotonic()
+            while self._retries and self._retries[0][0] <= now:
+                _, _, result = heapq.heappop(self._retries)
+                self._submit(result)
+
+            if futures is None:
+                if not self._in_flight and not self._retries and not self._extracting:
+                    return True
+            elif not any(future in self._in_flight for future in futures):
+                return True
+
+            timeout = self._remaining(self._stage_deadline)
+            if self._retries:
+                next_retry = max(self._retries[0][0] - now, 0)
+                timeout = next_retry if timeout is None else min(timeout, next_retry)
+            pending = [*self._in_flight, *self._extracting]
+            if self._replanning is not None:
+                pending.append(self._replanning)
+            if pending:
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)
+                done = set()
+
+            for future in done:
+                self._completed(future)
+
+            if self._remaining(self._stage_deadline) == 0:
+                return False
+
+    def _completed(self, future: Future):
+        if future in self._in_flight:
+            result = self._in_flight.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                self._call_failed(result, e)
+            if result._retry_at is not None:
+                heapq.heappush(self._retries, (result._retry_at, next(self._retry_order), result))
+            elif result.attempts:
+                self._extracting[self._background.submit(self._finish_call, result)] = result
+        elif future in self._extracting:
+            result = self._extracting.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error finishing call {result.call_sid}: {e}")
+            if result.quote:
+                self._quotes.append(result.quote)
+                self._replan()
+        elif future is self._replanning:
+            self._replanning = None
+            try:
+                strategy = future.result()
+            except Exception as e:
+                print(f"Error adapting the strategy, keeping the current one: {e}")
+                strategy = None
+            if strategy is not None:
+                self._adopt(strategy)
+            self._replan()
+
+    def _call_failed(self, result: CallResult, error: Exception):
+        """Record an attempt that raised as a failed call, retried like one, so the other movers are still called."""
+        mover_name = result.mover.get("name", "")
+        print(f"Error calling {mover_name}: {error}")
+        if len(result.attempt_statuses) == result.attempts:
+            # The call had ended already, only reading its transcript failed
+            return
+        if result.call_sid and result.status is None:
+            self._hangup(result.call_sid)
+        result.status = "failed"
+        result.attempt_statuses.append(result.status)
+        if self.answer_rates is not None and not result.cancelled:
+            self.answer_rates.record(mover_name, result.status)
+        result._retry_at = self._retry_time(result) if result.status in self.retry_statuses else None
+
+    def _replan(self):
+        """Adapt the strategy in the background to quotes it hasn't seen, if any call can still use it."""
+        if self._replanning is not None or len(self._quotes) <= self._planned_quotes:
+            return
+        if not (self._undialed or self._in_flight or self._retries):
+            return
+        self._planned_quotes = len(self._quotes)
+        self._replanning = self._background.submit(self._adapt_strategy, list(self._quotes), self._strategy)
+
+    def _adapt_strategy(self, quotes: List[CallTranscript], strategy: str) -> Optional[str]:
+        try:
+            return self.modify_strategy(quotes, strategy)
+        except Exception as e:
+            print(f"Error adapting the strategy, keeping the current one: {e}")
+            return None
+
+    def _adopt(self, strategy: str):
+        """Use an adapted strategy for the calls dialed from now on, and hand it to those already live."""
+        self._strategy = str(strategy)
+        if self._on_strategy:
+            try:
+                self._on_strategy(strategy)
+            except Exception as e:
+                # Only the caller's bookkeeping failed, the calls still use the strategy
+                print(f"Error handing over the adapted strategy: {e}")
+        for result in list(self._in_flight.values()):
+            if result.strategy == self._strategy:
+                continue
+            result.strategy = self._strategy
+            # Calls still dialing pick it up in `_place_call`
+            if result.call_sid and result.status is None:
+                self._hand_over(result)
+
+    def _hand_over(self, result: CallResult):
+        if self.update_strategy is None:
+            return
+        try:
+            self.update_strategy(result, result.strategy)
+        except Exception as e:
+            print(f"Error updating the strategy of call {result.call_sid}: {e}")
+
+    def _stop(self) -> bool:
+        """Drop pending retries and hang up the calls still running. Returns False if some did not end in time."""
+        for _, _, result in self._retries:
+            result._retry_at = None
+            result.timed_out = True
+        if self._retries:
+            print(f"Negotiation stage deadline passed, dropping {len(self._retries)} retries")
+            self._retries.clear()
+
+        if self._in_flight:
+            print(f"Negotiation stage deadline passed, hanging up {len(self._in_flight)} calls")
+            for result in list(self._in_flight.values()):
+                self._cancel(result, timed_out=True)
+        # Quotes are still extracted from hung up calls, from what was said until then
+        grace_deadline = time.monotonic() + self.hangup_grace
+        while self._in_flight or self._extracting:
+            done, _ = wait([*self._in_flight, *self._extracting], timeout=self._remaining(grace_deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                # Stuck on Twilio or the extraction, their worker threads finish in the background
+                print(f"Abandoning {len(self._in_flight) + len(self._extracting)} calls that did not end after hanging up")
+                return False
+            for future in done:
+                self._completed(future)
+        return True
+
+    def cancel(self, mover_name: Optional[str] = None, call_sid: Optional[str] = None):
+        """Cancel a pending or in-flight call, by mover name or call SID. Live calls are hung up."""
+        with self._lock:
+            results = [
+                result for result in self._results
+                if (mover_name is not None and result.mover.get("name") == mover_name)
+                or (call_sid is not None and result.call_sid == call_sid)
+            ]
+        for result in results:
+            self._cancel(result)
+
+    def cancel_all(self):
+        with self._lock:
+            results = list(self._results)
+        for result in results:
+            self._cancel(result)
+
+    def _cancel(self, result: CallResult, timed_out: bool = False):
+        # A call waiting for its retry can still be cancelled, a finished one or one being hung up can't
+        if result._cancel_event.is_set() or result._cancelled_at is not None or (result.status is not None and result._retry_at is None):
+            return
+        result.timed_out = timed_out
+        result._cancelled_at = time.monotonic()
+        result._cancel_event.set()
+        if result.call_sid and result.status is None:
+            # Hanging up resolves the call's completion, which releases the waiting worker
+            self._hangup(result.call_sid)
+
+    def _time_out(self, result: CallResult):
+        """
+        Hang up a call at its own time limit. Unlike a cancellation, the call keeps the status
+        it ends with, so an answered call still counts as answered in the answer rates.
+        """
+        result.timed_out = True
+        result._cancelled_at = time.monotonic()
+        self._hangup(result.call_sid)
+
+    def _hangup(self, call_sid: str):
+        try:
+            hangup_call(call_sid)
+        except Exception as e:
+            # The call may have ended already, waiting for it is bounded by `hangup_grace`
+            print(f"Error hanging up call {call_sid}: {e}")
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+    def _place_call(self, result: CallResult):
+        if result._cancel_event.is_set():
+            result.cancelled = True
+            return
+
+        result.attempts += 1
+        strategy = result.strategy
+        result.call_sid = self.dial(result.mover, strategy)
+        if result._cancel_event.is_set():
+            # Cancelled while dialing
+            self._hangup(result.call_sid)
+        elif result.strategy != strategy:
+            # The strategy was adapted while dialing
+            self._hand_over(result)
+        result.status = self._wait_for_call(result)
+        result.attempt_statuses.append(result.status)
+        print(f"Call {result.call_sid} status: {result.status}" + (" (timed out)" if result.timed_out else ""))
+        if self.answer_rates is not None and not result.cancelled:
+            self.answer_rates.record(result.mover.get("name", ""), result.status)
+
+        if result.status in self.retry_statuses:
+            mover_name = result.mover.get("name")
+            result._retry_at = self._retry_time(result)
+            if result._retry_at is not None:
+                print(f"Calling {mover_name} again in {result._retry_at - time.monotonic():.0f}s, attempt {result.attempts + 1} of {self.max_attempts}")
+            else:
+                print(f"Giving up on {mover_name} after {result.attempts} attempts: {result.status}")
+            # Nobody picked up, there is no conversation to extract a quote from
+            return
+
+        # A call hung up at its deadline still has what was said until then
+        result.transcript = get_call_data(result.call_sid)
+        if result.transcript is None:
+            print(f"No transcript for call {result.call_sid}, it is left out of the analysis")
+
+    def _finish_call(self, result: CallResult):
+        """Extract the quote from a mover's last call, off the critical path."""
+        if result.transcript is not None:
+            try:
+                result.quote = self.extract_quote(result)
+            except Exception as e:
+                print(f"Error extracting the quote from call {result.call_sid}: {e}")
+
+        print(f"Call transcript: {result.transcript}")
+        print(f"Quote from call: {result.quote}")
+
+        if self._on_call_completed:
+            try:
+                self._on_call_completed(result)
+            except Exception as e:
+                print(f"Error handing over call {result.call_sid}: {e}")
+
+    def _retry_time(self, result: CallResult) -> Optional[float]:
+        """When to call the mover again, None if it shouldn't be."""
+        if result.cancelled or result.attempts >= self.max_attempts:
+            return None
+        delay = self.retry_delays.get(result.status, 60) * 2 ** (result.attempts - 1)
+        retry_at = time.monotonic() + delay * (1 + random.uniform(0, self.retry_jitter))
+        if self._stage_deadline is not None and retry_at >= self._stage_deadline:
+            return None
+        return retry_at
+
+    def _wait_for_call(self, result: CallResult) -> str:
+        call_deadline = None if self.call_timeout is None else time.monotonic() + self.call_timeout
+        while True:
+            timeout = self.status_check_interval
+            if result._cancelled_at is not None:
+                timeout = min(timeout, self._remaining(result._cancelled_at + self.hangup_grace))
+            elif call_deadline is not None:
+                timeout = min(timeout, self._remaining(call_deadline))
+            status = wait_for_call_completion(result.call_sid, timeout=timeout)
+            if result._cancel_event.is_set():
+                result.cancelled = True
+            if status in TERMINAL_CALL_STATUSES:
+                return status
+
+            if result._cancelled_at is not None:
+                if self._remaining(result._cancelled_at + self.hangup_grace) == 0:
+                    print(f"Call {result.call_sid} did not end after hanging up, giving up on it")
+                    return "canceled"
+            elif call_deadline is not None and self._remaining(call_deadline) == 0:
+                print(f"Call {result.call_sid} reached its {self.call_timeout:g}s limit, hanging up")
+                self._time_out(result)
+                continue
+
+            if status is None:
+                # No status callback for a while, ask Twilio in case it was lost
+                status = check_call_status(result.call_sid)
+            if status in TERMINAL_CALL_STATUSES:
+                return status
@@ -24,6 +24,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableConfig
 from firebase_admin.firestore import firestore
 
+from integrations.rate_limiter import Priority, chat_model_limits
 from .config import Config
 from .state_models import CustomerInfo
 from . import firebase
@@ -49,7 +50,7 @@ If the user provides vague information about anything, for example address, try
 
 class ChatAgent:
     def __init__(self, user_id: str, model: str = Config.CHAT_MODEL):
-        self.llm = ChatOpenAI(model=model)
+        self.llm = ChatOpenAI(model=model, **chat_model_limits(model, Priority.CHAT))
         self.user_id = user_id
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", chat_system_prompt),
@@ -10,6 +10,24 @@ class Config:
     MAX_CALL_TURNS = 5
     RECORDING_DURATION = 10
 
+    # Outbound mover calls
+    MAX_CONCURRENT_CALLS = 3
+    CALL_WAVE_SIZE = None # Calls per wave between strategy updates, defaults to MAX_CONCURRENT_CALLS
+    CALL_STATUS_CHECK_INTERVAL = 60 # Completion comes from Twilio status callbacks, this is only a safety net
+    CALL_TIMEOUT = MAX_CALL_TURNS * 2 * 60 # Seconds from dialing until a call is hung up, about two minutes per turn
+    NEGOTIATION_STAGE_TIMEOUT = 30 * 60 # Seconds for all mover calls, calls still running are hung up and movers not dialed yet are skipped
+    CALL_MAX_ATTEMPTS = 3 # Per mover, including the first call
+    CALL_RETRY_STATUSES = ("busy", "no-answer", "failed")
+    CALL_RETRY_DELAYS = {"busy": 90, "no-answer": 300, "failed": 60} # Seconds before the first retry, doubled for each later one
+    CALL_RETRY_JITTER = 0.2 # Random share added to retry delays, so retries to many movers don't line up
+    CALL_HANGUP_GRACE = 15 # Seconds a hung up call gets to end and have its quote extracted before it is abandoned
+
+    # Quote comparison in the analyst
+    QUOTE_SCORE_WEIGHTS = {"price": 0.6, "coverage": 0.25, "rating": 0.15} # Share of price, needs covered and catalog rating in a quote's score
+    QUOTE_TIE_BREAK = ("price", "rating", "coverage", "complete", "name") # Criteria deciding between equal scores, in order
+    ANALYST_INCREMENTAL = True # Rank each quote as its call completes, so the recommendation is ready when the last call ends
+    ANALYST_NARRATION = "auto" # "template", "llm", or "auto": the LLM only writes the rationale when the winner doesn't lead on every criterion
+
     # LLM Models
     CHAT_MODEL = "gpt-4o-mini"
     VOICE_MODEL = "gpt-4o-mini"
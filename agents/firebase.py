@@ -38,6 +38,7 @@ class SessionData(TypedDict):
     strategy: Optional[str]
     movers: Optional[List[str]]
     transcripts: Optional[List[str]]
+    quotes: Optional[List[Dict]]
     callSummaries: Optional[List[str]]
     recommendation: Optional[str]
 
@@ -88,6 +89,26 @@ def update_call_data(user_id: str, call_sid: str, data: Dict, merge=True):
     else:
         db.collection('users').document(user_id).collection('calls').document(call_sid).set(data, merge=merge)
 
+def append_call_transcripts(user_id: str, call_sid: str, transcripts: List[Dict], data: Optional[Dict] = None):
+    """
+    Append transcript entries to 'users/{user_id}/calls/{call_sid}', merging any other fields in `data`.
+    Only the new entries are sent, the existing transcript is not rewritten.
+
+    :param user_id: The ID of the user.
+    :param call_sid: The SID of the call.
+    :param transcripts: The new transcript entries, in order. Entries must be unique (e.g. carry a sequence number).
+    :param data: Other fields to merge into the document.
+    """
+    data = dict(data or {})
+    if DEMO_MODE:
+        call_data = _mock_db.setdefault(user_id, {}).setdefault('calls', {}).setdefault(call_sid, {})
+        call_data.update(data)
+        call_data.setdefault('transcripts', []).extend(transcripts)
+    else:
+        if transcripts:
+            data['transcripts'] = firestore.ArrayUnion(transcripts)
+        db.collection('users').document(user_id).collection('calls').document(call_sid).set(data, merge=True)
+
 def get_call_data_as_json(user_id: str, call_sid: str) -> Optional[Dict]:
     """
     Retrieve the Firestore document at the path 'users/{user_id}/calls/{call_sid}' and return it as JSON.
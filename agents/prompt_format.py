@@ -0,0 +1,168 @@
+"""
+Compact prompt renderings of the state objects.
+Each object is written as short `label: value` lines holding only the fields a prompt's purpose
+needs, in a fixed order, so prompts stay small and their prefixes stay byte-identical across
+calls. Renderings are memoized by the object's field values.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+from pydantic import BaseModel
+
+from .config import Config
+from .state_models import CallTranscript, CustomerInfo, MoverInfo
+
+
+CUSTOMER_PURPOSES = ("call", "planning", "filter")
+MOVER_PURPOSES = ("filter",)
+QUOTE_PURPOSES = ("strategy",)
+SPEAKERS = {"assistant": "Caller", "user": "Mover"}
+
+
+def _freeze(value: Any) -> Any:
+    """Hashable version of a field value."""
+    if isinstance(value, BaseModel):
+        return _freeze(value.__dict__)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _date(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat(timespec="minutes")
+    return str(value)
+
+
+def _price(value: Any) -> str:
+    return f"${value:,.0f}" if float(value).is_integer() else f"${value:,.2f}"
+
+
+def _list(value: Any) -> str:
+    if isinstance(value, str):
+        value = value.split(",")
+    return ", ".join(item.strip() for item in value if str(item).strip())
+
+
+def _render_customer(fields: Dict, purpose: str) -> str:
+    lines = []
+    if purpose == "call":
+        lines.append(f"Customer: {fields['name']}, {fields['phone']}")
+    lines.append(f"Move: {fields['current_address']} -> {fields['destination_address']} ({'long distance' if fields['is_long_distance'] else 'local'})")
+    if purpose != "filter":
+        lines.append(f"Dates: out {_date(fields['move_out_date'])}, in {_date(fields['move_in_date'])}")
+        lines.append(f"Home: {fields['apartment_size']}" + (f"; items: {_list(fields['inventory'])}" if fields["inventory"] else ""))
+    needs = [need for need, wanted in (("packing", fields["packing_assistance"]), ("storage", fields["storage_required"])) if wanted]
+    if needs:
+        lines.append(f"Needs: {', '.join(needs)}")
+    special_items = (fields["special_items"] or "").strip()
+    if special_items.casefold() not in ("", "none", "no", "n/a"):
+        lines.append(f"Special items: {special_items}")
+    return "\n".join(lines)
+
+
+def _render_mover(fields: Dict, purpose: str) -> str:
+    if "base_price_range" in fields:
+        low, high = fields["base_price_range"]
+    else:
+        low, high = fields.get("min_price"), fields.get("max_price")
+    parts = [fields["name"]]
+    if fields.get("rating") is not None:
+        parts.append(f"rating {fields['rating']}")
+    if fields.get("specialties"):
+        parts.append(_list(fields["specialties"]))
+    if low is not None and high is not None:
+        parts.append(f"{_price(low)}-{_price(high)}")
+    return " | ".join(parts)
+
+
+def _render_quote(fields: Dict, purpose: str) -> str:
+    prices = [_price(price) for price in (fields["initial_price"], fields["negotiated_price"]) if price is not None]
+    if len(prices) == 2 and prices[0] == prices[1]:
+        prices = prices[1:]
+    parts = [f"{fields['mover_name']}: {' -> '.join(prices) or 'no price'}"]
+    if fields["services_included"]:
+        parts.append(_list(fields["services_included"]))
+    if fields["notes"]:
+        parts.append(fields["notes"])
+    if fields["partial"]:
+        parts.append("call cut off")
+    return "; ".join(parts)
+
+
+_RENDERERS = {"customer": _render_customer, "mover": _render_mover, "quote": _render_quote}
+
+
+@lru_cache(maxsize=1024)
+def _render(kind: str, purpose: str, version: Tuple) -> str:
+    return _RENDERERS[kind](dict(version), purpose)
+
+
+def _check_purpose(purpose: str, purposes: Tuple[str, ...]):
+    if purpose not in purposes:
+        raise ValueError(f"Unknown prompt purpose {purpose!r}, expected one of {purposes}")
+
+
+def format_customer(customer_info: CustomerInfo, purpose: str = "call") -> str:
+    """
+    The customer's move for a prompt.
+
+    :param customer_info: The customer to render.
+    :param purpose: "call" to describe the move to a mover, "planning" for the negotiation strategy
+        (no name or phone number), "filter" for choosing movers (no dates or inventory either).
+    """
+    _check_purpose(purpose, CUSTOMER_PURPOSES)
+    return _render("customer", purpose, _freeze(customer_info))
+
+
+def format_mover(mover: Union[MoverInfo, Dict], purpose: str = "filter") -> str:
+    """A mover, from the catalog or as MoverInfo, on one line without its phone number."""
+    _check_purpose(purpose, MOVER_PURPOSES)
+    return _render("mover", purpose, _freeze(mover))
+
+
+def format_movers(movers: Sequence[Union[MoverInfo, Dict]], purpose: str = "filter") -> str:
+    """Movers one per line, in the given order."""
+    return "\n".join(format_mover(mover, purpose) for mover in movers)
+
+
+def format_quote(quote: CallTranscript, purpose: str = "strategy") -> str:
+    """A quote on one line: prices, services, notes and whether the call was cut off."""
+    _check_purpose(purpose, QUOTE_PURPOSES)
+    return _render("quote", purpose, _freeze(quote))
+
+
+def format_quotes(quotes: Sequence[CallTranscript], purpose: str = "strategy") -> str:
+    """Quotes one per line, in the given order."""
+    return "\n".join(format_quote(quote, purpose) for quote in quotes)
+
+
+def conversation_turns(call_data: Dict) -> List[Tuple[str, str]]:
+    """The (role, message) turns of a call's data, in order."""
+    turns = sorted(call_data.get("transcripts") or [], key=lambda turn: turn.get("seq", 0))
+    return [(turn.get("role", ""), turn.get("message", "")) for turn in turns]
+
+
+def format_conversation(turns: Sequence[Tuple[str, str]]) -> str:
+    """A call's turns, one `Speaker: message` line each."""
+    return "\n".join(f"{SPEAKERS.get(role, role)}: {' '.join(message.split())}" for role, message in turns)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    # Only counting tokens needs tiktoken, the renderings don't
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = Config.ANALYST_MODEL) -> int:
+    """Number of tokens `text` takes in a prompt to `model`."""
+    return len(_encoding(model).encode(text))
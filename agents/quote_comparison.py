@@ -0,0 +1,131 @@
+"""
+Deterministic comparison of mover quotes.
+Quotes are scored on price, on how many of the customer's needs the quoted services cover and
+on the mover's catalog rating, so the same quotes always lead to the same recommendation.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel, Field
+
+from .config import Config
+from .state_models import CallTranscript, CustomerInfo
+
+
+# Customer needs and the words that mark a quoted service as covering them
+NEED_KEYWORDS = {
+    "packing": ("pack",),
+    "storage": ("storage", "storing", "store"),
+    "long-distance": ("long distance", "long-distance", "interstate", "out of state", "cross country"),
+}
+NO_SPECIAL_ITEMS = {"", "none", "no", "n/a", "na"}
+TIE_BREAKS = ("price", "rating", "coverage", "complete", "name")
+
+
+class QuoteScore(BaseModel):
+    """A quote scored against the customer's needs"""
+    quote: CallTranscript = Field(description="The quote that was scored")
+    price: Optional[float] = Field(default=None, description="The price compared, the negotiated price or else the initial one")
+    price_score: float = Field(default=0.0, description="Cheapest price over this price, 0 without a price")
+    covered: List[str] = Field(default_factory=list, description="Customer needs the quoted services cover")
+    missing: List[str] = Field(default_factory=list, description="Customer needs the quoted services don't mention")
+    coverage: float = Field(default=1.0, description="Share of the customer's needs covered")
+    rating: Optional[float] = Field(default=None, description="The mover's catalog rating out of 5")
+    score: float = Field(default=0.0, description="Weighted score, higher is better")
+
+
+def _normalize_name(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+def customer_needs(customer_info: Optional[CustomerInfo]) -> Dict[str, Tuple[str, ...]]:
+    """The services a customer needs, with the words that mark a quoted service as covering each."""
+    if customer_info is None:
+        return {}
+    needs = {}
+    if customer_info.packing_assistance:
+        needs["packing"] = NEED_KEYWORDS["packing"]
+    if customer_info.storage_required:
+        needs["storage"] = NEED_KEYWORDS["storage"]
+    if customer_info.is_long_distance:
+        needs["long-distance"] = NEED_KEYWORDS["long-distance"]
+    for item in (customer_info.special_items or "").replace(" and ", ",").split(","):
+        item = " ".join(item.split()).casefold()
+        if item not in NO_SPECIAL_ITEMS:
+            needs[item] = (item,)
+    return needs
+
+
+def quoted_price(quote: CallTranscript) -> Optional[float]:
+    """The price a quote is compared by, the negotiated price or else the initial one."""
+    return quote.negotiated_price if quote.negotiated_price is not None else quote.initial_price
+
+
+def compare_quotes(
+    quotes: Sequence[CallTranscript],
+    customer_info: Optional[CustomerInfo] = None,
+    ratings: Optional[Dict[str, float]] = None,
+    weights: Dict[str, float] = Config.QUOTE_SCORE_WEIGHTS,
+    tie_break: Sequence[str] = Config.QUOTE_TIE_BREAK,
+) -> List[QuoteScore]:
+    """
+    Score and rank quotes, best first. Quotes without a price are ranked after all priced ones.
+
+    :param quotes: The quotes extracted from the calls.
+    :param customer_info: The customer whose needs the quoted services are checked against.
+    :param ratings: Catalog ratings out of 5 by mover name, movers not in it get no rating points.
+    :param weights: Weight of the price, coverage and rating scores.
+    :param tie_break: Criteria deciding between equal scores, in order, from TIE_BREAKS.
+    """
+    unknown = set(tie_break) - set(TIE_BREAKS)
+    if unknown:
+        raise ValueError(f"Unknown tie-break criteria {sorted(unknown)}, expected some of {TIE_BREAKS}")
+
+    needs = customer_needs(customer_info)
+    ratings = {_normalize_name(name): rating for name, rating in (ratings or {}).items()}
+    prices = [price for price in map(quoted_price, quotes) if price is not None]
+    cheapest = min(prices) if prices else None
+
+    scores = []
+    for quote in quotes:
+        price = quoted_price(quote)
+        services = " ".join(quote.services_included).casefold()
+        covered = [need for need, keywords in needs.items() if any(keyword in services for keyword in keywords)]
+        rating = ratings.get(_normalize_name(quote.mover_name))
+        score = QuoteScore(
+            quote=quote,
+            price=price,
+            price_score=cheapest / price if price else (1.0 if price == 0 else 0.0),
+            covered=covered,
+            missing=[need for need in needs if need not in covered],
+            coverage=len(covered) / len(needs) if needs else 1.0,
+            rating=rating,
+        )
+        score.score = (
+            weights.get("price", 0) * score.price_score
+            + weights.get("coverage", 0) * score.coverage
+            + weights.get("rating", 0) * (rating or 0) / 5
+        )
+        scores.append(score)
+
+    def sort_key(score: QuoteScore):
+        keys = {
+            "price": score.price,
+            "rating": -(score.rating or 0),
+            "coverage": -score.coverage,
+            "complete": score.quote.partial,
+            "name": _normalize_name(score.quote.mover_name),
+        }
+        # Scores are rounded so float noise doesn't decide between equal quotes
+        return (score.price is None, -round(score.score, 9), *(keys[criterion] for criterion in tie_break))
+
+    return sorted(scores, key=sort_key)
+
+
+def leads_on_every_criterion(ranking: List[QuoteScore]) -> bool:
+    """Whether the best quote is at least as good as every other one on price, coverage and rating."""
+    best, others = ranking[0], ranking[1:]
+    return all(
+        best.price_score >= other.price_score and best.coverage >= other.coverage and (best.rating or 0) >= (other.rating or 0)
+        for other in others
+    )
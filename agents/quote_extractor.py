@@ -0,0 +1,117 @@
+"""
+Structured quote extraction from mover call transcripts.
+Each call's conversation is turned into a validated CallTranscript with numeric prices once,
+and kept in SQLite by a hash of the conversation, so a transcript is never extracted twice.
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+
+from integrations.rate_limiter import Priority, chat_model_limits
+from .config import Config
+from .prompt_format import conversation_turns, format_conversation
+from .state_models import CallTranscript
+
+
+DEFAULT_DB_PATH = os.getenv("QUOTE_CACHE_DB", "./agents/quote_cache.db")
+
+quote_extractor_system_prompt = """You are an expert at analyzing moving service call transcripts for a user.
+Extract the quote the moving company gave on the call:
+- initial_price: the first total price quoted, before any negotiation
+- negotiated_price: the lowest total price quoted by the end of the call
+- services_included: the services that price covers
+- notes: timeline/scheduling, special requirements or conditions, extra fees and notable negotiation points
+
+Prices are totals in USD written as plain numbers (1250.5, not "$1,250.50"). If the mover gave a range, use its
+upper bound and mention the range in the notes. If no price was given, leave it null, never guess one.
+Only use what the mover said on the call."""
+
+
+class QuoteExtractor:
+    """
+    Extracts the quote from a call transcript with an LLM, cached by transcript hash.
+
+    The hash covers the mover, the conversation and the model, so call data that only
+    differs in status or latency fields maps to the same quote.
+    """
+
+    def __init__(self, model: str = Config.ANALYST_MODEL, db_path: str = DEFAULT_DB_PATH):
+        """
+        Initialize the extractor.
+
+        Args:
+            model: Chat model to extract quotes with
+            db_path: SQLite file to cache quotes in (":memory:" for a throwaway cache)
+        """
+        self.model = model
+        self.llm = ChatOpenAI(model=model, **chat_model_limits(model, Priority.BACKGROUND))
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", quote_extractor_system_prompt),
+            ("human", "Mover: {mover_name}\nCall transcript:\n{conversation}"),
+        ])
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS quotes (
+                transcript_hash TEXT PRIMARY KEY,
+                quote TEXT NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def transcript_hash(self, mover_name: str, turns: List[Tuple[str, str]]) -> str:
+        """Cache key of a mover's conversation."""
+        key = json.dumps({"model": self.model, "mover": mover_name, "conversation": turns}, ensure_ascii=False)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def extract(self, mover_name: str, transcript: Dict, partial: bool = False) -> CallTranscript:
+        """
+        The quote from a call, from the cache if this conversation was extracted before.
+
+        Args:
+            mover_name: Name of the mover that was called
+            transcript: Call data stored by the voice server
+            partial: Whether the call was cut off, recorded on the returned quote
+
+        Returns:
+            CallTranscript: The validated quote
+        """
+        turns = conversation_turns(transcript)
+        if not turns:
+            # Nothing was said, no need to ask the model
+            return CallTranscript(mover_name=mover_name, notes="Nothing was said on the call.", partial=partial)
+
+        transcript_hash = self.transcript_hash(mover_name, turns)
+        with self._lock:
+            row = self._db.execute("SELECT quote FROM quotes WHERE transcript_hash = ?", (transcript_hash,)).fetchone()
+        if row is not None:
+            quote = CallTranscript.model_validate_json(row[0])
+        else:
+            quote = self._extract(mover_name, turns)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO quotes (transcript_hash, quote) VALUES (?, ?)",
+                    (transcript_hash, quote.model_dump_json()),
+                )
+                self._db.commit()
+
+        return quote.model_copy(update={"mover_name": mover_name, "partial": partial})
+
+    def _extract(self, mover_name: str, turns: List[Tuple[str, str]]) -> CallTranscript:
+        chain = self.prompt | self.llm.with_structured_output(CallTranscript)
+        quote = chain.invoke({"mover_name": mover_name, "conversation": format_conversation(turns)})
+        return quote.model_copy(update={"mover_name": mover_name, "partial": False})
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -39,10 +39,25 @@ class NegotiationStrategy(BaseModel):
     negotiation_script: str = Field(description="The script of the negotiation")
 
 class CallTranscript(BaseModel):
+    """The quote a mover gave on a call, extracted from its transcript"""
     mover_name: str = Field(description="The name of the mover")
-    negotiated_price: float = Field(description="The lowestquoted price of the mover")
-    services_included: List[str] = Field(description="The services included in the move")
-    notes: str = Field(description="Any additional notes from the call")
+    initial_price: Optional[float] = Field(default=None, ge=0, description="The first total price the mover quoted in USD, as a plain number, null if none was given")
+    negotiated_price: Optional[float] = Field(default=None, ge=0, description="The lowest total price the mover quoted in USD, as a plain number, null if none was given")
+    services_included: List[str] = Field(default_factory=list, description="The services included in the move")
+    notes: str = Field(default="", description="Any additional notes from the call, e.g. availability, conditions and fees not in the price")
+    partial: bool = Field(default=False, description="Whether the call was cut off at its time limit, left false when extracting")
+
+    def summary(self) -> str:
+        """Short markdown summary of the quote, for display."""
+        prices = [f"**${price:,.2f}**" if price is not None else "not quoted" for price in (self.initial_price, self.negotiated_price)]
+        lines = [f"**{self.mover_name}**", f"- Initial price: {prices[0]}", f"- Negotiated price: {prices[1]}"]
+        if self.services_included:
+            lines.append(f"- Services: {', '.join(self.services_included)}")
+        if self.notes:
+            lines.append(f"- Notes: {self.notes}")
+        if self.partial:
+            lines.append("- The call was cut off, the quote may be incomplete")
+        return "\n".join(lines)
 
 class State(TypedDict):
     """State of the moving assistant"""
@@ -8,11 +8,13 @@ from langchain_openai import ChatOpenAI
 
 from .config import Config
 from .state_models import CustomerInfo, MoverInfo, FilteredMovers, MarketResearch
+from .prompt_format import format_customer, format_movers
 from . import firebase
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from integrations.perplexity_client import PerplexityClient
+from integrations.rate_limiter import Priority, chat_model_limits
 
 # system prompt for creating a new negotiation strategy
 planner_system_prompt = """You are a strategic negotiator. Based on the customer requirements and available movers,
@@ -22,7 +24,7 @@ you need to create a detailed negotiation instruction for a phone call that maxi
 
 class StrategistAgent:
     def __init__(self, user_id: str, model: str = Config.PLANNER_MODEL, database_path: str = "./agents/movers_database.csv"):
-        self.llm = ChatOpenAI(model=model)
+        self.llm = ChatOpenAI(model=model, **chat_model_limits(model, Priority.BACKGROUND))
         self.user_id = user_id
         self.movers_db = pd.read_csv(database_path)
         # Initialize Perplexity client for market research
@@ -62,7 +64,7 @@ class StrategistAgent:
         selected_movers = self._get_movers_data(customer_info)
 
         # STEP 3: Generate negotiation strategy (enhanced with market research)
-        strategy_context = f"Customer Info: {customer_info}"
+        strategy_context = f"Customer Info:\n{format_customer(customer_info, 'planning')}"
         if market_research:
             strategy_context += f"\n\nMarket Research Insights:\n{market_research.content}"
 
@@ -98,10 +100,10 @@ class StrategistAgent:
                 Return the names of the filtered movers as a list.
                 Also provide a rationale for the filtering.
             """),
-            ("human", "Filter the list of movers: {movers} based on the customer information {customer_info}."),
+            ("human", "Filter the list of movers (name | rating | specialties | price range):\n{movers}\n\nbased on the customer information:\n{customer_info}"),
         ])
         chain = filter_prompt | self.llm.with_structured_output(FilteredMovers)
-        response: FilteredMovers = chain.invoke({ "customer_info": customer_info, "movers": movers })
+        response: FilteredMovers = chain.invoke({ "customer_info": format_customer(customer_info, "filter"), "movers": format_movers(movers) })
         print("Filtered Movers: ", response)
 
 
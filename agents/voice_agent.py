@@ -12,16 +12,22 @@ from twilio.twiml.voice_response import VoiceResponse, Gather, Connect, Say, Str
 from twilio.rest import Client
 from dotenv import load_dotenv
 
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from voice_server import check_call_status, get_call_data, initiate_call_with_prompt
+from voice_server import initiate_call_with_prompt, update_call_prompt
+from integrations.answer_rates import AnswerRates
+from integrations.rate_limiter import Priority, chat_model_limits
+from .call_orchestrator import CallOrchestrator, CallResult
 from .config import Config
-from .state_models import State
+from .prompt_format import format_customer, format_quotes
+from .quote_extractor import QuoteExtractor
+from .state_models import CallTranscript, CustomerInfo, State
 from . import firebase
 import time
 import asyncio
+import threading
 
 
 voice_system_prompt = """You are an AI voice agent making calls to moving companies. You will act as the customer, by taking on the customer's name.
@@ -86,13 +92,20 @@ INITIAL_PROMPT = (
 )
 
 class VoiceAgent:
-    def __init__(self, user_id, model: str = Config.VOICE_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id, model: str = Config.VOICE_MODEL, on_quote: Optional[Callable[[CallTranscript, CustomerInfo], None]] = None):
+        self.llm = ChatOpenAI(model=model, **chat_model_limits(model, Priority.BACKGROUND))
         self.user_id = user_id
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", voice_system_prompt),
             ("human", "Customer Info: {customer_info}\nNegotiation Strategy: {strategy}\nMover: {mover}")
         ])
+        self.orchestrator = None
+        # Which movers tend to pick up, kept across sessions to order and retry calls
+        self.answer_rates = AnswerRates()
+        # Quotes are extracted once per transcript, kept across sessions by transcript hash
+        self.quote_extractor = QuoteExtractor()
+        # Gets each quote as its call completes, e.g. for the analyst's live leaderboard
+        self.on_quote = on_quote
         print("Exiting VoiceAgent.__init__")
 
     def __call__(self, state: Dict) -> Dict:
@@ -104,8 +117,10 @@ class VoiceAgent:
         print(f"Movers: {movers}")
 
         transcripts = []
+        quotes = []
         summary_of_calls = []
         strategies = [strategy.content]
+        lock = threading.Lock()
 
         # firebase.update_status(self.user_id, firebase.AppStatus.NEGOTIATING)
 
@@ -113,58 +128,69 @@ class VoiceAgent:
             "status": firebase.AppStatus.NEGOTIATING,
             "strategies": strategies,
             "transcripts": transcripts,
+            "quotes": quotes,
             "callSummaries": summary_of_calls,
         })
 
-        for mover in movers:
-            # Simulate phone call with each mover, do the phone call here
-            # Modify the strategy based on the summary of the calls
-            if len(summary_of_calls) > 0:
-                strategy = self._modify_strategy(summary_of_calls, strategy)
+        # Static instructions, then the customer, then the strategy: only the tail changes between calls
+        customer = format_customer(customer_info, "call")
 
-                strategies.append(strategy)
-                firebase.update_data(self.user_id, {
-                    "strategies": strategies,
-                })
-            
-            call_sid = initiate_call_with_prompt(
-                os.getenv('SAMPLE_MOVER_PHONE_NUMBER'), 
-                INITIAL_PROMPT +  " " + str(customer_info) + " " + str(strategy), 
+        def call_prompt(strategy: str) -> str:
+            return f"{INITIAL_PROMPT}\n\n{customer}\n\n{strategy}"
+
+        def dial(mover: Dict, strategy: str) -> str:
+            return initiate_call_with_prompt(
+                os.getenv('SAMPLE_MOVER_PHONE_NUMBER'),
+                call_prompt(strategy),
                 conversation_text,
-                self.user_id
+                self.user_id,
+                customer_info.name,
             )
 
-            # poll the call status
-
-            while True:
-                status = check_call_status(call_sid)
-                if status == "completed" or status == "busy" or status == "no-answer" or status == "failed" or status == "canceled":
-                    print(f"Call {call_sid} status: {status}")
-                    break
-                time.sleep(5)
-
-            
-            call_transcript = get_call_data(call_sid)
-
-            if call_transcript is not None:
-                summary_of_call = self.summarize_call_transcript(call_transcript)
-            else:
-                summary_of_call = "Call transcript not found"
-
-            
-            print(f"Call transcript: {call_transcript}")
-            print(f"Summary of call: {summary_of_call}")
-
-            transcripts.append(call_transcript)
-            summary_of_calls.append(summary_of_call)
+        def update_strategy(result: CallResult, strategy: str):
+            # Strategies adapted while a call rings or runs reach it through its realtime session
+            if update_call_prompt(result.call_sid, call_prompt(strategy)):
+                print(f"Updated strategy of live call {result.call_sid}")
 
+        def on_strategy(strategy: str):
+            strategies.append(strategy)
             firebase.update_data(self.user_id, {
-                "transcripts": transcripts,
-                "callSummaries": summary_of_calls,
+                "strategies": strategies,
             })
 
+        def extract_quote(result: CallResult) -> CallTranscript:
+            return self.quote_extractor.extract(result.mover.get("name", ""), result.transcript, partial=result.timed_out)
+
+        def on_call_completed(result: CallResult):
+            if result.transcript is None:
+                return
+            # Calls complete on worker threads, keep the firestore lists consistent
+            with lock:
+                transcripts.append(result.transcript)
+                if result.quote is not None:
+                    quotes.append(result.quote.model_dump())
+                    summary_of_calls.append(result.quote.summary())
+                    firebase.update_call_data(self.user_id, result.call_sid, {"quote": result.quote.model_dump()})
+                firebase.update_data(self.user_id, {
+                    "transcripts": transcripts,
+                    "quotes": quotes,
+                    "callSummaries": summary_of_calls,
+                })
+            if self.on_quote is not None and result.quote is not None:
+                try:
+                    self.on_quote(result.quote, customer_info)
+                except Exception as e:
+                    print(f"Error handing over the quote from call {result.call_sid}: {e}")
+
+        self.orchestrator = CallOrchestrator(
+            dial, extract_quote, self._modify_strategy,
+            answer_rates=self.answer_rates, update_strategy=update_strategy,
+        )
+        results = self.orchestrator.run(movers, strategy.content, on_strategy=on_strategy, on_call_completed=on_call_completed)
+
+        # Calls cut short at a deadline are kept, their quotes are marked partial
         return {
-            "call_transcripts": transcripts
+            "call_transcripts": [result.quote for result in results if result.quote is not None]
         }
 
     def _simulate_call(self, customer_info, strategy, mover) -> Dict:
@@ -184,7 +210,7 @@ class VoiceAgent:
         response_of_call = chain.invoke({"customer_info": customer_info, "strategy": strategy, "mover": mover})
 
         # Summarize the call
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
+        llm = ChatOpenAI(model=Config.ANALYST_MODEL, **chat_model_limits(Config.ANALYST_MODEL, Priority.BACKGROUND))
         prompt = ChatPromptTemplate.from_messages([
             ("system", strategy_summarizer_prompt),
             ("human", "Summarize the call based on the following call transcript: {transcript}. Make sure to include the actual price from the call."),
@@ -194,104 +220,17 @@ class VoiceAgent:
 
         return response_of_call.content, response_summary.content
 
-    def summarize_call_transcript(self, transcript: str) -> str:
-        """
-        Summarizes a call transcript and extracts key metrics like prices.
-        
-        Args:
-            transcript (str): The call transcript to analyze
-            
-        Returns:
-            str: A summary of the call with highlighted metrics
-        """
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
-        summary_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an expert at analyzing moving service call transcripts for an user.
-                         Extract and highlight key information provided by the vendor including or similar to:
-                         - Quoted prices (initial and final if negotiated)
-                         - Service details offered
-                         - Timeline/scheduling information
-                         - Special requirements or conditions
-                         - Notable negotiation points
-                         
-                         Format the metrics in a clear, structured way using bullet points.
-                         Put prices and key numbers in **bold**."""),
-            ("human", "Please analyze and summarize this call transcript, highlighting the key metrics and information: {transcript}")
-        ])
-        
-        chain = summary_prompt | llm
-        summary_response = chain.invoke({"transcript": transcript})
-        
-        return summary_response.content
-
-    def _make_call(self, customer_info, strategy, mover) -> Dict:
-        print("Entering VoiceAgent._make_call")
-        
-        # Summarize the call
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", strategy_summarizer_prompt),
-            ("human", "Summarize the call based on the following call transcript: {transcript}. Make sure to include the actual price from the call."),
-        ])
-        chain = prompt | llm
-        response_summary = chain.invoke({"transcript": response_of_call.content})
-
-        # Get call transcript from Twilio call
-        response_of_call = initiate_call_with_prompt(os.getenv('SAMPLE_MOVER_PHONE_NUMBER'), strategy, "")
-        
-        # Use the new summarize method
-        summary = self.summarize_call_transcript(response_of_call.content)
-        
-        print("Exiting VoiceAgent._make_call")
-        return response_of_call.content, summary
-
-    def _modify_strategy(self, summary_of_calls: List[str], strategy: str) -> str:
+    def _modify_strategy(self, quotes: List[CallTranscript], strategy: str) -> str:
         # Implementation to modify the strategy based on the call transcript
 
         # Construct the prompt for the LLM to modify the strategy
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
+        llm = ChatOpenAI(model=Config.ANALYST_MODEL, **chat_model_limits(Config.ANALYST_MODEL, Priority.BACKGROUND))
         prompt = ChatPromptTemplate.from_messages([
             ("system", strategy_replanner_system_prompt),
             ("human", "Modify the strategy for calling a different seller based on the following call transcripts: {summary_of_calls}. If the summary is not there, just ignore it. Make sure to provide quantifiable information (e.g., previous negotiation price) to negotiate the price with the new mover, and ask the model to negotiate based on that and mention it explicitly. Don't output anything else."),
         ])
         chain = prompt | llm
-        response = chain.invoke({ "summary_of_calls": summary_of_calls, "strategy": strategy })
+        response = chain.invoke({ "summary_of_calls": format_quotes(quotes), "strategy": strategy })
 
         print("Exiting VoiceAgent._modify_strategy")
         return response.content
-
-    def summarize_call_transcript(self, transcript: str) -> str:
-        """
-        Summarizes a call transcript and extracts key metrics like prices.
-        
-        Args:
-            transcript (str): The call transcript to analyze
-            
-        Returns:
-            str: A summary of the call with highlighted metrics
-        """
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
-        summary_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an summarizer who analyzing moving service call transcripts.
-                         Extract and highlight key information like or similar to:
-                         - Quoted prices (initial and final if negotiated)
-                         - Service details offered
-                         - Timeline/scheduling information
-                         - Special requirements or conditions
-                         - Notable negotiation points
-                         
-                         Format the metrics in a clear, structured way using bullet points.
-                         Put prices and key numbers in **bold**."""),
-            ("human", "Please analyze and summarize this call transcript, highlighting the key metrics and information: {transcript}")
-        ])
-        
-        chain = summary_prompt | llm
-        summary_response = chain.invoke({"transcript": transcript})
-        
-        return summary_response.content
-
-
-
-
-
-
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Request, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 # Try to import voice_server, but make it optional
 try:
@@ -32,6 +33,7 @@ import uuid
 
 from agents.agent_graph import AgentGraph
 from agents import firebase
+from integrations.metrics import REGISTRY
 
 sessions = {}
 config = { "configurable": { "thread_id": str(uuid.uuid4()) } }
@@ -40,6 +42,11 @@ config = { "configurable": { "thread_id": str(uuid.uuid4()) } }
 async def root():
     return {"message": "Fast API Server" }
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint: rate limiter queue depth, throttling and wait times."""
+    return REGISTRY.render_prometheus()
+
 @app.get("/api/chat")
 async def chat():
     return { "message": "Chat Api" }
@@ -3,5 +3,7 @@ Integrations module for external APIs and services.
 """
 
 from .perplexity_client import PerplexityClient
+from .mover_directory import MoverDirectory
+from .answer_rates import AnswerRates
 
-__all__ = ['PerplexityClient']
+__all__ = ['PerplexityClient', 'MoverDirectory', 'AnswerRates']
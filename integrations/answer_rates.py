@@ -0,0 +1,126 @@
+"""
+Per-mover answer-rate statistics for outbound calls.
+Every call attempt's outcome is counted in SQLite, by mover and hour of day, so later
+sessions dial the movers most likely to pick up first and leave the rest for later waves.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+DEFAULT_DB_PATH = os.getenv("ANSWER_RATES_DB", "./integrations/answer_rates.db")
+
+# Outcomes that are counted. "canceled" is left out, it is us hanging up, not the mover
+OUTCOMES = ("completed", "busy", "no-answer", "failed")
+MIN_HOURLY_ATTEMPTS = 5  # Below this the hour's own rate is too noisy, the mover's overall rate is used
+
+
+class AnswerStats(BaseModel):
+    """Call attempt outcomes for one mover"""
+    attempts: int = Field(default=0, description="Attempts with a counted outcome")
+    answered: int = Field(default=0, description="Attempts the mover picked up")
+    busy: int = Field(default=0, description="Attempts that got a busy signal")
+    no_answer: int = Field(default=0, description="Attempts nobody picked up")
+    failed: int = Field(default=0, description="Attempts Twilio could not place")
+
+
+def _normalize_name(mover_name: str) -> str:
+    return " ".join(mover_name.split()).casefold()
+
+
+class AnswerRates:
+    """
+    Persistent answer-rate statistics per mover.
+
+    Rates are smoothed towards `prior` with the weight of `prior_weight` attempts, so a mover
+    that missed its only call is not ranked below one that was never called.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, prior: float = 0.5, prior_weight: float = 2.0):
+        """
+        Initialize the statistics.
+
+        Args:
+            db_path: SQLite file to persist counts in (":memory:" for throwaway statistics)
+            prior: Answer rate assumed for a mover with no attempts
+            prior_weight: Number of attempts the prior counts as
+        """
+        self.prior = prior
+        self.prior_weight = prior_weight
+        self._lock = threading.Lock()
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answer_stats (
+                name_key TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                answered INTEGER NOT NULL DEFAULT 0,
+                busy INTEGER NOT NULL DEFAULT 0,
+                no_answer INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (name_key, hour)
+            )
+        """)
+        self._db.commit()
+
+    def record(self, mover_name: str, status: str, at: Optional[float] = None):
+        """
+        Count the outcome of one call attempt.
+
+        Args:
+            mover_name: Name of the mover that was called
+            status: Terminal Twilio call status of the attempt, other statuses are ignored
+            at: Unix time of the attempt, defaults to now
+        """
+        if status not in OUTCOMES:
+            return
+        column = {"completed": "answered", "no-answer": "no_answer"}.get(status, status)
+        hour = time.localtime(at).tm_hour
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO answer_stats (name_key, hour, attempts, {column}) VALUES (?, ?, 1, 1) "
+                f"ON CONFLICT (name_key, hour) DO UPDATE SET attempts = attempts + 1, {column} = {column} + 1",
+                (_normalize_name(mover_name), hour),
+            )
+            self._db.commit()
+
+    def stats(self, mover_name: str, hour: Optional[int] = None) -> AnswerStats:
+        """Counts for a mover, over all hours or for one hour of the day."""
+        query = "SELECT SUM(attempts), SUM(answered), SUM(busy), SUM(no_answer), SUM(failed) FROM answer_stats WHERE name_key = ?"
+        params = [_normalize_name(mover_name)]
+        if hour is not None:
+            query += " AND hour = ?"
+            params.append(hour)
+        with self._lock:
+            row = self._db.execute(query, params).fetchone()
+        attempts, answered, busy, no_answer, failed = (value or 0 for value in row)
+        return AnswerStats(attempts=attempts, answered=answered, busy=busy, no_answer=no_answer, failed=failed)
+
+    def answer_rate(self, mover_name: str, at: Optional[float] = None) -> float:
+        """
+        Smoothed chance that the mover picks up a call placed at `at` (default now).
+
+        Uses the rate for that hour of the day once it has enough attempts, the overall rate before.
+        """
+        stats = self.stats(mover_name, hour=time.localtime(at).tm_hour)
+        if stats.attempts < MIN_HOURLY_ATTEMPTS:
+            stats = self.stats(mover_name)
+        return (stats.answered + self.prior * self.prior_weight) / (stats.attempts + self.prior_weight)
+
+    def rank(self, movers: List[Dict], at: Optional[float] = None) -> List[Dict]:
+        """Movers ordered by answer rate, most likely to pick up first. Ties keep their order."""
+        rates = [self.answer_rate(mover.get("name", ""), at) for mover in movers]
+        order = sorted(range(len(movers)), key=lambda index: -rates[index])
+        return [movers[index] for index in order]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
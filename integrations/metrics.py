@@ -0,0 +1,156 @@
+"""
+Lightweight in-process metrics registry.
+Counters, gauges and histograms with labels, exported in Prometheus text format.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        with self._lock:
+            return [(f"{self.name}{_format_labels(key)}", value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down per label set."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Distribution of observed values per label set, with cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def count(self, **labels) -> int:
+        counts = self._values.get(_label_key(labels))
+        return int(sum(counts[:-1])) if counts else 0
+
+    def sum(self, **labels) -> float:
+        counts = self._values.get(_label_key(labels))
+        return counts[-1] if counts else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Upper bucket bound below which a fraction `q` of observations fall."""
+        counts = self._values.get(_label_key(labels))
+        if not counts:
+            return None
+        target = q * sum(counts[:-1])
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts[:-1]):
+            running += bucket_count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def samples(self) -> List[Tuple[str, float]]:
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                running = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts[:-1]):
+                    running += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append((f"{self.name}_bucket{_format_labels(key, ('le', le))}", running))
+                samples.append((f"{self.name}_count{_format_labels(key)}", running))
+                samples.append((f"{self.name}_sum{_format_labels(key)}", counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Get-or-create registry so modules can declare the metrics they use at import time."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._get_or_create(Gauge, name, description)
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets)
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {value:g}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry
+REGISTRY = MetricsRegistry()
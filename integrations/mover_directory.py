@@ -0,0 +1,250 @@
+"""
+Local mover contact and reputation directory.
+Persists Perplexity research results in SQLite so repeat lookups are served locally
+instead of re-running a web LLM query every time.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, List, Tuple
+
+from pydantic import BaseModel, Field
+
+from .perplexity_client import PerplexityClient, extract_phone_numbers, get_client
+
+
+DEFAULT_DB_PATH = os.getenv("MOVER_DIRECTORY_DB", "./integrations/mover_directory.db")
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60  # Contact details rarely change, refresh monthly
+
+
+class MoverContact(BaseModel):
+    """Directory entry for one mover at one location"""
+    name: str = Field(description="The name of the mover")
+    location: str = Field(default="", description="The location the entry was researched for, empty for the main office")
+    phone_number: Optional[str] = Field(default=None, description="Best contact number in E.164 format")
+    phone_candidates: List[str] = Field(default_factory=list, description="All contact numbers found, E.164, best first")
+    reputation: Optional[str] = Field(default=None, description="Reputation summary from research")
+    phone_fetched_at: Optional[float] = Field(default=None, description="Unix time the contact numbers were researched")
+    reputation_fetched_at: Optional[float] = Field(default=None, description="Unix time the reputation was researched")
+
+
+def _normalize_key(mover_name: str, location: Optional[str]) -> Tuple[str, str]:
+    """Case and whitespace insensitive directory key."""
+    return (" ".join(mover_name.split()).casefold(), " ".join((location or "").split()).casefold())
+
+
+class MoverDirectory:
+    """
+    Persistent cache of mover phone numbers and reputation summaries.
+
+    Lookups are answered from an in-memory index backed by SQLite. Missing entries are
+    researched with Perplexity on demand; stale entries are returned immediately and
+    refreshed in the background.
+    """
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        client: Optional[PerplexityClient] = None,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        refresh_workers: int = 4,
+    ):
+        """
+        Initialize the directory.
+
+        Args:
+            db_path: SQLite file to persist entries in (":memory:" for a throwaway directory)
+            client: Perplexity client used for research. Defaults to the shared client, created on first miss.
+            max_age_seconds: Age after which an entry is considered stale and refreshed in the background
+            refresh_workers: Number of concurrent research queries for background refresh and batch lookups
+        """
+        self.max_age_seconds = max_age_seconds
+        self._client = client
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="mover-directory")
+        self._pending: Dict[Tuple[str, str, str], Future] = {}
+
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS movers (
+                name_key TEXT NOT NULL,
+                location_key TEXT NOT NULL,
+                entry TEXT NOT NULL,
+                PRIMARY KEY (name_key, location_key)
+            )
+        """)
+        self._db.commit()
+
+        self._entries: Dict[Tuple[str, str], MoverContact] = {}
+        for name_key, location_key, entry in self._db.execute("SELECT name_key, location_key, entry FROM movers"):
+            self._entries[(name_key, location_key)] = MoverContact.model_validate_json(entry)
+
+    @property
+    def client(self) -> PerplexityClient:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def get(self, mover_name: str, location: Optional[str] = None) -> Optional[MoverContact]:
+        """Return the cached entry without any research, or None."""
+        return self._entries.get(_normalize_key(mover_name, location))
+
+    def lookup(self, mover_name: str, location: Optional[str] = None, fields: Tuple[str, ...] = ("phone", "reputation")) -> MoverContact:
+        """
+        Look up a mover, researching only what is missing.
+
+        Args:
+            mover_name: Name of the moving company
+            location: Optional location (city, state) for local offices
+            fields: Which parts of the entry are needed, any of "phone" and "reputation"
+
+        Returns:
+            The directory entry
+        """
+        for field in fields:
+            future = self._ensure(mover_name, location, field)
+            if future is not None:
+                future.result()
+        return self.get(mover_name, location)
+
+    def lookup_many(self, movers: List[Tuple[str, Optional[str]]], fields: Tuple[str, ...] = ("phone", "reputation")) -> List[MoverContact]:
+        """
+        Batch lookup. Cache misses are researched concurrently.
+
+        Args:
+            movers: (mover_name, location) pairs
+            fields: Which parts of the entries are needed, any of "phone" and "reputation"
+
+        Returns:
+            Directory entries in the same order as `movers`
+        """
+        futures = [self._ensure(name, location, field) for name, location in movers for field in fields]
+        for future in futures:
+            if future is not None:
+                future.result()
+        return [self.get(name, location) for name, location in movers]
+
+    def get_phone_number(self, mover_name: str, location: Optional[str] = None) -> Optional[str]:
+        """Best known E.164 phone number for a mover."""
+        return self.lookup(mover_name, location, fields=("phone",)).phone_number
+
+    def get_reputation(self, mover_name: str, location: Optional[str] = None) -> Optional[str]:
+        """Reputation summary for a mover."""
+        return self.lookup(mover_name, location, fields=("reputation",)).reputation
+
+    def refresh(self, mover_name: str, location: Optional[str] = None, fields: Tuple[str, ...] = ("phone", "reputation")) -> List[Future]:
+        """Re-research an entry in the background, regardless of its age."""
+        return [self._schedule(mover_name, location, field) for field in fields]
+
+    def refresh_stale(self) -> List[Future]:
+        """Schedule a background refresh of every entry older than `max_age_seconds`."""
+        futures = []
+        for entry in list(self._entries.values()):
+            for field in ("phone", "reputation"):
+                if getattr(entry, f"{field}_fetched_at") is not None and self._is_stale(entry, field):
+                    futures.append(self._schedule(entry.name, entry.location, field))
+        return futures
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+    def _is_stale(self, entry: MoverContact, field: str) -> bool:
+        fetched_at = getattr(entry, f"{field}_fetched_at")
+        return fetched_at is None or time.time() - fetched_at > self.max_age_seconds
+
+    def _ensure(self, mover_name: str, location: Optional[str], field: str) -> Optional[Future]:
+        """Return a future to wait on if `field` has never been researched, scheduling background refresh if stale."""
+        entry = self.get(mover_name, location)
+        if entry is not None and getattr(entry, f"{field}_fetched_at") is not None:
+            if self._is_stale(entry, field):
+                self._schedule(mover_name, location, field)
+            return None
+        return self._schedule(mover_name, location, field)
+
+    def _schedule(self, mover_name: str, location: Optional[str], field: str) -> Future:
+        """Submit a research job, deduplicating concurrent requests for the same entry."""
+        key = (*_normalize_key(mover_name, location), field)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._research, mover_name, location, field)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._pending.pop(key, None))
+            return future
+
+    def _research(self, mover_name: str, location: Optional[str], field: str):
+        if field == "phone":
+            result = self.client.get_mover_phone_number(mover_name, location)
+            update = {
+                "phone_number": result["phone_number"],
+                "phone_candidates": result["all_numbers"],
+                "phone_fetched_at": time.time(),
+            }
+        else:
+            query_name = f"{mover_name} ({location})" if location else mover_name
+            update = {
+                "reputation": self.client.get_mover_reputation(query_name),
+                "reputation_fetched_at": time.time(),
+            }
+        self._store(mover_name, location, update)
+
+    def _store(self, mover_name: str, location: Optional[str], update: Dict):
+        key = _normalize_key(mover_name, location)
+        with self._lock:
+            entry = self._entries.get(key) or MoverContact(name=mover_name, location=location or "")
+            entry = entry.model_copy(update=update)
+            self._db.execute(
+                "INSERT OR REPLACE INTO movers (name_key, location_key, entry) VALUES (?, ?, ?)",
+                (*key, entry.model_dump_json()),
+            )
+            self._db.commit()
+            self._entries[key] = entry
+
+    def add_research_result(self, mover_name: str, location: Optional[str], phone_response: Optional[str] = None, reputation: Optional[str] = None):
+        """
+        Record research obtained elsewhere (e.g. a market research answer that mentions a mover).
+
+        Args:
+            mover_name: Name of the moving company
+            location: Optional location the research applies to
+            phone_response: Free text to extract contact numbers from
+            reputation: Reputation summary
+        """
+        update = {}
+        if phone_response is not None:
+            numbers = extract_phone_numbers(phone_response)
+            update.update(phone_number=numbers[0] if numbers else None, phone_candidates=numbers, phone_fetched_at=time.time())
+        if reputation is not None:
+            update.update(reputation=reputation, reputation_fetched_at=time.time())
+        if update:
+            self._store(mover_name, location, update)
+
+
+# Singleton instance for easy import
+_default_directory = None
+_default_directory_lock = threading.Lock()
+
+def get_directory() -> MoverDirectory:
+    """Get or create the default mover directory instance."""
+    global _default_directory
+    with _default_directory_lock:
+        if _default_directory is None:
+            _default_directory = MoverDirectory()
+    return _default_directory
+
+
+# Convenience functions for direct use
+def lookup_mover_phone(mover_name: str, location: str = None) -> Optional[str]:
+    """Quick function to get a mover's E.164 phone number from the directory."""
+    return get_directory().get_phone_number(mover_name, location)
+
+
+def lookup_mover_reputation(mover_name: str, location: str = None) -> Optional[str]:
+    """Quick function to get a mover's reputation summary from the directory."""
+    return get_directory().get_reputation(mover_name, location)
@@ -4,9 +4,60 @@ Uses Perplexity's online LLMs for up-to-date moving industry insights.
 """
 
 import os
-from typing import Optional, Dict
+import re
+from typing import Optional, Dict, List
 from openai import OpenAI
 
+from .rate_limiter import Priority, get_scheduler
+
+
+# Matches 1-800-XXX-XXXX, XXX-XXX-XXXX, XXX.XXX.XXXX and (XXX) XXX-XXXX style numbers,
+# with an optional +1 / 1 country prefix.
+PHONE_NUMBER_PATTERN = re.compile(
+    r'(?<!\d)(?:\+?1[-.\s]?)?(?:\(\d{3}\)\s?|\d{3}[-.\s]?)\d{3}[-.\s]?\d{4}(?!\d)'
+)
+
+
+def normalize_phone_number(raw: str, default_country_code: str = "1") -> Optional[str]:
+    """
+    Normalize a North American phone number to E.164 format.
+
+    Args:
+        raw: Phone number in any common format, e.g. "(555) 123-4567" or "1-800-555-0100"
+        default_country_code: Country code to prepend to 10 digit numbers
+
+    Returns:
+        The number as "+1XXXXXXXXXX", or None if it is not a valid 10/11 digit number
+    """
+    digits = re.sub(r'\D', '', raw or '')
+    if len(digits) == 10:
+        return f"+{default_country_code}{digits}"
+    if len(digits) == 11 and digits.startswith(default_country_code):
+        return f"+{digits}"
+    return None
+
+
+def extract_phone_numbers(text: str) -> List[str]:
+    """
+    Extract phone numbers from free text, normalized to E.164 and ranked.
+
+    Numbers are ranked by how often they are mentioned, then by first appearance,
+    so the main contact number an answer keeps repeating comes first.
+
+    Args:
+        text: Text to search (usually an LLM research response)
+
+    Returns:
+        Unique E.164 numbers, best candidate first
+    """
+    counts: Dict[str, int] = {}
+    for match in PHONE_NUMBER_PATTERN.finditer(text or ''):
+        number = normalize_phone_number(match.group(0))
+        if number:
+            counts[number] = counts.get(number, 0) + 1
+    # dicts keep insertion order, and sorted() is stable, so ties keep first appearance
+    return sorted(counts, key=lambda number: -counts[number])
+
 
 class PerplexityClient:
     """
@@ -47,19 +98,20 @@ class PerplexityClient:
             Dict with 'content' (research findings) and 'citations' (if available)
         """
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant specializing in moving industry research. Provide accurate, up-to-date information with relevant data and insights."
-                    },
-                    {
-                        "role": "user",
-                        "content": query
-                    }
-                ]
-            )
+            with get_scheduler().slot("perplexity", model, priority=Priority.BACKGROUND):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "You are a helpful assistant specializing in moving industry research. Provide accurate, up-to-date information with relevant data and insights."
+                        },
+                        {
+                            "role": "user",
+                            "content": query
+                        }
+                    ]
+                )
 
             content = response.choices[0].message.content
 
@@ -133,7 +185,7 @@ class PerplexityClient:
             location: Optional location (city, state) for local offices
 
         Returns:
-            Dict with 'phone_number' and 'raw_response'
+            Dict with 'phone_number' (E.164), ranked 'all_numbers' and 'raw_response'
         """
         if location:
             query = f"""
@@ -147,26 +199,11 @@ class PerplexityClient:
             """
 
         result = self.research(query)
-
-        # Extract phone numbers using regex
-        import re
-        phone_patterns = [
-            r'1-?8\d{2}-?\d{3}-?\d{4}',      # 1-800-XXX-XXXX or 800-XXX-XXXX
-            r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}', # XXX-XXX-XXXX
-            r'\(\d{3}\)\s?\d{3}[-.\s]?\d{4}', # (XXX) XXX-XXXX
-        ]
-
-        found_numbers = []
-        for pattern in phone_patterns:
-            matches = re.findall(pattern, result['content'])
-            found_numbers.extend(matches)
-
-        # Get the first phone number found (usually the main one)
-        phone_number = found_numbers[0] if found_numbers else None
+        numbers = extract_phone_numbers(result['content'])
 
         return {
-            "phone_number": phone_number,
-            "all_numbers": list(set(found_numbers)),  # All unique numbers found
+            "phone_number": numbers[0] if numbers else None,  # Best ranked number, E.164
+            "all_numbers": numbers,  # All unique numbers found, best first
             "raw_response": result['content'],
             "model_used": result['model_used']
         }
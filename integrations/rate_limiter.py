@@ -0,0 +1,338 @@
+"""
+Shared rate limiter for all outbound API traffic (OpenAI, Perplexity, Twilio).
+
+Each provider/model gets token buckets for requests per minute and tokens per minute.
+Callers that would exceed the budget queue up instead of failing, and queued callers
+are served in priority order: live phone calls, then chat turns, then background research.
+"""
+
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from .metrics import REGISTRY
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+    LIVE_CALL = 0
+    CHAT = 1
+    BACKGROUND = 2
+
+
+# (requests per minute, tokens per minute) per "provider:model", or per "provider" as fallback.
+# None disables that bucket. Override with a JSON object in the RATE_LIMITS env var.
+DEFAULT_LIMITS: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "openai": (500, 200_000),
+    "openai:realtime": (100, None),
+    "perplexity": (50, None),
+    "twilio": (3000, None),
+    "twilio:calls": (60, None),  # Outbound calls are limited to ~1 call per second per account
+}
+
+DEFAULT_TOKENS_PER_REQUEST = 1500
+
+QUEUE_DEPTH = REGISTRY.gauge("rate_limiter_queue_depth", "Requests waiting for rate limit budget")
+THROTTLED = REGISTRY.counter("rate_limiter_throttled_total", "Requests that had to wait for rate limit budget")
+REQUESTS = REGISTRY.counter("rate_limiter_requests_total", "Requests granted by the rate limiter")
+UPSTREAM_429 = REGISTRY.counter("rate_limiter_upstream_429_total", "Rate limit errors reported by providers")
+WAIT_SECONDS = REGISTRY.histogram("rate_limiter_wait_seconds", "Time spent waiting for rate limit budget")
+USED_TOKENS = REGISTRY.counter("rate_limiter_used_tokens_total", "Tokens providers reported as used, the token budgets are corrected with them")
+
+
+def throttled_retry_after(error: BaseException) -> Optional[float]:
+    """
+    Seconds to hold a lane after `error`, or None if it isn't an upstream 429.
+
+    Understands OpenAI (status_code), Twilio (status) and websockets (response.status_code) errors,
+    and the Retry-After header where the error carries the response.
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(error, "status", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return max(1.0, float(headers.get("retry-after") or headers.get("Retry-After") or 1.0))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class TokenBucket:
+    """Classic token bucket, refilled continuously."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available, 0 if they are available now."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def take(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        """Return tokens taken in excess, or take more (negative amount) when a request used more than taken."""
+        self.available = min(self.capacity, self.available + amount)
+
+    def drain(self):
+        self.available = 0
+
+
+class _Lane:
+    """Budget and wait queue for one provider/model."""
+
+    def __init__(self, key: str, requests_per_minute: Optional[float], tokens_per_minute: Optional[float]):
+        self.key = key
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.waiters = []  # heap of (priority, sequence)
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    def take(self, tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and tokens:
+            self.tokens.take(tokens)
+
+
+class RateLimitScheduler:
+    """
+    Process-wide scheduler that every outbound API call goes through.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            limits: (requests per minute, tokens per minute) per "provider:model" or "provider".
+                    Defaults to DEFAULT_LIMITS updated with the RATE_LIMITS env var.
+        """
+        if limits is None:
+            limits = dict(DEFAULT_LIMITS)
+            limits.update({key: tuple(value) for key, value in json.loads(os.getenv("RATE_LIMITS", "{}")).items()})
+        self.limits = limits
+        self._lanes: Dict[str, _Lane] = {}
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+
+    def _lane(self, provider: str, model: Optional[str]) -> _Lane:
+        key = f"{provider}:{model}" if model and f"{provider}:{model}" in self.limits else provider
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(key, *self.limits.get(key, (None, None)))
+        return lane
+
+    def try_acquire(self, provider: str, model: Optional[str] = None, tokens: int = 0, priority: Priority = Priority.BACKGROUND) -> bool:
+        """Take budget only if it is available right now and nobody is queued ahead."""
+        with self._cond:
+            lane = self._lane(provider, model)
+            if lane.waiters or lane.wait_time(tokens, time.monotonic()) > 0:
+                return False
+            lane.take(tokens)
+        REQUESTS.inc(lane=lane.key, priority=priority.name)
+        return True
+
+    def acquire(self, provider: str, model: Optional[str] = None, tokens: int = 0, priority: Priority = Priority.BACKGROUND, timeout: Optional[float] = None) -> float:
+        """
+        Block until the request fits the budget.
+
+        Args:
+            provider: "openai", "perplexity" or "twilio"
+            model: Model or endpoint, used when a specific limit is configured for it
+            tokens: Estimated tokens the request will consume
+            priority: Queue priority
+            timeout: Give up after this many seconds
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            TimeoutError: If the budget did not free up within `timeout`
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        ticket = (int(priority), next(self._sequence))
+
+        with self._cond:
+            lane = self._lane(provider, model)
+            heapq.heappush(lane.waiters, ticket)
+            QUEUE_DEPTH.inc(lane=lane.key, priority=priority.name)
+            try:
+                while True:
+                    now = time.monotonic()
+                    # Only the highest priority waiter may take budget, so lower priorities can't starve it
+                    wait = lane.wait_time(tokens, now) if lane.waiters[0] == ticket else None
+                    if wait == 0:
+                        lane.take(tokens)
+                        break
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise TimeoutError(f"Rate limit budget for {lane.key} not available within {timeout}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                lane.waiters.remove(ticket)
+                heapq.heapify(lane.waiters)
+                QUEUE_DEPTH.dec(lane=lane.key, priority=priority.name)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        REQUESTS.inc(lane=lane.key, priority=priority.name)
+        if waited > 0.001:
+            THROTTLED.inc(lane=lane.key, priority=priority.name)
+        WAIT_SECONDS.observe(waited, lane=lane.key, priority=priority.name)
+        return waited
+
+    async def acquire_async(self, provider: str, model: Optional[str] = None, tokens: int = 0, priority: Priority = Priority.BACKGROUND, timeout: Optional[float] = None) -> float:
+        """Async version of `acquire`. Waiting happens off the event loop."""
+        if self.try_acquire(provider, model, tokens, priority):
+            return 0.0
+        return await asyncio.to_thread(self.acquire, provider, model, tokens, priority, timeout)
+
+    @contextmanager
+    def slot(self, provider: str, model: Optional[str] = None, tokens: int = 0, priority: Priority = Priority.BACKGROUND):
+        """Acquire budget for the wrapped request, and back off the lane if it gets a 429."""
+        self.acquire(provider, model, tokens, priority)
+        try:
+            yield
+        except Exception as e:
+            retry_after = throttled_retry_after(e)
+            if retry_after is not None:
+                self.report_throttled(provider, model, retry_after)
+            raise
+
+    @asynccontextmanager
+    async def slot_async(self, provider: str, model: Optional[str] = None, tokens: int = 0, priority: Priority = Priority.BACKGROUND):
+        """Async version of `slot`."""
+        await self.acquire_async(provider, model, tokens, priority)
+        try:
+            yield
+        except Exception as e:
+            retry_after = throttled_retry_after(e)
+            if retry_after is not None:
+                self.report_throttled(provider, model, retry_after)
+            raise
+
+    def reconcile_tokens(self, provider: str, model: Optional[str], estimated: int, actual: int):
+        """Correct a lane's token bucket once a request's actual usage is known."""
+        with self._cond:
+            lane = self._lane(provider, model)
+            if lane.tokens:
+                lane.tokens.give_back(min(estimated, lane.tokens.capacity) - actual)
+                self._cond.notify_all()
+        USED_TOKENS.inc(actual, lane=lane.key)
+
+    def report_throttled(self, provider: str, model: Optional[str] = None, retry_after: float = 1.0):
+        """Record an upstream 429 and hold the lane for `retry_after` seconds."""
+        with self._cond:
+            lane = self._lane(provider, model)
+            lane.blocked_until = max(lane.blocked_until, time.monotonic() + retry_after)
+            if lane.requests:
+                lane.requests.drain()
+            self._cond.notify_all()
+        UPSTREAM_429.inc(lane=lane.key)
+
+    def langchain_limiter(self, provider: str, model: Optional[str] = None, priority: Priority = Priority.BACKGROUND, tokens_per_request: int = DEFAULT_TOKENS_PER_REQUEST) -> "LangChainRateLimiter":
+        """Adapter to pass as `rate_limiter=` to LangChain chat models."""
+        return LangChainRateLimiter(self, provider, model, priority, tokens_per_request)
+
+
+class LangChainRateLimiter(BaseRateLimiter, BaseCallbackHandler):
+    """
+    Routes LangChain chat model requests through the shared scheduler.
+
+    Pass it as both `rate_limiter=` and in `callbacks=`: as a callback it backs off the lane on
+    429s and corrects the token budget with each response's reported usage.
+    """
+
+    def __init__(self, scheduler: RateLimitScheduler, provider: str, model: Optional[str], priority: Priority, tokens_per_request: int):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.model = model
+        self.priority = priority
+        self.tokens_per_request = tokens_per_request
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self.scheduler.try_acquire(self.provider, self.model, self.tokens_per_request, self.priority)
+        self.scheduler.acquire(self.provider, self.model, self.tokens_per_request, self.priority)
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        if not blocking:
+            return self.scheduler.try_acquire(self.provider, self.model, self.tokens_per_request, self.priority)
+        await self.scheduler.acquire_async(self.provider, self.model, self.tokens_per_request, self.priority)
+        return True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens")
+        if total is None:
+            # Streaming and some providers only report usage on the message
+            messages = [getattr(generation, "message", None) for generations in response.generations for generation in generations]
+            totals = [message.usage_metadata["total_tokens"] for message in messages if getattr(message, "usage_metadata", None)]
+            total = sum(totals) if totals else None
+        if total is not None:
+            self.scheduler.reconcile_tokens(self.provider, self.model, self.tokens_per_request, total)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        retry_after = throttled_retry_after(error)
+        if retry_after is not None:
+            self.scheduler.report_throttled(self.provider, self.model, retry_after)
+
+
+# Singleton instance shared by all agents and the voice server
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> RateLimitScheduler:
+    """Get or create the process-wide rate limit scheduler."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RateLimitScheduler()
+    return _default_scheduler
+
+
+def chat_model_limiter(model: str, priority: Priority = Priority.BACKGROUND) -> LangChainRateLimiter:
+    """Quick function to get a `rate_limiter=` (and callback) for a ChatOpenAI model."""
+    return get_scheduler().langchain_limiter("openai", model, priority)
+
+
+def chat_model_limits(model: str, priority: Priority = Priority.BACKGROUND) -> Dict[str, Any]:
+    """Keyword arguments routing a ChatOpenAI model through the scheduler, e.g. `ChatOpenAI(model=model, **chat_model_limits(model))`."""
+    limiter = chat_model_limiter(model, priority)
+    return {"rate_limiter": limiter, "callbacks": [limiter]}
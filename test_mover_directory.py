@@ -0,0 +1,87 @@
+"""
+Test script for the local mover directory.
+Runs offline against a fake Perplexity client, no API key needed.
+
+Usage:
+    python test_mover_directory.py
+"""
+
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from integrations.perplexity_client import extract_phone_numbers
+from integrations.mover_directory import MoverDirectory
+
+
+class FakePerplexityClient:
+    """Counts research queries and answers with canned responses."""
+
+    def __init__(self):
+        self.queries = 0
+
+    def get_mover_phone_number(self, mover_name, location=None):
+        self.queries += 1
+        numbers = extract_phone_numbers("Call 1-800-555-0100 for quotes, or (555) 123-4567. Quotes: 800.555.0100")
+        return {"phone_number": numbers[0], "all_numbers": numbers, "raw_response": "", "model_used": "fake"}
+
+    def get_mover_reputation(self, mover_name):
+        self.queries += 1
+        return f"{mover_name} has a 4.5 star average rating."
+
+
+def test_phone_extraction():
+    """Numbers are normalized to E.164 and ranked by mentions, then first appearance."""
+    numbers = extract_phone_numbers("Call (555) 123-4567 or 1-800-555-0100. Toll free: 800-555-0100")
+    assert numbers == ["+18005550100", "+15551234567"], numbers
+    print(f"✅ Extracted ranked numbers: {numbers}")
+    return True
+
+
+def test_cached_lookups():
+    """Repeat lookups are served locally, including after reopening the directory."""
+    db_path = "./test_mover_directory.db"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    try:
+        client = FakePerplexityClient()
+        directory = MoverDirectory(db_path=db_path, client=client)
+
+        entry = directory.lookup("United Van Lines", "San Francisco, CA")
+        assert entry.phone_number == "+18005550100", entry
+        assert entry.reputation is not None
+        assert client.queries == 2
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            directory.get_phone_number("united van lines", "San Francisco,  CA")
+        elapsed_us = (time.perf_counter() - start) * 1e6 / 1000
+        assert client.queries == 2
+        print(f"✅ Cached lookup: {elapsed_us:.1f}µs per lookup")
+
+        entries = directory.lookup_many([("Allied Van Lines", None), ("Mayflower", "Miami, FL")])
+        assert all(entry.phone_number for entry in entries)
+        assert client.queries == 6
+        directory.close()
+
+        reopened = MoverDirectory(db_path=db_path, client=client)
+        assert reopened.get_phone_number("Mayflower", "Miami, FL") == "+18005550100"
+        assert client.queries == 6
+        reopened.close()
+        print("✅ Entries persisted across restarts")
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    return True
+
+
+if __name__ == "__main__":
+    print("\n📇 Mover Directory Test\n")
+    test_phone_extraction()
+    test_cached_lookups()
+    print("\n✨ Testing complete!\n")
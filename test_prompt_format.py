@@ -0,0 +1,99 @@
+"""
+Test script for the compact prompt renderings of state objects.
+Token counts use tiktoken, its encodings are downloaded on first use. The token count test is
+skipped where tiktoken or its encoding isn't available.
+
+Usage:
+    python test_prompt_format.py
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from agents import prompt_format
+from agents.prompt_format import count_tokens, format_conversation, format_customer, format_movers, format_quotes, conversation_turns
+from agents.state_models import CallTranscript, CustomerInfo
+
+
+def customer():
+    return CustomerInfo(
+        name="Dean", phone="650-321-4321", current_address="825 Menlo Ave, Menlo Park, CA 94002",
+        destination_address="200 First Street, Miami, FL", is_long_distance=True,
+        move_in_date=datetime(2026, 12, 12), move_out_date=datetime(2026, 12, 10), storage_required=False,
+        apartment_size="studio, 500 sq ft", inventory=["bed", "desk", "sofa"], packing_assistance=True, special_items="none",
+    )
+
+
+def test_renderings_are_pruned_and_memoized():
+    """Each purpose keeps only its fields, equal objects render once, a changed field renders anew."""
+    info = customer()
+    call, planning, filtering = (format_customer(info, purpose) for purpose in ("call", "planning", "filter"))
+    assert call == (
+        "Customer: Dean, 650-321-4321\n"
+        "Move: 825 Menlo Ave, Menlo Park, CA 94002 -> 200 First Street, Miami, FL (long distance)\n"
+        "Dates: out 2026-12-10, in 2026-12-12\n"
+        "Home: studio, 500 sq ft; items: bed, desk, sofa\n"
+        "Needs: packing"
+    ), call
+    assert "Dean" not in planning and "Dates" in planning and "Dates" not in filtering
+
+    hits = prompt_format._render.cache_info().hits
+    assert format_customer(customer(), "call") == call
+    assert prompt_format._render.cache_info().hits == hits + 1
+    info.storage_required = True
+    assert format_customer(info, "call") == call + ", storage"
+
+    try:
+        format_customer(info, "chat")
+        raise AssertionError("Unknown purpose accepted")
+    except ValueError:
+        pass
+    print("✅ Renderings pruned per purpose and memoized by field values")
+    return True
+
+
+def test_prompt_token_counts():
+    """The renderings take a fraction of the tokens of the reprs the prompts used before."""
+    pytest.importorskip("tiktoken")
+    try:
+        count_tokens("warm up")
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {type(e).__name__}")
+    count = count_tokens
+    info = customer()
+    movers = pd.read_csv("./agents/movers_database.csv").to_dict("records")
+    quotes = [
+        CallTranscript(mover_name="ABC Movers", initial_price=2400, negotiated_price=2100, services_included=["packing", "loading"], notes="Available Dec 10"),
+        CallTranscript(mover_name="XYZ Moving", negotiated_price=2650.5, services_included=["packing"], partial=True),
+    ]
+    call_data = {"status": "completed", "transcripts": [
+        {"seq": 1, "role": "user", "message": "That would be  $2,400."},
+        {"seq": 0, "role": "assistant", "message": "Hi, I'm looking for a quote to move a studio to Miami."},
+    ]}
+
+    sizes = {
+        "customer": (count(format_customer(info, "call")), count(str(info))),
+        "movers": (count(format_movers(movers)), count(str(movers))),
+        "quotes": (count(format_quotes(quotes)), count(str(quotes))),
+        "conversation": (count(format_conversation(conversation_turns(call_data))), count(str(call_data["transcripts"]))),
+    }
+    budgets = {"customer": 70, "movers": 130, "quotes": 40, "conversation": 30}
+    for name, (compact, repr_tokens) in sizes.items():
+        assert compact <= budgets[name], (name, compact)
+        assert compact <= 0.6 * repr_tokens, (name, compact, repr_tokens)
+    print(f"✅ Prompt tokens (compact, repr): {sizes}")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n🧾 Prompt Format Test\n")
+    test_renderings_are_pruned_and_memoized()
+    test_prompt_token_counts()
+    print("\n✨ Testing complete!\n")
@@ -0,0 +1,158 @@
+"""
+Test script for the quote comparison behind the analyst's recommendation.
+Runs offline, the LLM is only needed for rationales the template can't write.
+
+Usage:
+    python test_quote_comparison.py
+"""
+
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+
+# The analyst builds its chat model at init, these tests never call it
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from agents import firebase
+from agents.analyst_agent import AnalystAgent
+from agents.quote_comparison import compare_quotes
+from agents.state_models import CallTranscript, CustomerInfo
+
+
+def customer(**needs):
+    info = dict(
+        name="Sam", phone="+15550000000", current_address="San Francisco, CA", destination_address="Oakland, CA",
+        is_long_distance=False, move_in_date=datetime(2026, 11, 2), move_out_date=datetime(2026, 11, 1),
+        storage_required=False, apartment_size="2 bedroom", inventory=["sofa"], packing_assistance=False, special_items="none",
+    )
+    info.update(needs)
+    return CustomerInfo(**info)
+
+
+class FailingLLM:
+    """Stands in for the chat model where the template has to suffice."""
+
+    def __or__(self, other):
+        raise AssertionError("The LLM was called")
+
+    def __ror__(self, other):
+        raise AssertionError("The LLM was called")
+
+
+def test_quotes_ranked_deterministically():
+    """Price, needs covered and rating decide, ties are broken in the configured order."""
+    quotes = [
+        CallTranscript(mover_name="Cheap Movers", negotiated_price=1000, services_included=["loading"]),
+        CallTranscript(mover_name="Full Service Movers", initial_price=1400, negotiated_price=1100, services_included=["Full packing", "Piano moving"]),
+        CallTranscript(mover_name="Silent Movers"),
+    ]
+    info = customer(packing_assistance=True, special_items="Piano")
+    ratings = {"Cheap Movers": 4.0, "Full Service Movers": 4.5}
+
+    ranking = compare_quotes(quotes, info, ratings)
+    assert [score.quote.mover_name for score in ranking] == ["Full Service Movers", "Cheap Movers", "Silent Movers"], ranking
+    assert ranking[0].covered == ["packing", "piano"] and ranking[1].missing == ["packing", "piano"], ranking
+    assert compare_quotes(list(reversed(quotes)), info, ratings) == ranking
+
+    # Equal quotes from equally rated movers are decided by name, or by price first when asked to
+    twins = [CallTranscript(mover_name=name, negotiated_price=1000) for name in ("B Movers", "A Movers")]
+    assert [score.quote.mover_name for score in compare_quotes(twins)] == ["A Movers", "B Movers"]
+    assert [score.quote.mover_name for score in compare_quotes(twins, tie_break=("price",))] == ["B Movers", "A Movers"]
+    print(f"✅ Ranked {[(score.quote.mover_name, round(score.score, 3)) for score in ranking]}")
+    return True
+
+
+def test_analyst_recommends_without_llm():
+    """A mover leading on every criterion is recommended from the template, without calling the LLM."""
+    analyst = AnalystAgent("user-analyst")
+    analyst.llm = FailingLLM()
+    quotes = [
+        CallTranscript(mover_name="Best Movers", negotiated_price=1200, services_included=["packing"]),
+        CallTranscript(mover_name="ABC Movers", negotiated_price=1500, services_included=["packing"], partial=True),
+    ]
+
+    result = analyst({"customer_info": customer(packing_assistance=True), "call_transcripts": quotes})
+    assert result["final_recommendation"].startswith("Final Recomendation: Best Movers\n"), result["final_recommendation"]
+    assert "rating 4.9/5" in result["final_recommendation"]
+
+    result = analyst({"customer_info": customer(), "call_transcripts": [CallTranscript(mover_name="ABC Movers")]})
+    assert result["final_recommendation"].startswith("Final Recomendation: INCONCLUSIVE"), result["final_recommendation"]
+    print("✅ Recommendation and rationale written without the LLM")
+    return True
+
+
+def test_incremental_analysis():
+    """Quotes are ranked as calls complete, the final recommendation reuses the draft without another LLM call."""
+    narrations = []
+
+    def narrate(prompt):
+        narrations.append(prompt)
+        return AIMessage(content="XYZ Moving is cheaper, Best Movers better rated.")
+
+    analyst = AnalystAgent("user-incremental", narration="auto")
+    analyst.llm = RunnableLambda(narrate)
+    quotes = [
+        CallTranscript(mover_name="Best Movers", negotiated_price=1300),
+        CallTranscript(mover_name="XYZ Moving", negotiated_price=1100),
+    ]
+
+    analyst.add_quote(quotes[0], customer())
+    draft = dict(firebase._mock_db["user-incremental"])
+    assert draft["recommendationDraft"].startswith("Final Recomendation: Best Movers") and not narrations, draft
+    analyst.add_quote(quotes[1], customer())
+    draft = dict(firebase._mock_db["user-incremental"])
+    assert [score["quote"]["mover_name"] for score in draft["ranking"]] == ["XYZ Moving", "Best Movers"], draft
+    assert len(narrations) == 1
+
+    # The graph hands over quotes in mover order, not in the order the calls completed
+    result = analyst({"customer_info": customer(), "call_transcripts": quotes})
+    assert result["final_recommendation"] == draft["recommendationDraft"]
+    assert "XYZ Moving is cheaper" in result["final_recommendation"] and len(narrations) == 1
+    print("✅ Live leaderboard updated per quote, final recommendation taken from the draft")
+    return True
+
+
+def test_narration_outside_the_lock():
+    """A slow narration doesn't hold up ranking the next quote, and its outdated draft is not stored."""
+    release, narrations = threading.Event(), []
+
+    def narrate(prompt):
+        narrations.append(prompt)
+        if len(narrations) == 1:
+            release.wait(5)
+        return AIMessage(content=f"Narration {len(narrations)}.")
+
+    analyst = AnalystAgent("user-narration", narration="llm")
+    analyst.llm = RunnableLambda(narrate)
+    first = threading.Thread(target=analyst.add_quote, args=(CallTranscript(mover_name="Best Movers", negotiated_price=1300), customer()))
+    first.start()
+    while not narrations:
+        time.sleep(0.01)
+
+    analyst.add_quote(CallTranscript(mover_name="XYZ Moving", negotiated_price=1100), customer())
+    assert first.is_alive()
+    release.set()
+    first.join()
+
+    draft = dict(firebase._mock_db["user-narration"])
+    assert [score["quote"]["mover_name"] for score in draft["ranking"]] == ["XYZ Moving", "Best Movers"], draft
+    assert "Narration 2." in draft["recommendationDraft"], draft
+    print("✅ Quotes ranked while another one is narrated, outdated drafts dropped")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n⚖️  Quote Comparison Test\n")
+    test_quotes_ranked_deterministically()
+    test_analyst_recommends_without_llm()
+    test_incremental_analysis()
+    test_narration_outside_the_lock()
+    print("\n✨ Testing complete!\n")
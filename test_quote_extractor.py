@@ -0,0 +1,79 @@
+"""
+Test script for structured quote extraction.
+Runs offline with a fake extraction step, no API key needed.
+
+Usage:
+    python test_quote_extractor.py
+"""
+
+import os
+import sys
+
+# The extractor builds its chat model at init, the fake never calls it
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from agents.quote_extractor import QuoteExtractor
+from agents.state_models import CallTranscript
+
+
+class FakeQuoteExtractor(QuoteExtractor):
+    """Counts extractions and quotes a fixed price."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.extractions = 0
+
+    def _extract(self, mover_name, turns):
+        self.extractions += 1
+        return CallTranscript(mover_name=mover_name, initial_price=1500, negotiated_price=1250.5, services_included=["packing"])
+
+
+def call_data(status="completed"):
+    # Turns arrive out of order, the conversation is ordered by seq
+    return {
+        "status": status,
+        "transcripts": [
+            {"seq": 1, "role": "assistant", "message": "Could you do $1,250.50?"},
+            {"seq": 0, "role": "user", "message": "That move is $1,500."},
+        ],
+    }
+
+
+def test_quotes_cached_by_transcript():
+    """A conversation is extracted once, across status changes and reopening the cache."""
+    db_path = "./test_quote_cache.db"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    try:
+        extractor = FakeQuoteExtractor(db_path=db_path)
+        quote = extractor.extract("Quick Movers", call_data())
+        assert quote.negotiated_price == 1250.5 and quote.initial_price == 1500, quote
+        assert extractor.extract("Quick Movers", call_data("in-progress"), partial=True).partial
+        assert extractor.extractions == 1
+
+        # Another mover saying the same words is a different quote
+        assert extractor.extract("Other Movers", call_data()).mover_name == "Other Movers"
+        assert extractor.extractions == 2
+        extractor.close()
+
+        reopened = FakeQuoteExtractor(db_path=db_path)
+        assert reopened.extract("Quick Movers", call_data()) == quote
+        assert reopened.extract("Silent Movers", {"transcripts": []}).negotiated_price is None
+        assert reopened.extractions == 0
+        reopened.close()
+        print(f"✅ Quote extracted once and served from the cache: {quote.summary()!r}")
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+    return True
+
+
+if __name__ == "__main__":
+    print("\n💵 Quote Extractor Test\n")
+    test_quotes_cached_by_transcript()
+    print("\n✨ Testing complete!\n")
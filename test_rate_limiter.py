@@ -0,0 +1,81 @@
+"""
+Test script for the shared rate limit scheduler.
+Runs offline, provider errors and responses are built locally.
+
+Usage:
+    python test_rate_limiter.py
+"""
+
+import os
+import sys
+import time
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from twilio.base.exceptions import TwilioRestException
+
+from integrations.rate_limiter import Priority, RateLimitScheduler, throttled_retry_after
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeOpenAIError(Exception):
+    """Shaped like openai.RateLimitError: status_code plus the HTTP response."""
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit reached")
+        self.status_code = 429
+        self.response = FakeResponse(429, {"retry-after": str(retry_after)})
+
+
+def test_throttling_reported_from_every_provider():
+    """429s from OpenAI chat callbacks and Twilio slots hold their lane."""
+    scheduler = RateLimitScheduler({"openai": (600, None), "twilio": (600, None)})
+
+    limiter = scheduler.langchain_limiter("openai", "gpt-4o-mini", Priority.BACKGROUND)
+    limiter.on_llm_error(FakeOpenAIError(retry_after=2))
+    assert scheduler._lane("openai", None).blocked_until - time.monotonic() > 1.5
+
+    try:
+        with scheduler.slot("twilio", priority=Priority.LIVE_CALL):
+            raise TwilioRestException(429, "https://api.twilio.com/Calls.json", "Too Many Requests")
+    except TwilioRestException:
+        pass
+    assert scheduler._lane("twilio", None).blocked_until > time.monotonic()
+
+    assert throttled_retry_after(TwilioRestException(500, "uri")) is None
+    print("✅ OpenAI and Twilio 429s hold their lanes")
+    return True
+
+
+def test_token_budget_reconciled_with_usage():
+    """The estimate taken per request is corrected with the usage the response reports."""
+    scheduler = RateLimitScheduler({"openai": (None, 6000)})
+    limiter = scheduler.langchain_limiter("openai", "gpt-4o-mini", tokens_per_request=1500)
+    bucket = scheduler._lane("openai", None).tokens
+
+    limiter.acquire()
+    assert bucket.available < 4501
+    limiter.on_llm_end(LLMResult(generations=[[ChatGeneration(message=AIMessage(content="ok"))]], llm_output={"token_usage": {"total_tokens": 300}}))
+    assert 5600 < bucket.available <= 6000, bucket.available
+
+    limiter.acquire()
+    message = AIMessage(content="ok", usage_metadata={"input_tokens": 2500, "output_tokens": 500, "total_tokens": 3000})
+    limiter.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+    assert 2600 < bucket.available < 3100, bucket.available
+    print("✅ Token budget corrected from reported usage")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n🚦 Rate Limiter Test\n")
+    test_throttling_reported_from_every_provider()
+    test_token_budget_reconciled_with_usage()
+    print("\n✨ Testing complete!\n")
@@ -0,0 +1,799 @@
+"""
+Test script for the voice server call flow.
+Runs offline against local fakes of Twilio, no API keys needed.
+
+Usage:
+    python test_voice_server.py
+"""
+
+import os
+import sys
+import tempfile
+import json
+import base64
+import websockets
+import asyncio
+import threading
+import time
+import struct
+
+# The voice server reads credentials at import time, fakes don't need real ones
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+os.environ.setdefault("TWILIO_PHONE_NUMBER", "+15550000000")
+os.environ.setdefault("SERVER_ENDPOINT", "https://voice.test")
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+
+import voice_server
+from agents.call_orchestrator import CallOrchestrator
+from agents.state_models import CallTranscript
+from integrations.answer_rates import AnswerRates
+from voice import audio, loadtest
+from voice.aggregator import FrameAggregator
+from voice.call_data_writer import CallDataWriter
+from voice.call_store import SQLiteCallStore
+from voice.codec import FrameCodec, JsonBackend
+from voice.greetings import GreetingCache, GreetingRecorder
+from voice.fakes import FakeRealtimeServer, FakeTwilioClient
+from voice.realtime_pool import RealtimeSessionPool
+from voice.recorder import CallRecorder
+from voice.sender import TwilioSender
+from voice.sessions import CallContext
+from voice.vad import SPEECH_STARTED, SPEECH_STOPPED, LocalVAD
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice", "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, f"{name}.ulaw"), "rb") as f:
+        return f.read()
+
+app = FastAPI()
+app.include_router(voice_server.router)
+client = TestClient(app)
+
+
+def twilio_signature(url, params):
+    return RequestValidator(os.environ["TWILIO_AUTH_TOKEN"]).compute_signature(url, params)
+
+
+def post_status_callback(call_sid, status):
+    """Deliver a status transition the way Twilio does, through the signed webhook."""
+    data = {"CallSid": call_sid, "CallStatus": status}
+    headers = {"X-Twilio-Signature": twilio_signature("https://voice.test/call-status", data)}
+    response = client.post("/call-status", data=data, headers=headers)
+    assert response.status_code == 204, response.status_code
+
+
+def test_status_callback_completes_call():
+    """Call completion is detected from the status callback, without polling Twilio."""
+    fake = FakeTwilioClient(post_status_callback)
+    voice_server.twilio_client = fake
+
+    start = time.perf_counter()
+    call_sid = voice_server.handle_outgoing_call_sync("+15551230001")
+    status = voice_server.wait_for_call_completion(call_sid, timeout=5)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    assert status == "completed", status
+    assert fake.created[0]["status_callback"] == "https://voice.test/call-status"
+    print(f"✅ Call completion detected from status callbacks in {elapsed_ms:.0f}ms, no status polling")
+    return True
+
+
+def test_status_callback_requires_twilio_signature():
+    """Unsigned or forged status callbacks are rejected, and settled calls don't keep their futures."""
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={"+15551230005": ["initiated", "ringing"]})
+    call_sid = voice_server.handle_outgoing_call_sync("+15551230005")
+    status = voice_server.call_store.get_status(call_sid)
+
+    data = {"CallSid": call_sid, "CallStatus": "completed"}
+    assert client.post("/call-status", data=data).status_code == 403
+    forged = {"X-Twilio-Signature": twilio_signature("https://voice.test/call-status", dict(data, CallStatus="busy"))}
+    assert client.post("/call-status", data=data, headers=forged).status_code == 403
+    assert voice_server.call_store.get_status(call_sid) == status
+    assert call_sid in voice_server.call_completions
+
+    post_status_callback(call_sid, "completed")
+    assert call_sid not in voice_server.call_completions
+    assert voice_server.wait_for_call_completion(call_sid, timeout=1) == "completed"
+    print("✅ Status callbacks without a valid signature rejected, settled call's future dropped")
+    return True
+
+
+def test_hangup_releases_waiter():
+    """A call that never ends is released as soon as we hang up."""
+    fake = FakeTwilioClient(post_status_callback, scripts={"+15551230002": ["initiated", "ringing"]})
+    voice_server.twilio_client = fake
+
+    call_sid = voice_server.handle_outgoing_call_sync("+15551230002")
+    assert voice_server.wait_for_call_completion(call_sid, timeout=0.3) is None
+
+    threading.Timer(0.1, voice_server.hangup_call, args=(call_sid,)).start()
+    status = voice_server.wait_for_call_completion(call_sid, timeout=5)
+
+    assert status == "canceled", status
+    assert fake.updates[-1]["status"] == "canceled"
+    print("✅ Ringing call cancelled and waiter released")
+    return True
+
+
+def test_concurrent_call_contexts():
+    """Simultaneous calls keep their own prompt and user, and TwiML hands the call SID to the media stream."""
+    fake = FakeTwilioClient(post_status_callback, scripts={"+15551230003": ["initiated"], "+15551230004": ["initiated"]})
+    voice_server.twilio_client = fake
+
+    first = voice_server.initiate_call_with_prompt("+15551230003", "Prompt A", "Hello A", "user-a")
+    second = voice_server.initiate_call_with_prompt("+15551230004", "Prompt B", "Hello B", "user-b")
+
+    assert voice_server.call_store.get(first).prompt == "Prompt A"
+    assert voice_server.call_store.get(first).user_id == "user-a"
+    assert voice_server.call_store.get(second).prompt == "Prompt B"
+    assert voice_server.call_store.get(second).user_id == "user-b"
+
+    twiml = client.post("/outgoing-call-twiml", data={"CallSid": second}).text
+    assert f'<Parameter name="callSid" value="{second}" />' in twiml, twiml
+    print("✅ Concurrent calls keep separate contexts")
+    return True
+
+
+def test_call_data_writes_are_coalesced():
+    """Transcript updates are batched per call, only new entries are written, and hangup flushes."""
+    writes = []
+
+    async def run():
+        writer = CallDataWriter(flush_interval=0.05, write=lambda *args: writes.append(args))
+        writer.append_transcript("user-a", "CA1", "assistant", "Hello")
+        writer.append_transcript("user-a", "CA1", "user", "Hi", {"status": "CALL_INPROGRESS"})
+        await asyncio.sleep(0.1)
+        writer.append_transcript("user-a", "CA1", "user", "Hi")
+        writer.update("user-a", "CA1", {"status": "CALL_COMPLETED"})
+        await writer.flush("CA1")
+        await writer.close()
+
+    asyncio.run(run())
+
+    assert len(writes) == 2, writes
+    assert [entry["message"] for entry in writes[0][2]] == ["Hello", "Hi"]
+    assert writes[1][2] == [{"seq": 2, "role": "user", "message": "Hi"}]
+    assert writes[1][3] == {"status": "CALL_COMPLETED"}
+    print("✅ Call data writes coalesced, only new transcript entries sent")
+    return True
+
+
+def test_failed_call_data_writes_are_retried():
+    """A failed write is queued again with updates that came in meanwhile, and dropped once retries run out."""
+    writes, failures = [], {"CA1": 2, "CA2": 10}
+
+    def write(user_id, call_sid, transcripts, fields):
+        if failures[call_sid]:
+            failures[call_sid] -= 1
+            raise RuntimeError("Firestore unavailable")
+        writes.append((call_sid, [entry["seq"] for entry in transcripts], fields))
+
+    async def run():
+        writer = CallDataWriter(flush_interval=0.01, max_retries=2, retry_delay=0.01, write=write)
+        writer.append_transcript("user-a", "CA1", "assistant", "Hello")
+        writer.append_transcript("user-a", "CA2", "assistant", "Hello")
+        await writer.flush()
+        writer.append_transcript("user-a", "CA1", "user", "Hi", {"status": "CALL_INPROGRESS"})
+        await asyncio.sleep(0.2)
+        await writer.close()
+        return writer._pending
+
+    pending = asyncio.run(run())
+
+    assert writes == [("CA1", [0, 1], {"status": "CALL_INPROGRESS"})], writes
+    assert failures["CA2"] == 7 and not pending, (failures, pending)
+    print("✅ Failed call data writes retried with backoff, dropped after max retries")
+    return True
+
+
+def test_codec_fast_path_matches_full_parse():
+    """Fields pulled from audio frames without parsing agree with a full JSON parse, other frames are parsed."""
+    codec = FrameCodec(JsonBackend)
+    media = '{"event":"media","sequenceNumber":"3","media":{"track":"inbound","chunk":"2","timestamp":"40","payload":"f39/fw=="},"streamSid":"MZ1"}'
+    delta = '{"type":"response.audio.delta","event_id":"ev_1","response_id":"resp_1","item_id":"item_1","output_index":0,"content_index":0,"delta":"AAEC"}'
+
+    frame = codec.decode_twilio(media)
+    assert (frame.event, frame.payload, frame.timestamp) == ("media", "f39/fw==", 40)
+    assert frame.data["media"]["payload"] == frame.payload
+    event = codec.decode_realtime(delta)
+    assert (event.type, event.delta, event.item_id) == ("response.audio.delta", "AAEC", "item_1")
+
+    # Pretty-printed frames miss the fast path and fall back to a full parse
+    spaced = codec.decode_twilio('{"event": "media", "media": {"timestamp": "60", "payload": "AAAA"}}')
+    assert (spaced.payload, spaced.timestamp) == ("AAAA", 60)
+    assert codec.decode_twilio('{"event":"mark","mark":{"name":"responsePart"}}').data["mark"]["name"] == "responsePart"
+    print("✅ Frame codec fast path agrees with full JSON parsing")
+    return True
+
+
+def test_frames_are_aggregated():
+    """Inbound frames go out in chunks, flushed when full, on events, and when the latency timer fires."""
+    frame = base64.b64encode(bytes(160)).decode()
+    sent = []
+
+    async def send(message):
+        sent.append(json.loads(message))
+
+    async def run():
+        aggregator = FrameAggregator(send, chunk_ms=60, max_latency_ms=50)
+        for timestamp in (0, 20, 40, 60):
+            await aggregator.add(frame, timestamp)
+        assert len(sent) == 1 and aggregator.pending_ms == 20
+        await aggregator.flush("mark")
+        await aggregator.add(frame, 80)
+        await asyncio.sleep(0.1)
+        aggregator.close()
+        return aggregator
+
+    aggregator = asyncio.run(run())
+
+    assert [len(base64.b64decode(message["audio"])) for message in sent] == [480, 160, 160], sent
+    assert all(message["type"] == "input_audio_buffer.append" for message in sent)
+    assert aggregator.delivered_timestamp == 100
+    print("✅ Inbound audio sent as 60ms chunks, 3x fewer messages")
+    return True
+
+
+def test_realtime_sessions_prewarmed_and_reaped():
+    """Sessions opened at dial time are handed to the answered call, and closed for unanswered ones."""
+
+    async def run():
+        realtime = FakeRealtimeServer(connect_delay=0.05)
+        url = await realtime.start()
+
+        async def open_session(context):
+            return await websockets.connect(url)
+
+        pool = RealtimeSessionPool(open_session)
+        pool.start()
+        for call_sid in ("CA-answered", "CA-unanswered"):
+            pool.prewarm(CallContext(call_sid=call_sid, prompt="", conversation_text=""))
+
+        answered = await pool.acquire("CA-answered")
+        assert answered is not None and answered.open
+        assert await pool.acquire("CA-never-dialed") is None
+
+        pool.discard("CA-unanswered")
+        await asyncio.sleep(0.1)
+        assert len(pool) == 0 and realtime.connections == 2
+        await answered.close()
+        await pool.close()
+        await realtime.close()
+
+    asyncio.run(run())
+    print("✅ Pre-warmed realtime session handed over, unanswered one closed")
+    return True
+
+
+def test_greeting_recorded_then_replayed():
+    """A live greeting is recorded, and the next call with the same text and customer seeds it instead of generating one."""
+
+    class RecordingSocket:
+        def __init__(self):
+            self.sent = []
+
+        async def send(self, message):
+            self.sent.append(json.loads(message)["type"])
+
+    frame = base64.b64encode(bytes(range(160))).decode()
+    recorder = GreetingRecorder()
+    recorder.add("item_1", frame)
+    recorder.add("item_1", frame)
+    audio, transcript = recorder.finish({"status": "completed", "output": [
+        {"id": "item_1", "role": "assistant", "content": [{"type": "audio", "transcript": "Hi, I'm calling about a move."}]}
+    ]})
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        voice_server.greeting_cache = GreetingCache(cache_dir)
+        voice_server.greeting_cache.put("Hello!  I'm interested\nin moving services.", "Ada Lovelace", voice_server.VOICE, voice_server.AUDIO_FORMAT, audio, transcript)
+
+        # A fresh cache reads the recording back from disk, whitespace differences and the strategy don't matter
+        voice_server.greeting_cache = GreetingCache(cache_dir)
+        context = CallContext(
+            call_sid="CA-greeting", prompt="Customer: Ada\n\nAdapted strategy", customer_name="Ada  Lovelace",
+            conversation_text="Hello! I'm interested in moving services.",
+        )
+        socket = RecordingSocket()
+        asyncio.run(voice_server.send_initial_conversation_item(socket, context))
+
+        greeting = voice_server.greeting_cache.load(context.greeting_key)
+        assert socket.sent == ["conversation.item.create", "conversation.item.create"], socket.sent
+        assert greeting.transcript == transcript and greeting.frames() == [frame, frame]
+
+        # Another text, or the same text for another customer, is generated live
+        for miss in (
+            CallContext(call_sid="CA-other", prompt="", customer_name="Ada Lovelace", conversation_text="Something else"),
+            CallContext(call_sid="CA-customer", prompt="", customer_name="Bob", conversation_text="Hello! I'm interested in moving services."),
+        ):
+            socket = RecordingSocket()
+            asyncio.run(voice_server.send_initial_conversation_item(socket, miss))
+            assert socket.sent[-1] == "response.create" and miss.greeting_key is None
+
+    print("✅ Greeting recorded once, replayed from the cache on the next call")
+    return True
+
+
+def test_media_stream_records_latency():
+    """A call bridged to a fake realtime API stores its latency summary with the call data."""
+    number = "+15551230005"
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={number: ["initiated", "ringing", "in-progress"]})
+    voice_server.GREETING_CACHE = False
+    realtime = FakeRealtimeServer(connect_delay=0.01, first_audio_delay=0.05, audio_frames=5)
+    media = json.dumps({"event": "media", "media": {"timestamp": "0", "payload": base64.b64encode(bytes(160)).decode()}})
+
+    with TestClient(app) as live_client:
+        voice_server.OPENAI_REALTIME_URL = live_client.portal.call(realtime.start)
+        call_sid = voice_server.handle_outgoing_call_sync(number, "user-latency")
+        with live_client.websocket_connect("/media-stream") as twilio_ws:
+            twilio_ws.send_text(json.dumps({"event": "start", "start": {"streamSid": "MZ1", "customParameters": {"callSid": call_sid}}}))
+            events = [json.loads(twilio_ws.receive_text())["event"] for _ in range(10)]
+            twilio_ws.send_text(json.dumps({"event": "mark", "mark": {"name": "responsePart"}}))
+            for _ in range(3):
+                twilio_ws.send_text(media)
+            time.sleep(0.1)
+        voice_server.hangup_call(call_sid, "in-progress")
+        latency = voice_server.get_call_data(call_sid)["latency"]
+        live_client.portal.call(realtime.close)
+
+    assert events.count("media") == 5 and events.count("mark") == 5, events
+    assert latency["frames_out"] == 5 and latency["frames_in"] == 3, latency
+    assert latency["first_audio_ms"] is not None and latency["mark_round_trip"]["count"] == 1, latency
+    print(f"✅ Call latency stored with the call data: first audio after {latency['first_audio_ms']:.0f}ms")
+    return True
+
+
+def test_local_vad_on_fixtures():
+    """Speech is detected within 100ms of its onset. Line noise, a click and hiss are ignored."""
+    expected = {"line_noise": [], "click": [], "hiss": [], "speech": [SPEECH_STARTED, SPEECH_STOPPED]}
+    for name, events in expected.items():
+        audio = read_fixture(name)
+        vad = LocalVAD()
+        detected = []
+        for start in range(0, len(audio), 160):
+            event = vad.process(audio[start:start + 160])
+            if event:
+                detected.append((event, (start + 160) // 8))
+        assert [event for event, _ in detected] == events, (name, detected)
+
+    # Speech in the fixture starts at 500ms
+    assert 500 < detected[0][1] <= 600, detected
+    print(f"✅ Local VAD detected speech {detected[0][1] - 500}ms after onset, no false triggers")
+    return True
+
+
+def test_local_vad_barge_in():
+    """Talking over the assistant clears Twilio playback and cancels the response without waiting for server VAD."""
+    number = "+15551230006"
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={number: ["initiated", "ringing", "in-progress"]})
+    voice_server.GREETING_CACHE = False
+    voice_server.LOCAL_VAD = True
+    realtime = FakeRealtimeServer(connect_delay=0.01, first_audio_delay=0.01, audio_frames=100)
+    speech = read_fixture("speech")
+
+    try:
+        with TestClient(app) as live_client:
+            voice_server.OPENAI_REALTIME_URL = live_client.portal.call(realtime.start)
+            call_sid = voice_server.handle_outgoing_call_sync(number)
+            with live_client.websocket_connect("/media-stream") as twilio_ws:
+                twilio_ws.send_text(json.dumps({"event": "start", "start": {"streamSid": "MZ1", "customParameters": {"callSid": call_sid}}}))
+                assert json.loads(twilio_ws.receive_text())["event"] == "media"
+                time.sleep(0.1)
+                for timestamp in range(0, 800, 20):
+                    payload = base64.b64encode(speech[timestamp * 8:(timestamp + 20) * 8]).decode()
+                    twilio_ws.send_text(json.dumps({"event": "media", "media": {"timestamp": str(timestamp), "payload": payload}}))
+                while json.loads(twilio_ws.receive_text())["event"] != "clear":
+                    pass
+            voice_server.hangup_call(call_sid, "in-progress")
+            live_client.portal.call(realtime.close)
+    finally:
+        voice_server.LOCAL_VAD = False
+
+    received = [event["type"] for event in realtime.received]
+    assert "response.cancel" in received and "conversation.item.truncate" in received, received
+    print("✅ Local VAD interrupted the assistant before any server speech_started")
+    return True
+
+
+def test_call_recorder_writes_stereo_wav():
+    """Both legs land on their own channel in Twilio's timeline, a clear drops unplayed audio, files rotate."""
+    def frame(value):
+        return base64.b64encode(bytes([value]) * 160).decode()
+
+    async def record(path_prefix):
+        recorder = CallRecorder(path_prefix, max_file_bytes=58 + 600, flush_interval=0.01)
+        recorder.start()
+        recorder.inbound(frame(0x10), 0)
+        recorder.outbound(frame(0x20))  # Plays from 20ms on
+        recorder.outbound(frame(0x30))  # Queued behind it, then cleared
+        await asyncio.sleep(0.05)
+        recorder.inbound(frame(0x10), 20)
+        recorder.clear()
+        recorder.inbound(frame(0x10), 60)  # 40ms frame lost on the way
+        await recorder.close()
+        return recorder
+
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = asyncio.run(record(os.path.join(tmp, "CA1")))
+        assert [os.path.basename(path) for path in recorder.paths] == ["CA1.wav", "CA1.part2.wav", "CA1.part3.wav"], recorder.paths
+        data = b""
+        for path in recorder.paths:
+            with open(path, "rb") as f:
+                wav = f.read()
+            fmt, channels, rate = struct.unpack("<HHI", wav[20:28])
+            assert wav[:4] == b"RIFF" and wav[8:12] == b"WAVE" and (fmt, channels, rate) == (7, 2, 8000)
+            assert wav[50:54] == b"data" and struct.unpack("<I", wav[54:58])[0] == len(wav) - 58
+            data += wav[58:]
+
+    assert data[0::2] == b"\x10" * 320 + b"\xff" * 160 + b"\x10" * 160
+    assert data[1::2] == b"\xff" * 160 + b"\x20" * 160 + b"\xff" * 320
+    assert recorder.frames_dropped == 0
+    print("✅ Call recorded to stereo WAV, aligned, cleared and rotated")
+    return True
+
+
+def test_audio_codec_and_resampler():
+    """μ-law decodes and re-encodes losslessly, resampling keeps a tone intact whether streamed or not."""
+    import numpy as np
+
+    codes = bytes(range(256))
+    assert audio.ulaw_to_pcm(memoryview(codes)[0xFF:])[0] == 0
+    # 0x7F is negative zero, it encodes back as positive zero
+    assert audio.pcm_to_ulaw(audio.ulaw_to_pcm(codes)) == codes[:0x7F] + b"\xff" + codes[0x80:]
+
+    tone = (np.sin(2 * np.pi * 440 * np.arange(8000) / 8000) * 10000).astype(np.int16)
+    assert abs(audio.level_dbfs(tone) - 20 * np.log10(10000 / np.sqrt(2) / 32768)) < 0.01
+    assert audio.level_dbfs(np.zeros(160, dtype=np.int16)) == audio.SILENCE_DBFS
+    for rate in (16000, 24000):
+        upsampled = audio.resample(tone, 8000, rate)
+        expected = np.sin(2 * np.pi * 440 * np.arange(len(upsampled)) / rate) * 10000
+        assert len(upsampled) == len(tone) * rate // 8000
+        assert np.abs(upsampled[200:-200] - expected[200:-200]).max() < 50
+        assert np.abs(audio.resample(upsampled, rate, 8000)[100:-100] - tone[100:-100]).max() < 50
+
+        streamed, whole = audio.Resampler(8000, rate), audio.Resampler(8000, rate)
+        chunks = [streamed.process(tone[start:start + 160]) for start in range(0, len(tone), 160)]
+        assert np.array_equal(np.concatenate(chunks + [streamed.flush()]), np.concatenate([whole.process(tone), whole.flush()]))
+    print("✅ Audio codec round-trips, resampling streams 20ms frames without artifacts")
+    return True
+
+
+def test_sender_prioritizes_clear_over_queued_audio():
+    """A slow Twilio leg queues audio up to the high-water mark, and a clear skips the queue and drops it."""
+    sent = []
+
+    async def slow_send(message):
+        await asyncio.sleep(0.005)
+        sent.append(message)
+
+    async def run():
+        sender = TwilioSender(slow_send, audio_high_water=20)
+        sender.start()
+        accepted = [sender.media(f"media {i}") for i in range(30)]
+        sender.mark("mark")
+        await asyncio.sleep(0.02)
+        frames, marks = await sender.clear("clear")
+        sender.media("media after")
+        sender.mark("mark after")
+        await sender.close(drain=True)
+        return sender, accepted, frames, marks
+
+    sender, accepted, frames, marks = asyncio.run(run())
+    assert accepted == [True] * 20 + [False] * 10
+    # Only the frames sent before the clear, then the clear, then new audio
+    clear_at = sent.index("clear")
+    assert 0 < clear_at < 10 and sent[:clear_at] == [f"media {i}" for i in range(clear_at)], sent
+    assert sent[clear_at + 1:] == ["media after", "mark after"], sent
+    assert (frames, marks) == (20 - clear_at, 1)
+    assert sender.stats() == {"frames_sent": clear_at + 1, "frames_dropped": 10, "frames_cleared": frames, "max_audio_depth": 20}
+    assert sender.audio_depth == 0
+    print(f"✅ Clear sent after {clear_at} frames, {frames} queued frames dropped with it")
+    return True
+
+
+def test_call_store_shared_between_workers():
+    """A call dialed by one worker is visible to another, including statuses the other one received."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calls.db")
+        dialing, serving = SQLiteCallStore(path), SQLiteCallStore(path)
+        # Twilio can call back before the dialing worker has registered the call
+        serving.set_status("CA1", "initiated")
+        dialing.register(CallContext(call_sid="CA1", user_id="user-a", prompt="Prompt A", conversation_text="Hello A"))
+        context = serving.get("CA1")
+        assert (context.prompt, context.user_id, serving.get_status("CA1")) == ("Prompt A", "user-a", "initiated")
+
+        # Field updates from two workers don't overwrite each other
+        serving.update("CA1", {"greeting_key": "greeting"})
+        dialing.update("CA1", {"prompt": "Prompt B"})
+        context = serving.get("CA1")
+        assert (context.greeting_key, context.prompt) == ("greeting", "Prompt B"), context
+        assert dialing.update("CA-unknown", {"prompt": "Prompt B"}) is None
+
+        store, poll = voice_server.call_store, voice_server.CALL_STATUS_POLL_SECONDS
+        voice_server.call_store, voice_server.CALL_STATUS_POLL_SECONDS = dialing, 0.05
+        try:
+            threading.Timer(0.1, serving.set_status, args=("CA1", "completed")).start()
+            assert voice_server.wait_for_call_completion("CA1", timeout=2) == "completed"
+        finally:
+            voice_server.call_store, voice_server.CALL_STATUS_POLL_SECONDS = store, poll
+        dialing.close()
+        serving.close()
+    print("✅ Call context and status shared between workers through SQLite")
+    return True
+
+
+def test_load_generator_measures_a_call():
+    """The load generator drives a separate voice server process and times frames, turns and first audio."""
+    reports = asyncio.run(loadtest.run([2], seconds=1.5, turn_ms=500, deadline_ms=1000, max_miss_rate=0.01, audio=read_fixture("speech")))
+    report = reports[0]
+    assert report.served == 2, report
+    assert report.deadline_miss_rate < 0.05, report
+    assert report.round_trip_p50_ms is not None and report.first_audio_p50_ms is not None, report
+    print(f"✅ Load generator: {report.calls} calls, frame delivery p50 {report.delivery_p50_ms:.0f}ms, turn round trip p50 {report.round_trip_p50_ms:.0f}ms")
+    return True
+
+
+def test_orchestrator_deadlines_hang_up_calls():
+    """Calls past their deadline are hung up, and the stage returns by its own deadline with partial results."""
+    stuck = ["initiated", "ringing", "in-progress"]
+    fake = FakeTwilioClient(post_status_callback, scripts={"+15551230010": stuck, "+15551230011": stuck, "+15551230012": stuck})
+    voice_server.twilio_client = fake
+    movers = [{"name": f"Mover {i}", "phone": f"+1555123001{i}"} for i in range(3)]
+
+    def dial(mover, strategy):
+        return voice_server.handle_outgoing_call_sync(mover["phone"])
+
+    extract_quote = lambda result: CallTranscript(mover_name=result.mover["name"])
+    modify_strategy = lambda quotes, strategy: strategy
+
+    # One call per wave: the first hits its own limit, the second the stage's, the third is never dialed
+    answer_rates = AnswerRates(":memory:")
+    orchestrator = CallOrchestrator(
+        dial, extract_quote, modify_strategy, max_concurrent_calls=1, call_timeout=0.5, stage_timeout=0.8, hangup_grace=1,
+        answer_rates=answer_rates,
+    )
+    start = time.perf_counter()
+    results = orchestrator.run(movers, "strategy")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 2, elapsed
+    assert [result.timed_out for result in results] == [True, True, True], results
+    assert all(result.status in voice_server.TERMINAL_CALL_STATUSES for result in results[:2]), results
+    assert results[2].call_sid is None and results[2].cancelled, results[2]
+    # The call hung up at its own limit was answered, it is not a cancellation
+    assert (results[0].status, results[0].cancelled, results[1].cancelled) == ("completed", False, True), results
+    assert answer_rates.stats("Mover 0").answered == 1 and answer_rates.stats("Mover 1").attempts == 0
+    answer_rates.close()
+    hung_up = {update["sid"] for update in fake.updates}
+    assert hung_up == {results[0].call_sid, results[1].call_sid}, fake.updates
+    print(f"✅ Stage deadline: 2 calls hung up, 1 skipped, returned in {elapsed:.1f}s")
+    return True
+
+
+def test_orchestrator_retries_unanswered_calls():
+    """Busy and unanswered movers are called again later, without holding up the other movers, and answer rates are kept."""
+    busy = ["initiated", "ringing", "busy"]
+    no_answer = ["initiated", "ringing", "no-answer"]
+    fake = FakeTwilioClient(post_status_callback, scripts={"+15551230020": busy, "+15551230022": no_answer, "+15551230023": no_answer})
+    voice_server.twilio_client = fake
+    movers = [{"name": "Busy Movers"}, {"name": "Ghost Movers"}, {"name": "Quick Movers"}]
+    numbers = {"Busy Movers": ["+15551230020", "+15551230021"], "Ghost Movers": ["+15551230022", "+15551230023"], "Quick Movers": ["+15551230024"]}
+    dialed = []
+
+    def dial(mover, strategy):
+        # Each attempt dials the mover's next number, so the busy mover picks up the second time
+        dialed.append(mover["name"])
+        return voice_server.handle_outgoing_call_sync(numbers[mover["name"]][dialed.count(mover["name"]) - 1])
+
+    answer_rates = AnswerRates(":memory:")
+    orchestrator = CallOrchestrator(
+        dial, lambda result: CallTranscript(mover_name=result.mover["name"]), lambda quotes, strategy: strategy, max_concurrent_calls=1,
+        max_attempts=2, retry_delays={"busy": 0.5, "no-answer": 0.5}, retry_jitter=0, answer_rates=answer_rates,
+    )
+    results = {result.mover["name"]: result for result in orchestrator.run(movers, "strategy")}
+
+    # The retries wait their turn behind movers not called yet, one worker serves them all
+    assert dialed == ["Busy Movers", "Ghost Movers", "Quick Movers", "Busy Movers", "Ghost Movers"], dialed
+    assert results["Busy Movers"].attempt_statuses == ["busy", "completed"] and results["Busy Movers"].quote.mover_name == "Busy Movers"
+    assert results["Ghost Movers"].attempt_statuses == ["no-answer", "no-answer"] and results["Ghost Movers"].quote is None
+    assert results["Quick Movers"].attempts == 1
+    assert answer_rates.stats("ghost movers").no_answer == 2
+    assert [mover["name"] for mover in answer_rates.rank(movers)] == ["Quick Movers", "Busy Movers", "Ghost Movers"]
+    answer_rates.close()
+    print("✅ Busy and unanswered movers retried after the others, answer rates rank Quick > Busy > Ghost")
+    return True
+
+
+def test_orchestrator_survives_dial_errors():
+    """A dial that raises is a failed attempt, retried, and the other movers are still called."""
+    fake = FakeTwilioClient(post_status_callback, scripts={})
+    voice_server.twilio_client = fake
+    movers = [{"name": "Flaky Movers"}, {"name": "Quick Movers"}]
+    dialed = []
+
+    def dial(mover, strategy):
+        dialed.append(mover["name"])
+        if dialed.count("Flaky Movers") == 1 and mover["name"] == "Flaky Movers":
+            raise RuntimeError("HTTP 429: Too Many Requests")
+        return voice_server.handle_outgoing_call_sync(f"+1555123004{len(dialed)}")
+
+    answer_rates = AnswerRates(":memory:")
+    orchestrator = CallOrchestrator(
+        dial, lambda result: CallTranscript(mover_name=result.mover["name"]), lambda quotes, strategy: strategy, max_concurrent_calls=1,
+        max_attempts=2, retry_delays={"failed": 0.2}, retry_jitter=0, answer_rates=answer_rates,
+    )
+    results = {result.mover["name"]: result for result in orchestrator.run(movers, "strategy")}
+
+    assert dialed == ["Flaky Movers", "Quick Movers", "Flaky Movers"], dialed
+    assert results["Flaky Movers"].attempt_statuses == ["failed", "completed"], results["Flaky Movers"].attempt_statuses
+    assert results["Quick Movers"].attempt_statuses == ["completed"] and results["Flaky Movers"].quote is not None
+    assert answer_rates.stats("flaky movers").failed == 1
+    answer_rates.close()
+    print("✅ Dial errors recorded as failed attempts and retried, other movers still called")
+    return True
+
+
+def test_orchestrator_survives_callback_errors():
+    """Callbacks that raise, e.g. on a Firestore outage, are logged and every mover is still called."""
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={})
+    movers = [{"name": "First Movers"}, {"name": "Second Movers"}, {"name": "Third Movers"}]
+    dialed, replans = [], []
+
+    def dial(mover, strategy):
+        dialed.append(mover["name"])
+        return voice_server.handle_outgoing_call_sync(f"+1555123005{len(dialed)}")
+
+    def modify_strategy(quotes, strategy):
+        replans.append(len(quotes))
+        if len(replans) == 1:
+            raise RuntimeError("LLM unavailable")
+        return f"strategy {len(quotes)}"
+
+    def firestore_down(*args):
+        raise RuntimeError("Firestore unavailable")
+
+    orchestrator = CallOrchestrator(
+        dial, lambda result: CallTranscript(mover_name=result.mover["name"]), modify_strategy, max_concurrent_calls=1,
+    )
+    results = orchestrator.run(movers, "strategy", on_strategy=firestore_down, on_call_completed=firestore_down)
+
+    assert dialed == ["First Movers", "Second Movers", "Third Movers"], dialed
+    assert all(result.attempt_statuses == ["completed"] and result.quote is not None for result in results), results
+    assert replans, replans
+    print("✅ Callback errors logged, every mover still called")
+    return True
+
+
+def test_orchestrator_pipelines_quote_extraction():
+    """The next call is dialed while the last one's quote is extracted, and the adapted strategy reaches it mid-call."""
+    long_call = ["initiated", "ringing"] + ["in-progress"] * 20 + ["completed"]
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={"+15551230031": long_call})
+    movers = [{"name": "First Movers", "phone": "+15551230030"}, {"name": "Second Movers", "phone": "+15551230031"}]
+    events = []
+
+    def dial(mover, strategy):
+        events.append(("dial", mover["name"], strategy))
+        return voice_server.handle_outgoing_call_sync(mover["phone"], "user-pipeline", strategy)
+
+    def extract_quote(result):
+        time.sleep(0.3)
+        events.append(("extracted",))
+        return CallTranscript(mover_name=result.mover["name"], negotiated_price=1200)
+
+    def modify_strategy(quotes, strategy):
+        time.sleep(0.2)
+        return f"beat ${quotes[0].negotiated_price:.0f}"
+
+    def update_strategy(result, strategy):
+        events.append(("update", result.mover["name"], strategy))
+        voice_server.update_call_prompt(result.call_sid, strategy)
+
+    orchestrator = CallOrchestrator(dial, extract_quote, modify_strategy, max_concurrent_calls=1, update_strategy=update_strategy)
+    strategies = []
+    results = orchestrator.run(movers, "initial", on_strategy=strategies.append)
+
+    # Dialed with the provisional strategy before the first quote, then updated in the call
+    assert events.index(("dial", "Second Movers", "initial")) < events.index(("extracted",)), events
+    assert ("update", "Second Movers", "beat $1200") in events, events
+    assert strategies == ["beat $1200"], strategies
+    assert voice_server.call_store.get(results[1].call_sid).prompt == "beat $1200"
+    assert [result.quote.negotiated_price for result in results] == [1200, 1200], results
+    print("✅ Second call dialed while the first quote was extracted, adapted strategy handed to it mid-call")
+    return True
+
+
+def test_prompt_update_reaches_live_session():
+    """A call's new prompt is sent to its live realtime session as a session.update."""
+    number = "+15551230032"
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={number: ["initiated", "ringing", "in-progress"]})
+    voice_server.GREETING_CACHE = False
+    realtime = FakeRealtimeServer(connect_delay=0.01, first_audio_delay=0.05, audio_frames=2)
+
+    with TestClient(app) as live_client:
+        voice_server.OPENAI_REALTIME_URL = live_client.portal.call(realtime.start)
+        call_sid = voice_server.handle_outgoing_call_sync(number, "user-update", "old strategy")
+        with live_client.websocket_connect("/media-stream") as twilio_ws:
+            twilio_ws.send_text(json.dumps({"event": "start", "start": {"streamSid": "MZ2", "customParameters": {"callSid": call_sid}}}))
+            twilio_ws.receive_text()
+            updated = voice_server.update_call_prompt(call_sid, "new strategy")
+            time.sleep(0.1)
+        voice_server.hangup_call(call_sid, "in-progress")
+        live_client.portal.call(realtime.close)
+
+    instructions = [event["session"].get("instructions") for event in realtime.received if event["type"] == "session.update"]
+    assert updated and instructions == ["old strategy", "new strategy"], instructions
+    print("✅ Prompt update sent to the live realtime session")
+    return True
+
+
+def test_prewarmed_greeting_reaches_media_stream():
+    """A stream starting while its session is still pre-warming plays the greeting the pre-warm found in the cache."""
+    number = "+15551230036"
+    voice_server.twilio_client = FakeTwilioClient(post_status_callback, scripts={number: ["initiated", "ringing", "in-progress"]})
+    realtime = FakeRealtimeServer(connect_delay=0.3, first_audio_delay=0.05, audio_frames=2)
+    frame = base64.b64encode(bytes(range(160))).decode()
+    settings = (voice_server.call_store, voice_server.greeting_cache, voice_server.GREETING_CACHE, voice_server.REALTIME_PREWARM)
+
+    with tempfile.TemporaryDirectory() as tmp, TestClient(app) as live_client:
+        # Contexts are copies read from SQLite, as when several workers share the store
+        voice_server.call_store = SQLiteCallStore(os.path.join(tmp, "calls.db"))
+        voice_server.greeting_cache = GreetingCache(os.path.join(tmp, "greetings"))
+        greeting = voice_server.greeting_cache.put(voice_server.INITIAL_CONVERSATION_TEXT, "Ada Lovelace", voice_server.VOICE, voice_server.AUDIO_FORMAT, base64.b64decode(frame), "Hi there.")
+        voice_server.GREETING_CACHE, voice_server.REALTIME_PREWARM = True, True
+        try:
+            voice_server.OPENAI_REALTIME_URL = live_client.portal.call(realtime.start)
+            call_sid = voice_server.handle_outgoing_call_sync(number, "user-prewarm", "cached strategy", customer_name="Ada Lovelace")
+            with live_client.websocket_connect("/media-stream") as twilio_ws:
+                twilio_ws.send_text(json.dumps({"event": "start", "start": {"streamSid": "MZ3", "customParameters": {"callSid": call_sid}}}))
+                first = json.loads(twilio_ws.receive_text())
+                voice_server.update_call_prompt(call_sid, "new strategy")
+                context = voice_server.call_store.get(call_sid)
+            voice_server.hangup_call(call_sid, "in-progress")
+            live_client.portal.call(realtime.close)
+        finally:
+            voice_server.call_store.close()
+            voice_server.call_store, voice_server.greeting_cache, voice_server.GREETING_CACHE, voice_server.REALTIME_PREWARM = settings
+
+    assert first["event"] == "media" and first["media"]["payload"] == frame, first
+    assert (context.prompt, context.greeting_key) == ("new strategy", greeting.key), context
+    print("✅ Greeting found while pre-warming played on the media stream")
+    return True
+
+
+if __name__ == "__main__":
+    print("\n📞 Voice Server Test\n")
+    test_status_callback_completes_call()
+    test_status_callback_requires_twilio_signature()
+    test_hangup_releases_waiter()
+    test_concurrent_call_contexts()
+    test_call_data_writes_are_coalesced()
+    test_failed_call_data_writes_are_retried()
+    test_codec_fast_path_matches_full_parse()
+    test_frames_are_aggregated()
+    test_realtime_sessions_prewarmed_and_reaped()
+    test_greeting_recorded_then_replayed()
+    test_media_stream_records_latency()
+    test_local_vad_on_fixtures()
+    test_local_vad_barge_in()
+    test_call_recorder_writes_stereo_wav()
+    test_audio_codec_and_resampler()
+    test_sender_prioritizes_clear_over_queued_audio()
+    test_call_store_shared_between_workers()
+    test_load_generator_measures_a_call()
+    test_orchestrator_deadlines_hang_up_calls()
+    test_orchestrator_retries_unanswered_calls()
+    test_orchestrator_survives_dial_errors()
+    test_orchestrator_survives_callback_errors()
+    test_orchestrator_pipelines_quote_extraction()
+    test_prompt_update_reaches_live_session()
+    test_prewarmed_greeting_reaches_media_stream()
+    print("\n✨ Testing complete!\n")
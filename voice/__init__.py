@@ -0,0 +1,3 @@
+"""
+Building blocks for the voice server: call media handling, local fakes for testing and benchmarks.
+"""
@@ -0,0 +1,129 @@
+"""
+Coalescing of inbound Twilio audio into larger realtime API appends.
+
+Twilio delivers a 20ms μ-law frame roughly every 20ms, and forwarding each one as its own
+`input_audio_buffer.append` costs a WebSocket message, a JSON frame on the OpenAI side and
+an event loop round trip per frame. The aggregator buffers frames into `chunk_ms` chunks
+instead, trading a bounded amount of added latency for several times fewer messages.
+
+Base64 payloads can't be concatenated as strings (each 160 byte frame ends in padding), so
+buffered frames are decoded and the chunk is re-encoded once when it is sent.
+"""
+
+import time
+import base64
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from integrations.metrics import REGISTRY
+from .frames import input_audio_append
+
+FRAME_MS = 20
+BYTES_PER_MS = 8  # 8kHz, one byte per μ-law sample
+MIN_CHUNK_MS = FRAME_MS
+MAX_CHUNK_MS = 200
+
+CHUNK_DELAY = REGISTRY.histogram(
+    "audio_chunk_delay_seconds",
+    "Time the oldest frame of an inbound audio chunk waited before being sent to the realtime API",
+    buckets=(0.005, 0.02, 0.04, 0.06, 0.08, 0.1, 0.12, 0.15, 0.2, 0.25, 0.5),
+)
+CHUNKS_SENT = REGISTRY.counter("audio_chunks_sent_total", "Inbound audio chunks sent to the realtime API, by flush reason")
+FRAMES_RECEIVED = REGISTRY.counter("audio_frames_received_total", "Inbound Twilio audio frames")
+
+
+class FrameAggregator:
+    """
+    Buffers inbound audio frames and sends them as `chunk_ms` chunks.
+
+    A chunk is sent once it holds `chunk_ms` of audio, when `flush` is called (on the
+    stream's start, stop and mark events) or when its oldest frame has waited
+    `max_latency_ms`, whichever comes first. With `chunk_ms` of 20 every frame is
+    forwarded as it arrives, without decoding.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable],
+        chunk_ms: int = 100,
+        max_latency_ms: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the aggregator.
+
+        Args:
+            send: Coroutine function sending a message to the realtime API
+            chunk_ms: Audio per chunk, clamped to 20-200ms
+            max_latency_ms: Longest a frame may wait in the buffer. Defaults to `chunk_ms`
+            clock: Monotonic clock used for the delay metrics
+        """
+        self._send = send
+        self.chunk_ms = min(max(chunk_ms, MIN_CHUNK_MS), MAX_CHUNK_MS)
+        self.max_latency_ms = max_latency_ms or self.chunk_ms
+        self._clock = clock
+        self._chunk_bytes = self.chunk_ms * BYTES_PER_MS
+        self._buffer = bytearray()
+        self._buffered_at: Optional[float] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+        # Twilio media timestamps (ms since the stream started) of the buffered audio, and the
+        # end of the audio already delivered. The realtime API's view of the caller's audio
+        # lags the latest received frame by `pending_ms`.
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self.delivered_timestamp = 0
+
+    @property
+    def pending_ms(self) -> int:
+        return len(self._buffer) // BYTES_PER_MS
+
+    async def add(self, payload: str, timestamp: int):
+        """Buffer one Twilio media payload, sending the chunk once it is full."""
+        FRAMES_RECEIVED.inc()
+        if self.chunk_ms <= FRAME_MS:
+            await self._send(input_audio_append(payload))
+            CHUNKS_SENT.inc(reason="size")
+            self.delivered_timestamp = timestamp + FRAME_MS
+            return
+
+        if not self._buffer:
+            self._buffered_at = self._clock()
+            self.first_timestamp = timestamp
+            self._timer = asyncio.get_running_loop().call_later(self.max_latency_ms / 1000, self._on_timer)
+        self._buffer += base64.b64decode(payload)
+        self.last_timestamp = timestamp
+
+        if len(self._buffer) >= self._chunk_bytes:
+            await self.flush("size")
+
+    async def flush(self, reason: str = "event"):
+        """Send whatever is buffered now."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._buffer:
+            return
+
+        chunk, self._buffer = self._buffer, bytearray()
+        CHUNK_DELAY.observe(self._clock() - self._buffered_at, chunk_ms=self.chunk_ms)
+        CHUNKS_SENT.inc(reason=reason)
+        self.delivered_timestamp = self.last_timestamp + FRAME_MS
+        await self._send(input_audio_append(base64.b64encode(chunk).decode()))
+
+    def close(self):
+        """Drop buffered audio and stop the latency timer, once the stream is gone."""
+        if self._timer:
+            self._timer.cancel()
+        self._buffer = bytearray()
+
+    def _on_timer(self):
+        self._timer = None
+        self._timer_task = asyncio.get_running_loop().create_task(self._flush_on_timer())
+
+    async def _flush_on_timer(self):
+        try:
+            await self.flush("timer")
+        except Exception as e:
+            print(f"Error sending buffered audio: {e}")
@@ -0,0 +1,181 @@
+"""
+Audio primitives for call audio: G.711 μ-law, 16-bit PCM, resampling and levels.
+
+`audioop` is gone from Python 3.13 (and pydub with it), so everything that looks at call
+audio - the recorder, local VAD, analytics - shares these NumPy versions instead.
+
+- μ-law ⇄ PCM16 are single table lookups: 256 entries to decode, 65536 to encode, the
+  same values `audioop.ulaw2lin`/`lin2ulaw` produced.
+- `Resampler` converts between 8kHz (Twilio) and 16/24kHz (OpenAI's pcm16, speech models)
+  with a polyphase windowed-sinc filter. It is streaming, filter state carries over from
+  one chunk to the next, so 20ms frames can be fed as they arrive.
+- `rms` and `level_dbfs` meter a block of samples.
+
+Inputs may be `bytes`, `bytearray` or `memoryview`. They are wrapped with `np.frombuffer`,
+not copied, and PCM is read as little-endian int16 as on the wire.
+
+Requires NumPy.
+"""
+
+import math
+from fractions import Fraction
+from typing import Union
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:
+    np = None
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+ULAW_SILENCE = 0xFF
+FULL_SCALE = 32768.0
+SILENCE_DBFS = -120.0
+
+
+def _ulaw_decode_table():
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+def _ulaw_encode_table():
+    # One entry per 16-bit sample, indexed by the sample's bits read as uint16. Same steps
+    # as audioop's lin2ulaw, which works on the 14 most significant bits
+    samples = np.arange(65536, dtype=np.uint32).astype(np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + 0x21
+    segment = np.zeros_like(magnitude)
+    for segment_end in (0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF):
+        segment += magnitude > segment_end
+    codes = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    codes = np.where(segment >= 8, 0x7F, codes)
+    return (codes ^ mask).astype(np.uint8)
+
+
+ULAW_TO_LINEAR = _ulaw_decode_table() if np is not None else None
+LINEAR_TO_ULAW = _ulaw_encode_table() if np is not None else None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("voice.audio requires numpy")
+
+
+def pcm_samples(pcm: Buffer) -> "np.ndarray":
+    """View little-endian 16-bit PCM bytes as int16 samples, without copying."""
+    _require_numpy()
+    return np.frombuffer(pcm, dtype="<i2")
+
+
+def ulaw_to_pcm(ulaw: Buffer) -> "np.ndarray":
+    """Decode μ-law bytes to int16 samples."""
+    _require_numpy()
+    return ULAW_TO_LINEAR[np.frombuffer(ulaw, dtype=np.uint8)]
+
+
+def pcm_to_ulaw(samples: Union[Buffer, "np.ndarray"]) -> bytes:
+    """Encode int16 samples (or 16-bit PCM bytes) to μ-law bytes."""
+    _require_numpy()
+    if not isinstance(samples, np.ndarray):
+        samples = pcm_samples(samples)
+    return LINEAR_TO_ULAW[samples.astype(np.int16, copy=False).view(np.uint16)].tobytes()
+
+
+def rms(samples: "np.ndarray") -> float:
+    """Root mean square of int16 samples, 0.0 for an empty block."""
+    if not len(samples):
+        return 0.0
+    samples = samples.astype(np.float32)
+    return math.sqrt(float(np.dot(samples, samples)) / len(samples))
+
+
+def level_dbfs(samples: "np.ndarray") -> float:
+    """RMS level relative to full scale, SILENCE_DBFS for digital silence."""
+    value = rms(samples)
+    return 20 * math.log10(value / FULL_SCALE) if value > 0 else SILENCE_DBFS
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler between two sample rates, e.g. 8000 → 24000.
+
+    The rate ratio is reduced to up/down factors L/M. Each output sample is one dot product
+    of the input history with one of the L phases of a windowed-sinc low-pass filter, so the
+    zero-stuffed intermediate signal is never built.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int, half_taps: int = 10, kaiser_beta: float = 5.0):
+        """
+        Initialize the resampler.
+
+        Args:
+            from_rate: Input sample rate in Hz
+            to_rate: Output sample rate in Hz
+            half_taps: Filter half-length in input or output samples, whichever rate is lower
+            kaiser_beta: Kaiser window shape, higher attenuates more with a wider transition band
+        """
+        _require_numpy()
+        ratio = Fraction(to_rate, from_rate)
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.up = ratio.numerator
+        self.down = ratio.denominator
+
+        # Low-pass at the lower of the two Nyquist frequencies, designed at the up-sampled rate
+        factor = max(self.up, self.down)
+        taps = 2 * half_taps * factor + 1
+        center = (taps - 1) / 2
+        cutoff = 1.0 / factor
+        h = cutoff * np.sinc(cutoff * (np.arange(taps) - center)) * np.kaiser(taps, kaiser_beta)
+        # Unity gain at DC, the up-sampled signal is zero-stuffed and needs `up` times that
+        h *= self.up / h.sum()
+
+        # phases[p][j] = h[p + j * up], reversed so it lines up with an input window
+        per_phase = -(-taps // self.up)
+        padded = np.zeros(per_phase * self.up)
+        padded[:taps] = h
+        self._phases = padded.reshape(per_phase, self.up).T[:, ::-1].astype(np.float32).copy()
+        self._history = np.zeros(per_phase - 1, dtype=np.float32)
+        self._position = 0  # Next output's position at the up-sampled rate, relative to the next input
+        # Output samples of delay the filter adds, cut off by `resample`
+        self.delay = int(round(center / self.down))
+
+    def process(self, samples: "np.ndarray") -> "np.ndarray":
+        """Resample the next chunk of int16 samples, returns the int16 output available so far."""
+        end = len(samples) * self.up
+        count = max(0, -(-(end - self._position) // self.down))
+        buffer = np.concatenate((self._history, samples.astype(np.float32)))
+        output = np.empty(count, dtype=np.float32)
+        if count:
+            taps = self._phases.shape[1]
+            windows = as_strided(buffer, (len(buffer) - taps + 1, taps), (buffer.strides[0],) * 2, writeable=False)
+            # Every `up` outputs the input advances by `down` and the phases repeat, so each
+            # of the first `up` outputs starts a strided run of windows sharing one phase
+            for first in range(min(self.up, count)):
+                position = self._position + first * self.down
+                run = output[first::self.up]
+                run[:] = windows[position // self.up::self.down][:len(run)] @ self._phases[position % self.up]
+        self._position += count * self.down - end
+        if len(self._history):
+            self._history = buffer[len(buffer) - len(self._history):]
+        np.rint(output, out=output)
+        np.clip(output, -32768, 32767, out=output)
+        return output.astype(np.int16)
+
+    def flush(self) -> "np.ndarray":
+        """Output still held in the filter at the end of a stream."""
+        return self.process(np.zeros(len(self._history), dtype=np.int16))
+
+
+def resample(samples: "np.ndarray", from_rate: int, to_rate: int) -> "np.ndarray":
+    """Resample a whole signal, time-aligned with the input (no filter delay)."""
+    if from_rate == to_rate:
+        return samples.astype(np.int16, copy=False)
+    resampler = Resampler(from_rate, to_rate)
+    output = np.concatenate((resampler.process(samples), resampler.flush()))
+    expected = len(samples) * resampler.up // resampler.down
+    return output[resampler.delay:resampler.delay + expected]
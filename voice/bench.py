@@ -0,0 +1,523 @@
+"""
+Micro-benchmarks for the voice server media path.
+
+Usage:
+    python -m voice.bench media
+    python -m voice.bench codec
+    python -m voice.bench aggregate
+    python -m voice.bench first-word
+    python -m voice.bench record
+    python -m voice.bench audio
+    python -m voice.bench workers
+"""
+
+import io
+import os
+import json
+import time
+import base64
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+from websockets.frames import Frame, Opcode
+
+from . import audio
+from .aggregator import CHUNK_DELAY, FrameAggregator
+from .codec import FrameCodec, JsonBackend, OrjsonBackend, orjson
+from .frames import input_audio_append, twilio_mark, twilio_media
+
+FRAME_BYTES = 160  # 20ms of 8kHz g711 u-law
+STREAM_SID = "MZ" + "0" * 32
+
+
+def twilio_media_message(timestamp: int = 0) -> str:
+    """A Twilio media event as it arrives on the websocket, compact like Twilio sends it."""
+    payload = base64.b64encode(os.urandom(FRAME_BYTES)).decode()
+    return json.dumps({
+        "event": "media",
+        "sequenceNumber": str(timestamp // 20 + 1),
+        "media": {"track": "inbound", "chunk": str(timestamp // 20 + 1), "timestamp": str(timestamp), "payload": payload},
+        "streamSid": STREAM_SID,
+    }, separators=(",", ":"))
+
+
+def openai_delta_message() -> str:
+    """An OpenAI response.audio.delta event as it arrives on the websocket."""
+    return json.dumps({
+        "type": "response.audio.delta",
+        "event_id": "event_0000",
+        "response_id": "resp_0000",
+        "item_id": "item_0000",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": base64.b64encode(os.urandom(FRAME_BYTES)).decode(),
+    }, separators=(",", ":"))
+
+
+def legacy_inbound(message: str, audio_buffer: list) -> str:
+    """Inbound frame handling before zero-copy forwarding."""
+    data = json.loads(message)
+    audio_buffer.append(base64.b64decode(data['media']['payload']))
+    audio_bytes = base64.b64decode(data['media']['payload'])
+    io.BytesIO(audio_bytes)
+    return json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+
+
+def legacy_outbound(message: str) -> str:
+    """Outbound frame handling before zero-copy forwarding."""
+    response = json.loads(message)
+    audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
+    return json.dumps({"event": "media", "streamSid": STREAM_SID, "media": {"payload": audio_payload}})
+
+
+def inbound(message: str) -> str:
+    data = json.loads(message)
+    return input_audio_append(data['media']['payload'])
+
+
+def outbound(message: str) -> str:
+    response = json.loads(message)
+    return twilio_media(STREAM_SID, response['delta'])
+
+
+def measure(handler, message: str, frames: int):
+    """Return (frames per second on one core, peak bytes allocated per frame)."""
+    for _ in range(1000):
+        handler(message)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        handler(message)
+    frames_per_second = frames / (time.perf_counter() - start)
+
+    samples = 200
+    total = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        handler(message)
+        total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return frames_per_second, total / samples
+
+
+def report(name: str, handler, message: str, frames: int):
+    frames_per_second, bytes_per_frame = measure(handler, message, frames)
+    print(f"{name:<22} {frames_per_second:>12,.0f} frames/s/core {bytes_per_frame:>10,.0f} bytes/frame")
+
+
+def bench_media(frames: int):
+    inbound_message = twilio_media_message()
+    outbound_message = openai_delta_message()
+    audio_buffer = []
+
+    print("Twilio -> OpenAI (input_audio_buffer.append)")
+    # The legacy buffer grows for the whole call, clear it so the benchmark itself stays bounded
+    report("  legacy", lambda message: (legacy_inbound(message, audio_buffer), audio_buffer.clear()), inbound_message, frames)
+    report("  zero-copy", inbound, inbound_message, frames)
+    print("OpenAI -> Twilio (media)")
+    report("  legacy", legacy_outbound, outbound_message, frames)
+    report("  zero-copy", outbound, outbound_message, frames)
+
+
+def twilio_mark_message() -> str:
+    """A Twilio mark event, echoed back once playback reaches a mark we sent."""
+    return json.dumps({"event": "mark", "sequenceNumber": "4", "streamSid": STREAM_SID, "mark": {"name": "responsePart"}}, separators=(",", ":"))
+
+
+def call_second_dicts(inbound_message: str, outbound_message: str, mark_message: str):
+    """One second of one call's frame traffic, parsing and serializing every frame through dicts."""
+    for _ in range(50):
+        data = json.loads(inbound_message)
+        json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+        response = json.loads(outbound_message)
+        json.dumps({"event": "media", "streamSid": STREAM_SID, "media": {"payload": response['delta']}}, separators=(",", ":"))
+        json.dumps({"event": "mark", "streamSid": STREAM_SID, "mark": {"name": "responsePart"}}, separators=(",", ":"))
+        json.loads(mark_message)
+
+
+def call_second_codec(codec: FrameCodec, inbound_message: str, outbound_message: str, mark_message: str):
+    """One second of one call's frame traffic through the codec and message templates."""
+    for _ in range(50):
+        input_audio_append(codec.decode_twilio(inbound_message).payload)
+        twilio_media(STREAM_SID, codec.decode_realtime(outbound_message).delta)
+        twilio_mark(STREAM_SID, "responsePart")
+        codec.decode_twilio(mark_message)
+
+
+def bench_codec(seconds: int):
+    inbound_message = twilio_media_message()
+    outbound_message = openai_delta_message()
+    mark_message = twilio_mark_message()
+
+    variants = [("dicts + json", lambda: call_second_dicts(inbound_message, outbound_message, mark_message))]
+    backends = [JsonBackend] + ([OrjsonBackend] if orjson else [])
+    for backend in backends:
+        codec = FrameCodec(backend)
+        variants.append((f"codec + {backend.name}", lambda codec=codec: call_second_codec(codec, inbound_message, outbound_message, mark_message)))
+
+    print("Frame codec cost per call (50 frames/s each way, plus mark echoes)")
+    for name, call_second in variants:
+        call_second()
+        start = time.perf_counter()
+        for _ in range(seconds):
+            call_second()
+        cpu_per_call = (time.perf_counter() - start) / seconds
+        print(f"  {name:<16} {cpu_per_call * 1e3:>8.3f} ms CPU per call-second {1 / cpu_per_call:>10,.0f} concurrent calls/core")
+
+
+def bench_aggregate(seconds: int):
+    """Messages, CPU and added latency per call for a range of inbound chunk sizes."""
+    frames_per_second = 1000 // 20
+    messages = [twilio_media_message(timestamp) for timestamp in range(0, 1000, 20)]
+    codec = FrameCodec()
+
+    async def run(chunk_ms: int):
+        sent = []
+
+        async def send(message):
+            # Client frames are masked, which costs a pass over every byte sent
+            sent.append(Frame(Opcode.TEXT, message.encode()).serialize(mask=True, extensions=[]))
+
+        # Frames arrive every 20ms of simulated time, the bench itself runs as fast as it can
+        now_ms = [0]
+        aggregator = FrameAggregator(send, chunk_ms, clock=lambda: now_ms[0] / 1000)
+        start = time.perf_counter()
+        for second in range(seconds):
+            for message in messages:
+                frame = codec.decode_twilio(message)
+                await aggregator.add(frame.payload, second * 1000 + frame.timestamp)
+                now_ms[0] += 20
+        await aggregator.flush()
+        aggregator.close()
+        return len(sent), time.perf_counter() - start
+
+    print(f"Inbound audio chunking ({frames_per_second} Twilio frames/s per call)")
+    print(f"  {'chunk':>6} {'messages/s':>11} {'CPU/call-s':>11} {'calls/core':>11} {'mean added':>11} {'oldest wait':>11}")
+    asyncio.run(run(20))
+    for chunk_ms in (20, 60, 100, 200):
+        count, elapsed = asyncio.run(run(chunk_ms))
+        cpu_per_call = elapsed / seconds
+        # Frames wait for the rest of their chunk, 0ms for the last frame up to chunk - 20ms for the first
+        mean_added_ms = (chunk_ms - 20) / 2
+        chunks = CHUNK_DELAY.count(chunk_ms=chunk_ms)
+        oldest_ms = CHUNK_DELAY.sum(chunk_ms=chunk_ms) / chunks * 1000 if chunks else 0
+        print(
+            f"  {chunk_ms:>4}ms {count / seconds:>11.1f} {cpu_per_call * 1e6:>9.0f}us {1 / cpu_per_call:>11,.0f}"
+            f" {mean_added_ms:>9.0f}ms {oldest_ms:>9.0f}ms"
+        )
+
+
+def bench_first_word(calls: int, ring_seconds: float, connect_delay: float, first_audio_delay: float):
+    """Time from the media stream starting to the first audio frame reaching the caller."""
+    # The voice server reads credentials at import time, fakes don't need real ones
+    for name, value in (("OPENAI_API_KEY", "bench"), ("TWILIO_ACCOUNT_SID", "ACbench"), ("TWILIO_AUTH_TOKEN", "bench"), ("TWILIO_PHONE_NUMBER", "+15550000000")):
+        os.environ.setdefault(name, value)
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    import voice_server
+    from .fakes import FakeRealtimeServer, FakeTwilioClient
+    from .greetings import GreetingCache
+
+    app = FastAPI()
+    app.include_router(voice_server.router)
+    realtime = FakeRealtimeServer(connect_delay=connect_delay, first_audio_delay=first_audio_delay)
+    number = "+15551239999"
+    voice_server.twilio_client = FakeTwilioClient(
+        voice_server.resolve_call_status, scripts={number: ["initiated", "ringing", "in-progress"]}, step_seconds=ring_seconds / 2
+    )
+
+    def call(frames: int = 1) -> float:
+        """Place a call and return the time to its first audio frame, after receiving `frames` of them."""
+        call_sid = voice_server.handle_outgoing_call_sync(number)
+        time.sleep(ring_seconds)
+        with client.websocket_connect("/media-stream") as twilio_ws:
+            twilio_ws.send_text(json.dumps({"event": "connected"}))
+            start = time.perf_counter()
+            twilio_ws.send_text(json.dumps({"event": "start", "start": {"streamSid": STREAM_SID, "callSid": call_sid, "customParameters": {"callSid": call_sid}}}))
+            while json.loads(twilio_ws.receive_text())["event"] != "media":
+                pass
+            elapsed = time.perf_counter() - start
+            for _ in range(frames - 1):
+                while json.loads(twilio_ws.receive_text())["event"] != "media":
+                    pass
+            if frames > 1:
+                # Let the server see the end of the response
+                time.sleep(0.2)
+        voice_server.hangup_call(call_sid, "in-progress")
+        return elapsed
+
+    print(f"Time to first word, fake realtime API: {connect_delay * 1000:.0f}ms connect, {first_audio_delay * 1000:.0f}ms to first audio, {ring_seconds:.1f}s ringing")
+    variants = [
+        ("opened on answer", False, False),
+        ("pre-warmed at dial", True, False),
+        ("on answer + cached greeting", False, True),
+        ("pre-warmed + cached greeting", True, True),
+    ]
+    with tempfile.TemporaryDirectory() as cache_dir, TestClient(app) as client:
+        voice_server.OPENAI_REALTIME_URL = client.portal.call(realtime.start)
+        voice_server.greeting_cache = GreetingCache(cache_dir)
+        for label, prewarm, greeting_cache in variants:
+            voice_server.REALTIME_PREWARM = prewarm
+            voice_server.GREETING_CACHE = greeting_cache
+            if greeting_cache and not os.listdir(cache_dir):
+                # The first call records the greeting
+                call(frames=realtime.audio_frames)
+            times = [call() for _ in range(calls)]
+            print(f"  {label:<30} median {statistics.median(times) * 1000:>6.0f}ms   max {max(times) * 1000:>6.0f}ms")
+        client.portal.call(realtime.close)
+
+
+def bench_record(calls: int, seconds: int):
+    """Many concurrent recorded calls in real time: media path stalls, drops, writer load and memory per call."""
+    from .recorder import RECORDER_WRITE_SECONDS, CallRecorder
+
+    inbound_payload = json.loads(twilio_media_message())["media"]["payload"]
+    outbound_payload = json.loads(openai_delta_message())["delta"]
+
+    async def run(directory: str):
+        recorders = [CallRecorder(os.path.join(directory, f"CA{index:032d}")) for index in range(calls)]
+        for recorder in recorders:
+            recorder.start()
+        enqueue_times = []
+        start = time.perf_counter()
+        for tick in range(seconds * 50):
+            # Every call receives and sends one 20ms frame per tick
+            tick_start = time.perf_counter()
+            for recorder in recorders:
+                recorder.inbound(inbound_payload, tick * 20)
+                recorder.outbound(outbound_payload)
+            enqueue_times.append(time.perf_counter() - tick_start)
+            await asyncio.sleep(max(0, start + (tick + 1) * 0.02 - time.perf_counter()))
+        lag = time.perf_counter() - start - seconds
+
+        # Memory held per call in steady state, one more tick with allocations traced
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for recorder in recorders:
+            recorder.inbound(inbound_payload, seconds * 1000)
+            recorder.outbound(outbound_payload)
+        await asyncio.sleep(recorders[0].flush_interval * 2)
+        held = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        await asyncio.gather(*(recorder.close() for recorder in recorders))
+        written = sum(os.path.getsize(path) for recorder in recorders for path in recorder.paths)
+        dropped = sum(recorder.frames_dropped for recorder in recorders)
+        return enqueue_times, lag, held, written, dropped
+
+    with tempfile.TemporaryDirectory() as directory:
+        enqueue_times, lag, held, written, dropped = asyncio.run(run(directory))
+
+    enqueue_times.sort()
+    batches = RECORDER_WRITE_SECONDS.count()
+    print(f"Call recording, {calls} concurrent calls for {seconds}s (stereo u-law)")
+    print(f"  media path enqueue per tick  p50 {enqueue_times[len(enqueue_times) // 2] * 1e3:.2f}ms   max {enqueue_times[-1] * 1e3:.2f}ms (all calls)")
+    print(f"  fell behind real time by     {max(lag, 0) * 1e3:.0f}ms")
+    print(f"  writer                       {batches} batches, {RECORDER_WRITE_SECONDS.sum() / max(seconds, 1) * 100:.0f}% of one core")
+    print(f"  written                      {written / 1e6:.1f}MB ({written / seconds / 1e6:.2f}MB/s), {dropped} frames dropped")
+    print(f"  peak memory over a flush     {held / calls / 1024:.1f}KB per call")
+
+
+def bench_audio(seconds: int):
+    """Samples per second through voice.audio, in 20ms frames as on a call and in one block."""
+    import numpy as np
+
+    try:
+        import audioop
+    except ImportError:  # Python 3.13+
+        audioop = None
+
+    rng = np.random.default_rng(0)
+    pcm_8k = (rng.standard_normal(seconds * 8000) * 3000).astype(np.int16)
+    ulaw = audio.pcm_to_ulaw(pcm_8k)
+    pcm_24k = audio.resample(pcm_8k, 8000, 24000)
+
+    def frames(data, size):
+        view = memoryview(data)
+        return [view[start:start + size] for start in range(0, len(view), size)]
+
+    def stream(from_rate, to_rate, samples):
+        resampler = audio.Resampler(from_rate, to_rate)
+        chunk = from_rate // 50
+        return lambda: [resampler.process(samples[start:start + chunk]) for start in range(0, len(samples), chunk)]
+
+    ulaw_frames = frames(ulaw, FRAME_BYTES)
+    pcm_frames = frames(pcm_8k.tobytes(), 2 * FRAME_BYTES)
+    cases = [
+        ("ulaw -> pcm16, 20ms frames", 8000, lambda: [audio.ulaw_to_pcm(frame) for frame in ulaw_frames]),
+        ("ulaw -> pcm16, one block", 8000, lambda: audio.ulaw_to_pcm(ulaw)),
+        ("pcm16 -> ulaw, 20ms frames", 8000, lambda: [audio.pcm_to_ulaw(frame) for frame in pcm_frames]),
+        ("pcm16 -> ulaw, one block", 8000, lambda: audio.pcm_to_ulaw(pcm_8k)),
+        ("8k -> 16k, 20ms frames", 8000, stream(8000, 16000, pcm_8k)),
+        ("8k -> 24k, 20ms frames", 8000, stream(8000, 24000, pcm_8k)),
+        ("24k -> 8k, 20ms frames", 24000, stream(24000, 8000, pcm_24k)),
+        ("8k -> 24k, one block", 8000, lambda: audio.resample(pcm_8k, 8000, 24000)),
+        ("level, 20ms frames", 8000, lambda: [audio.level_dbfs(audio.ulaw_to_pcm(frame)) for frame in ulaw_frames]),
+    ]
+    if audioop:
+        cases += [
+            ("audioop ulaw2lin, 20ms frames", 8000, lambda: [audioop.ulaw2lin(frame, 2) for frame in ulaw_frames]),
+            ("audioop lin2ulaw, 20ms frames", 8000, lambda: [audioop.lin2ulaw(frame, 2) for frame in pcm_frames]),
+            ("audioop ratecv 8k -> 24k, 20ms", 8000, lambda: _ratecv_frames(audioop, pcm_frames)),
+        ]
+
+    print(f"Audio processing throughput, {seconds}s of 8kHz call audio (input samples)")
+    for name, rate, run in cases:
+        run()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        samples = seconds * rate
+        print(f"  {name:<32} {samples / elapsed / 1e6:>8.1f} M samples/s {seconds / elapsed:>10,.0f}x real time")
+
+
+def _ratecv_frames(audioop, pcm_frames):
+    state = None
+    for frame in pcm_frames:
+        _, state = audioop.ratecv(frame, 2, 1, 8000, 24000, state)
+
+
+def bench_workers(worker_counts, calls_per_worker: int, seconds: int):
+    """Concurrent calls spread over N worker processes sharing a SQLite call store."""
+    import httpx
+    import websockets
+    from twilio.request_validator import RequestValidator
+
+    from .call_store import SQLiteCallStore
+    from .fakes import FakeRealtimeServer
+    from .loadtest import free_port, spawn_worker, wait_until_ready, worker_env
+    from .sessions import CallContext
+
+    payload = base64.b64encode(b"\xff" * FRAME_BYTES).decode()
+
+    async def call(index: int, ports, store, http):
+        """Dial through the store, post a status to one worker and stream the call's audio to another."""
+        call_sid = f"CA{index:032d}"
+        await asyncio.to_thread(store.register, CallContext(call_sid=call_sid, prompt="Prompt", conversation_text="Hello"))
+        status_port, media_port = ports[(index + 1) % len(ports)], ports[index % len(ports)]
+        status = {"CallSid": call_sid, "CallStatus": "in-progress"}
+        signature = RequestValidator(env["TWILIO_AUTH_TOKEN"]).compute_signature(f"{env['SERVER_ENDPOINT']}/call-status", status)
+        await http.post(f"http://127.0.0.1:{status_port}/call-status", data=status, headers={"X-Twilio-Signature": signature})
+
+        first_audio = None
+        async with websockets.connect(f"ws://127.0.0.1:{media_port}/media-stream") as twilio_ws:
+            start = time.perf_counter()
+            await twilio_ws.send(json.dumps({"event": "start", "start": {"streamSid": STREAM_SID, "customParameters": {"callSid": call_sid}}}))
+
+            async def receive():
+                nonlocal first_audio
+                async for message in twilio_ws:
+                    event = json.loads(message)
+                    if event["event"] == "media" and first_audio is None:
+                        first_audio = time.perf_counter() - start
+                    elif event["event"] == "mark":
+                        await twilio_ws.send(message)
+
+            receiver = asyncio.create_task(receive())
+            late = 0
+            for frame in range(seconds * 50):
+                await twilio_ws.send(json.dumps({"event": "media", "media": {"timestamp": str(frame * 20), "payload": payload}}))
+                delay = start + (frame + 1) * 0.02 - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    late += 1
+            await twilio_ws.send(json.dumps({"event": "stop"}))
+            receiver.cancel()
+        return first_audio, late
+
+    async def run(workers: int, directory: str):
+        realtime = FakeRealtimeServer(connect_delay=0.05, first_audio_delay=0.2)
+        store_path = os.path.join(directory, f"calls-{workers}.db")
+        env = worker_env(store_path, await realtime.start())
+        ports = [free_port() for _ in range(workers)]
+        processes = [spawn_worker(port, env) for port in ports]
+        store = SQLiteCallStore(store_path)
+        try:
+            for port in ports:
+                await wait_until_ready(port)
+            async with httpx.AsyncClient() as http:
+                calls = workers * calls_per_worker
+                results = await asyncio.gather(*(call(index, ports, store, http) for index in range(calls)))
+            statuses = [store.get_status(f"CA{index:032d}") for index in range(calls)]
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            store.close()
+            await realtime.close()
+
+        first_audio = sorted(result[0] for result in results if result[0] is not None)
+        served = len(first_audio)
+        late = sum(result[1] for result in results) / (calls * seconds * 50)
+        p95 = first_audio[min(served - 1, int(served * 0.95))] if served else float("nan")
+        print(
+            f"  {workers} workers {calls:>5} calls   served {served:>5}   status shared {statuses.count('in-progress'):>5}   "
+            f"first audio p50 {statistics.median(first_audio) * 1000 if served else float('nan'):>6.0f}ms p95 {p95 * 1000:>6.0f}ms   "
+            f"late frames {late:.1%}"
+        )
+
+    print(f"Concurrent calls across workers, {calls_per_worker} calls per worker, {seconds}s each, {os.cpu_count()} CPUs")
+    print("Each call is registered in the store, its status posted to one worker and its media stream served by another")
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in worker_counts:
+            asyncio.run(run(workers, directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    media = subparsers.add_parser("media", help="Per-frame media forwarding cost")
+    media.add_argument("--frames", type=int, default=100_000)
+
+    codec = subparsers.add_parser("codec", help="Frame parsing and serialization cost per concurrent call")
+    codec.add_argument("--seconds", type=int, default=2000, help="Call-seconds of traffic to simulate")
+
+    aggregate = subparsers.add_parser("aggregate", help="Inbound audio chunking: messages, CPU and added latency")
+    aggregate.add_argument("--seconds", type=int, default=600, help="Call-seconds of audio to simulate")
+
+    first_word = subparsers.add_parser("first-word", help="Time to first word with and without pre-warmed realtime sessions")
+    first_word.add_argument("--calls", type=int, default=5)
+    first_word.add_argument("--ring-seconds", type=float, default=2.0, help="Time the call rings before it is answered")
+    first_word.add_argument("--connect-delay", type=float, default=0.3, help="Fake realtime API handshake latency")
+    first_word.add_argument("--first-audio-delay", type=float, default=0.4, help="Fake realtime API time to first audio delta")
+
+    record = subparsers.add_parser("record", help="Concurrent call recording in real time")
+    record.add_argument("--calls", type=int, default=200)
+    record.add_argument("--seconds", type=int, default=5)
+
+    audio_parser = subparsers.add_parser("audio", help="u-law codec, resampler and level meter throughput")
+    audio_parser.add_argument("--seconds", type=int, default=60, help="Seconds of audio to process")
+
+    workers = subparsers.add_parser("workers", help="Concurrent calls across worker processes sharing the call store")
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    workers.add_argument("--calls-per-worker", type=int, default=25)
+    workers.add_argument("--seconds", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.benchmark == "media":
+        bench_media(args.frames)
+    elif args.benchmark == "codec":
+        bench_codec(args.seconds)
+    elif args.benchmark == "aggregate":
+        bench_aggregate(args.seconds)
+    elif args.benchmark == "first-word":
+        bench_first_word(args.calls, args.ring_seconds, args.connect_delay, args.first_audio_delay)
+    elif args.benchmark == "record":
+        bench_record(args.calls, args.seconds)
+    elif args.benchmark == "audio":
+        bench_audio(args.seconds)
+    elif args.benchmark == "workers":
+        bench_workers(args.workers, args.calls_per_worker, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
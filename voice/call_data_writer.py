@@ -0,0 +1,177 @@
+"""
+Write-behind persistence of call data (status and transcripts).
+
+Firestore writes are blocking network calls. Running them inside the media stream handlers
+stalls audio forwarding for every call on the worker, so updates are queued here instead,
+coalesced per call SID and written on a dedicated thread pool every `flush_interval` seconds.
+Only transcript entries added since the last write are sent. A failed write is queued again and
+retried with exponential backoff, and only dropped once its retries are used up.
+"""
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from agents import firebase
+from integrations.metrics import REGISTRY
+
+PENDING_CALLS = REGISTRY.gauge("call_data_pending_calls", "Calls with call data updates waiting to be written")
+WRITE_LAG = REGISTRY.histogram("call_data_write_lag_seconds", "Time from the oldest queued update of a call to its write completing")
+WRITES = REGISTRY.counter("call_data_writes_total", "Coalesced call data writes")
+WRITE_ERRORS = REGISTRY.counter("call_data_write_errors_total", "Call data writes that failed")
+WRITES_DROPPED = REGISTRY.counter("call_data_writes_dropped_total", "Call data writes dropped after their retries were used up")
+
+
+class _PendingWrite:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.fields: Dict = {}
+        self.transcripts: List[Dict] = []
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.retry_at = 0.0
+
+    def merge(self, newer: "_PendingWrite"):
+        """Fold in updates queued while this write was in flight, keeping their order."""
+        self.transcripts.extend(newer.transcripts)
+        self.fields.update(newer.fields)
+
+
+class CallDataWriter:
+    """Coalescing, write-behind persister for call documents."""
+
+    def __init__(
+        self,
+        flush_interval: float = 0.25,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        retry_delay: float = 0.5,
+        write: Callable[[str, str, List[Dict], Dict], None] = firebase.append_call_transcripts,
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            flush_interval: Seconds between background flushes
+            max_workers: Threads used for the blocking writes
+            max_retries: Times a failed write is retried before its updates are dropped
+            retry_delay: Seconds before the first retry, doubled on each further failure
+            write: Blocking write function taking (user_id, call_sid, new transcripts, fields)
+        """
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._write = write
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="call-data-writer")
+        self._pending: Dict[str, _PendingWrite] = {}
+        self._sequences: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    def update(self, user_id: str, call_sid: str, fields: Dict):
+        """Queue fields to merge into the call document. Later values for a field replace earlier ones."""
+        self._pending_write(user_id, call_sid).fields.update(fields)
+
+    def append_transcript(self, user_id: str, call_sid: str, role: str, message: str, fields: Optional[Dict] = None):
+        """Queue a transcript entry, numbered so repeated identical utterances stay distinct."""
+        pending = self._pending_write(user_id, call_sid)
+        sequence = self._sequences.get(call_sid, 0)
+        self._sequences[call_sid] = sequence + 1
+        pending.transcripts.append({"seq": sequence, "role": role, "message": message})
+        if fields:
+            pending.fields.update(fields)
+
+    async def flush(self, call_sid: Optional[str] = None, due_only: bool = False):
+        """
+        Write queued updates now, for one call (e.g. on hangup) or for all calls.
+
+        Args:
+            call_sid: The call to write, all calls if None
+            due_only: Leave calls whose failed write is still backing off queued
+        """
+        async with self._lock():
+            if call_sid is None:
+                now = time.monotonic()
+                batch = {sid: pending for sid, pending in self._pending.items() if not due_only or pending.retry_at <= now}
+                for sid in batch:
+                    del self._pending[sid]
+            else:
+                pending = self._pending.pop(call_sid, None)
+                batch = {call_sid: pending} if pending else {}
+            loop = asyncio.get_running_loop()
+            written = await asyncio.gather(*(
+                loop.run_in_executor(self._executor, self._write_call, call_sid, pending)
+                for call_sid, pending in batch.items()
+            ))
+            for (call_sid, pending), ok in zip(batch.items(), written):
+                if not ok:
+                    self._retry_later(call_sid, pending)
+            PENDING_CALLS.set(len(self._pending))
+
+    def finish_call(self, call_sid: str):
+        """Forget per-call bookkeeping once a call's data has been flushed."""
+        self._sequences.pop(call_sid, None)
+
+    def flush_threadsafe(self, call_sid: str, timeout: float = 5):
+        """Flush a call's queued updates from a thread outside the event loop, e.g. before reading the call data."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.flush(call_sid), self._loop).result(timeout)
+        except Exception as e:
+            print(f"Error flushing call data for {call_sid}: {e}")
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    def _lock(self) -> asyncio.Lock:
+        # Writes are serialized so a hangup flush never overtakes an older in-flight batch for the same call
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    def _pending_write(self, user_id: str, call_sid: str) -> _PendingWrite:
+        if self._flush_task is None or self._flush_task.done():
+            self._loop = asyncio.get_running_loop()
+            self._flush_task = self._loop.create_task(self._flush_periodically())
+        pending = self._pending.get(call_sid)
+        if pending is None:
+            pending = self._pending[call_sid] = _PendingWrite(user_id)
+            PENDING_CALLS.set(len(self._pending))
+        return pending
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._pending:
+                await self.flush(due_only=True)
+
+    def _retry_later(self, call_sid: str, pending: _PendingWrite):
+        pending.attempts += 1
+        if pending.attempts > self.max_retries:
+            WRITES_DROPPED.inc()
+            print(f"Dropping call data for {call_sid} after {pending.attempts} failed writes")
+            return
+        pending.retry_at = time.monotonic() + self.retry_delay * 2 ** (pending.attempts - 1)
+        # Updates queued during the failed write go after it, so transcripts stay in order
+        newer = self._pending.get(call_sid)
+        if newer is not None:
+            pending.merge(newer)
+        self._pending[call_sid] = pending
+
+    def _write_call(self, call_sid: str, pending: _PendingWrite) -> bool:
+        """Write a call's queued updates, True if they were written."""
+        try:
+            self._write(pending.user_id, call_sid, pending.transcripts, pending.fields)
+        except Exception as e:
+            WRITE_ERRORS.inc()
+            print(f"Error writing call data for {call_sid}: {e}")
+            return False
+        WRITES.inc()
+        WRITE_LAG.observe(time.monotonic() - pending.enqueued_at)
+        return True
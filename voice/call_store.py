@@ -0,0 +1,230 @@
+"""
+Shared store of call state: each call's context and its latest Twilio status.
+
+A call is dialed by one worker, but Twilio's status callbacks and the `/media-stream`
+WebSocket can land on any worker behind the load balancer. Keeping call state in the
+store instead of process memory lets any worker serve any call.
+
+- `InMemoryCallStore`: one process only, the default (`CALL_STORE=memory`).
+- `SQLiteCallStore`: a SQLite file shared by all workers on one host (`CALL_STORE=sqlite`).
+  Replicas on several hosts need a store on the network implementing the same methods.
+
+What stays per process: pre-warmed realtime sessions (a media stream landing on another
+worker opens its own session) and the futures of `wait_for_call_completion`, which fall
+back to polling a shared store for statuses posted to other workers. Chat sessions, rate
+limits, metrics and the call data writer are per process too, so the server still runs as
+a single worker; the SQLite store is a building block for more.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+from .sessions import CallContext
+
+CALL_CONTEXT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_DB_PATH = os.getenv("CALL_STORE_PATH", "./voice/call_store.db")
+
+
+class CallStore:
+    """Call contexts and statuses by call SID. Entries expire `ttl_seconds` after the call was dialed."""
+
+    # Whether other processes write to the store, so statuses can change without this process seeing a callback
+    shared = False
+
+    def __init__(self, ttl_seconds: float = CALL_CONTEXT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    def register(self, context: CallContext) -> CallContext:
+        """Store a call's context, replacing an earlier version of it."""
+        raise NotImplementedError
+
+    def get(self, call_sid: Optional[str]) -> Optional[CallContext]:
+        raise NotImplementedError
+
+    def update(self, call_sid: str, fields: Dict) -> Optional[CallContext]:
+        """
+        Set some fields of a call's context, leaving fields another worker changed meanwhile alone.
+
+        Returns:
+            The updated context, or None if the call isn't registered
+        """
+        raise NotImplementedError
+
+    def remove(self, call_sid: str) -> Optional[CallContext]:
+        raise NotImplementedError
+
+    def set_status(self, call_sid: str, status: str):
+        """Record the latest status Twilio reported for a call."""
+        raise NotImplementedError
+
+    def get_status(self, call_sid: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InMemoryCallStore(CallStore):
+    """Thread-safe in-process store, for a single worker."""
+
+    def __init__(self, ttl_seconds: float = CALL_CONTEXT_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self._contexts: Dict[str, CallContext] = {}
+        self._statuses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def register(self, context: CallContext) -> CallContext:
+        with self._lock:
+            self._prune()
+            self._contexts[context.call_sid] = context
+        return context
+
+    def get(self, call_sid: Optional[str]) -> Optional[CallContext]:
+        if not call_sid:
+            return None
+        return self._contexts.get(call_sid)
+
+    def update(self, call_sid: str, fields: Dict) -> Optional[CallContext]:
+        with self._lock:
+            context = self._contexts.get(call_sid)
+            if context is not None:
+                for name, value in fields.items():
+                    setattr(context, name, value)
+        return context
+
+    def remove(self, call_sid: str) -> Optional[CallContext]:
+        with self._lock:
+            self._statuses.pop(call_sid, None)
+            return self._contexts.pop(call_sid, None)
+
+    def set_status(self, call_sid: str, status: str):
+        self._statuses[call_sid] = status
+
+    def get_status(self, call_sid: str) -> Optional[str]:
+        return self._statuses.get(call_sid)
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        for call_sid in [sid for sid, context in self._contexts.items() if context.created_at < cutoff]:
+            del self._contexts[call_sid]
+            self._statuses.pop(call_sid, None)
+
+
+class SQLiteCallStore(CallStore):
+    """
+    Store in a SQLite file, shared by the worker processes of one host.
+
+    Each process opens its own connection. WAL mode lets readers proceed while another
+    worker writes, and writes wait up to `busy_timeout` for the file lock.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl_seconds: float = CALL_CONTEXT_TTL_SECONDS, busy_timeout: float = 5.0):
+        """
+        Initialize the store.
+
+        Args:
+            db_path: SQLite file shared by the workers
+            ttl_seconds: Age after which a call's entry is deleted
+            busy_timeout: Seconds a write waits for another worker's write to finish
+        """
+        super().__init__(ttl_seconds)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Call state can be rebuilt from Twilio, losing the last writes on power loss is fine
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS calls (
+                call_sid TEXT PRIMARY KEY,
+                context TEXT,
+                status TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._last_prune = 0.0
+
+    def register(self, context: CallContext) -> CallContext:
+        with self._lock:
+            self._prune()
+            self._db.execute(
+                "INSERT INTO calls (call_sid, context, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (call_sid) DO UPDATE SET context = excluded.context",
+                (context.call_sid, context.model_dump_json(), context.created_at),
+            )
+        return context
+
+    def get(self, call_sid: Optional[str]) -> Optional[CallContext]:
+        if not call_sid:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT context FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return CallContext.model_validate_json(row[0]) if row and row[0] else None
+
+    def update(self, call_sid: str, fields: Dict) -> Optional[CallContext]:
+        with self._lock:
+            # The write lock is taken before reading, so no other worker's update lands in between
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                context = self.get(call_sid)
+                if context is not None:
+                    context = context.model_copy(update=fields)
+                    self._db.execute("UPDATE calls SET context = ? WHERE call_sid = ?", (context.model_dump_json(), call_sid))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return context
+
+    def remove(self, call_sid: str) -> Optional[CallContext]:
+        with self._lock:
+            context = self.get(call_sid)
+            self._db.execute("DELETE FROM calls WHERE call_sid = ?", (call_sid,))
+        return context
+
+    def set_status(self, call_sid: str, status: str):
+        # A status callback can arrive before the dialing worker has registered the call
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO calls (call_sid, status, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (call_sid) DO UPDATE SET status = excluded.status",
+                (call_sid, status, time.time()),
+            )
+
+    def get_status(self, call_sid: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT status FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM calls WHERE context IS NOT NULL").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _prune(self):
+        # At most once a minute, every worker shares the work
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        self._db.execute("DELETE FROM calls WHERE created_at < ?", (now - self.ttl_seconds,))
+
+
+def create_call_store(kind: str = "memory", db_path: str = DEFAULT_DB_PATH) -> CallStore:
+    """The store configured by `CALL_STORE`: "memory" or "sqlite"."""
+    if kind == "memory":
+        return InMemoryCallStore()
+    if kind == "sqlite":
+        return SQLiteCallStore(db_path)
+    raise ValueError(f"Unknown call store: {kind}")
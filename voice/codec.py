@@ -0,0 +1,158 @@
+"""
+WebSocket frame codec for the media stream.
+
+Every call exchanges ~50 frames per second in each direction, almost all of them audio.
+The codec classifies a frame from its first bytes and pulls the few fields the hot path
+needs out of `media` frames and `response.audio.delta` events with plain string searches,
+so they never materialize a dict. Everything else is parsed in full, with orjson when it
+is installed.
+"""
+
+import os
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonBackend:
+    """Standard library json."""
+
+    name = "json"
+
+    @staticmethod
+    def loads(text: str) -> Any:
+        return json.loads(text)
+
+    @staticmethod
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+
+class OrjsonBackend:
+    """orjson, several times faster than the standard library."""
+
+    name = "orjson"
+
+    @staticmethod
+    def loads(text: str) -> Any:
+        return orjson.loads(text)
+
+    @staticmethod
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+
+def get_backend(name: Optional[str] = None):
+    """
+    Pick the JSON backend.
+
+    Args:
+        name: "orjson" or "json". Defaults to the VOICE_JSON_BACKEND env var, then orjson when installed.
+    """
+    name = name or os.getenv("VOICE_JSON_BACKEND")
+    if name == "json" or (name is None and orjson is None):
+        return JsonBackend
+    if orjson is None:
+        print("Warning: orjson not installed, falling back to json")
+        return JsonBackend
+    return OrjsonBackend
+
+
+class TwilioFrame:
+    """
+    An inbound Twilio frame. `media` frames carry `payload` and `timestamp` and are only
+    parsed in full if `data` is accessed; other events are parsed up front.
+    """
+
+    __slots__ = ("event", "payload", "timestamp", "_text", "_data", "_backend")
+
+    def __init__(self, event: str, text: str, backend, payload: Optional[str] = None, timestamp: Optional[int] = None, data: Optional[Dict] = None):
+        self.event = event
+        self.payload = payload
+        self.timestamp = timestamp
+        self._text = text
+        self._data = data
+        self._backend = backend
+
+    @property
+    def data(self) -> Dict:
+        if self._data is None:
+            self._data = self._backend.loads(self._text)
+        return self._data
+
+
+class RealtimeEvent:
+    """
+    An OpenAI realtime event. `response.audio.delta` events carry `delta` and `item_id`
+    and are only parsed in full if `data` is accessed; other events are parsed up front.
+    """
+
+    __slots__ = ("type", "delta", "item_id", "_text", "_data", "_backend")
+
+    def __init__(self, type: str, text: str, backend, delta: Optional[str] = None, item_id: Optional[str] = None, data: Optional[Dict] = None):
+        self.type = type
+        self.delta = delta
+        self.item_id = item_id
+        self._text = text
+        self._data = data
+        self._backend = backend
+
+    @property
+    def data(self) -> Dict:
+        if self._data is None:
+            self._data = self._backend.loads(self._text)
+        return self._data
+
+
+def _string_field(text: str, key: str, start: int = 0) -> Optional[str]:
+    """Value of a string field `"key":"value"` in compact JSON, or None if absent."""
+    index = text.find(key, start)
+    if index < 0:
+        return None
+    index += len(key)
+    end = text.find('"', index)
+    return text[index:end] if end >= 0 else None
+
+
+_TWILIO_MEDIA_PREFIX = '{"event":"media"'
+_REALTIME_AUDIO_DELTA_PREFIX = '{"type":"response.audio.delta"'
+
+
+class FrameCodec:
+    """Decodes inbound frames and encodes non-templated outbound ones."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+
+    def decode_twilio(self, text: str) -> TwilioFrame:
+        if text.startswith(_TWILIO_MEDIA_PREFIX):
+            payload = _string_field(text, '"payload":"')
+            timestamp = _string_field(text, '"timestamp":"')
+            # Base64 payloads never contain quotes or escapes, so the search is exact
+            if payload is not None and timestamp is not None and timestamp.isdigit():
+                return TwilioFrame("media", text, self.backend, payload=payload, timestamp=int(timestamp))
+        data = self.backend.loads(text)
+        frame = TwilioFrame(data.get("event"), text, self.backend, data=data)
+        if frame.event == "media":
+            frame.payload = data["media"]["payload"]
+            frame.timestamp = int(data["media"]["timestamp"])
+        return frame
+
+    def decode_realtime(self, text: str) -> RealtimeEvent:
+        if text.startswith(_REALTIME_AUDIO_DELTA_PREFIX):
+            delta = _string_field(text, '"delta":"')
+            if delta is not None:
+                return RealtimeEvent("response.audio.delta", text, self.backend, delta=delta, item_id=_string_field(text, '"item_id":"'))
+        data = self.backend.loads(text)
+        event = RealtimeEvent(data.get("type"), text, self.backend, data=data)
+        if event.type == "response.audio.delta":
+            event.delta = data.get("delta")
+            event.item_id = data.get("item_id")
+        return event
+
+    def encode(self, obj: Any) -> str:
+        return self.backend.dumps(obj)
@@ -0,0 +1,211 @@
+"""
+Local fakes of the external services the voice server talks to, for tests and benchmarks.
+"""
+
+import json
+import time
+import base64
+import asyncio
+import itertools
+import threading
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import websockets
+
+
+# Shared by all fake clients, so calls of one test never pick up state left by another's
+_call_sids = itertools.count()
+
+
+class FakeTwilioClient:
+    """
+    Stand-in for `twilio.rest.Client` covering the calls API used by the voice server.
+
+    Each created call walks through a scripted list of statuses on a timer, and every
+    transition is reported to `status_callback` the way Twilio posts to the status
+    callback URL. Swap it in with `voice_server.twilio_client = FakeTwilioClient(...)`.
+    """
+
+    DEFAULT_SCRIPT = ["initiated", "ringing", "in-progress", "completed"]
+
+    def __init__(
+        self,
+        status_callback: Callable[[str, str], None],
+        scripts: Optional[Dict[str, List[str]]] = None,
+        step_seconds: float = 0.05,
+    ):
+        """
+        Initialize the fake client.
+
+        Args:
+            status_callback: Called with (call_sid, status) for every status transition,
+                             e.g. `voice_server.resolve_call_status` or a function posting to `/call-status`
+            scripts: Status sequence per destination number, DEFAULT_SCRIPT for others
+            step_seconds: Delay between status transitions
+        """
+        self.status_callback = status_callback
+        self.scripts = scripts or {}
+        self.step_seconds = step_seconds
+        self.created: List[Dict] = []
+        self.updates: List[Dict] = []
+        self.statuses: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.calls = _FakeCalls(self)
+
+    def _advance(self, call_sid: str, remaining: List[str]):
+        with self._lock:
+            if not remaining or self.statuses.get(call_sid) in ("completed", "canceled"):
+                return
+            status = remaining[0]
+            self.statuses[call_sid] = status
+        self.status_callback(call_sid, status)
+        if len(remaining) > 1:
+            timer = threading.Timer(self.step_seconds, self._advance, args=(call_sid, remaining[1:]))
+            timer.daemon = True
+            timer.start()
+
+
+class _FakeCalls:
+    def __init__(self, client: FakeTwilioClient):
+        self._client = client
+
+    def create(self, to: str, from_: str, url: str, **kwargs):
+        call_sid = f"CA{next(_call_sids):032d}"
+        self._client.created.append({"sid": call_sid, "to": to, "from_": from_, "url": url, **kwargs})
+        script = self._client.scripts.get(to, FakeTwilioClient.DEFAULT_SCRIPT)
+        self._client.statuses[call_sid] = "queued"
+        timer = threading.Timer(self._client.step_seconds, self._client._advance, args=(call_sid, list(script)))
+        timer.daemon = True
+        timer.start()
+        return SimpleNamespace(sid=call_sid, status="queued")
+
+    def __call__(self, call_sid: str):
+        return _FakeCall(self._client, call_sid)
+
+
+class _FakeCall:
+    def __init__(self, client: FakeTwilioClient, call_sid: str):
+        self._client = client
+        self.sid = call_sid
+
+    def fetch(self):
+        return SimpleNamespace(sid=self.sid, status=self._client.statuses.get(self.sid))
+
+    def update(self, status: str, **kwargs):
+        self._client.updates.append({"sid": self.sid, "status": status, **kwargs})
+        with self._client._lock:
+            self._client.statuses[self.sid] = status
+        self._client.status_callback(self.sid, status)
+        return self.fetch()
+
+
+class FakeRealtimeServer:
+    """
+    Local stand-in for the OpenAI realtime WebSocket API.
+
+    Answers `session.update` and `conversation.item.create`, and replies to `response.create`
+    with `first_audio_delay` seconds of silence before streaming `audio_frames` 20ms audio
+    deltas and a `response.done` carrying `transcript`. `connect_delay` is added to every
+    handshake, standing in for the network and TLS round trips of a real connection.
+    Point the voice server at it with `OPENAI_REALTIME_URL=server.url`.
+
+    With `turn_ms` set, the caller is scripted too: after every `turn_ms` of appended audio
+    the server sends `speech_started`, `speech_stopped`, an input transcription carrying
+    `input_transcript`, and then a response, the way server VAD ends a caller's turn.
+    `audio_arrivals` keeps, per session (keyed by its instructions), the time and running
+    byte count of every audio append, for measuring how late the caller's audio arrived.
+    """
+
+    def __init__(
+        self,
+        connect_delay: float = 0.3,
+        first_audio_delay: float = 0.4,
+        audio_frames: int = 25,
+        transcript: str = "Hello!",
+        turn_ms: Optional[int] = None,
+        input_transcript: str = "How much for a two bedroom move?",
+    ):
+        self.connect_delay = connect_delay
+        self.first_audio_delay = first_audio_delay
+        self.audio_frames = audio_frames
+        self.transcript = transcript
+        self.turn_ms = turn_ms
+        self.input_transcript = input_transcript
+        self.url: Optional[str] = None
+        self.connections = 0
+        self.received: List[Dict] = []
+        self.audio_bytes_received = 0
+        self.audio_arrivals: Dict[str, List[Tuple[float, int]]] = {}
+        self._server = None
+        self._responses = itertools.count()
+
+    async def start(self) -> str:
+        self._server = await websockets.serve(self._handle, "127.0.0.1", 0, process_request=self._delay_handshake)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self.url
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _delay_handshake(self, path, request_headers):
+        await asyncio.sleep(self.connect_delay)
+        return None
+
+    async def _handle(self, websocket, path=None):
+        self.connections += 1
+        await self._send(websocket, {"type": "session.created", "event_id": "event_0"})
+        responses = []
+        arrivals: List[Tuple[float, int]] = []
+        audio_bytes = 0
+        try:
+            async for message in websocket:
+                event = json.loads(message)
+                if event["type"] == "input_audio_buffer.append":
+                    received = len(base64.b64decode(event["audio"]))
+                    self.audio_bytes_received += received
+                    audio_bytes += received
+                    arrivals.append((time.perf_counter(), audio_bytes))
+                    # 8 bytes per ms of u-law
+                    if self.turn_ms and audio_bytes // (8 * self.turn_ms) > (audio_bytes - received) // (8 * self.turn_ms):
+                        responses.append(asyncio.create_task(self._end_turn(websocket)))
+                    continue
+                self.received.append(event)
+                if event["type"] == "session.update":
+                    self.audio_arrivals[event["session"].get("instructions", "")] = arrivals
+                    await self._send(websocket, {"type": "session.updated", "session": event["session"]})
+                elif event["type"] == "conversation.item.create":
+                    await self._send(websocket, {"type": "conversation.item.created", "item": event["item"]})
+                elif event["type"] == "response.create":
+                    responses.append(asyncio.create_task(self._respond(websocket)))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for response in responses:
+                response.cancel()
+
+    async def _end_turn(self, websocket):
+        item_id = f"input_{next(self._responses)}"
+        await self._send(websocket, {"type": "input_audio_buffer.speech_started", "item_id": item_id})
+        await self._send(websocket, {"type": "input_audio_buffer.speech_stopped", "item_id": item_id})
+        await self._send(websocket, {"type": "conversation.item.input_audio_transcription.completed", "item_id": item_id, "transcript": self.input_transcript})
+        await self._respond(websocket)
+
+    async def _respond(self, websocket):
+        item_id = f"item_{next(self._responses)}"
+        await asyncio.sleep(self.first_audio_delay)
+        # 20ms of u-law silence per delta
+        delta = base64.b64encode(b"\xff" * 160).decode()
+        for _ in range(self.audio_frames):
+            await self._send(websocket, {"type": "response.audio.delta", "item_id": item_id, "delta": delta})
+        await self._send(websocket, {
+            "type": "response.done",
+            "response": {"output": [{"id": item_id, "role": "assistant", "content": [{"type": "audio", "transcript": self.transcript}]}]},
+        })
+
+    @staticmethod
+    async def _send(websocket, event: Dict):
+        await websocket.send(json.dumps(event, separators=(",", ":")))
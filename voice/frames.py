@@ -0,0 +1,49 @@
+"""
+Builders for the per-frame messages on the media hot path.
+
+Audio is forwarded between Twilio and the OpenAI realtime API as the base64 payload
+strings both sides already use, so no frame is ever decoded or re-encoded. The messages
+have a fixed shape and their variable parts (stream SIDs, base64 payloads, mark names
+we choose) never need JSON escaping, so they are rendered from string templates instead
+of going through a JSON encoder.
+"""
+
+from collections import deque
+from typing import Deque, Optional
+
+
+def input_audio_append(payload: str) -> str:
+    """OpenAI realtime message appending a Twilio media payload to the input buffer."""
+    return '{"type":"input_audio_buffer.append","audio":"' + payload + '"}'
+
+
+def twilio_media(stream_sid: str, payload: str) -> str:
+    """Twilio media message playing an OpenAI audio delta to the caller."""
+    return '{"event":"media","streamSid":"' + stream_sid + '","media":{"payload":"' + payload + '"}}'
+
+
+def twilio_mark(stream_sid: str, name: str) -> str:
+    """Twilio mark message, echoed back by Twilio once playback reaches it."""
+    return '{"event":"mark","streamSid":"' + stream_sid + '","mark":{"name":"' + name + '"}}'
+
+
+def twilio_clear(stream_sid: str) -> str:
+    """Twilio clear message, dropping any audio buffered for playback."""
+    return '{"event":"clear","streamSid":"' + stream_sid + '"}'
+
+
+class AudioRetention:
+    """
+    Opt-in, bounded retention of the most recent inbound audio payloads.
+
+    Keeps the base64 payload strings as received (no decoding), dropping the oldest
+    once `max_frames` is reached. Disabled when `max_frames` is 0.
+    """
+
+    def __init__(self, max_frames: int = 0):
+        self.max_frames = max_frames
+        self.frames: Optional[Deque[str]] = deque(maxlen=max_frames) if max_frames > 0 else None
+
+    def append(self, payload: str):
+        if self.frames is not None:
+            self.frames.append(payload)
@@ -0,0 +1,155 @@
+"""
+Cache of pre-rendered greeting audio.
+
+Every call opens with the model speaking a greeting generated from the call's conversation
+text, and the callee waits for that generation on every call although the greeting hardly
+changes between calls. The first call with a given conversation text, customer, voice and
+audio format records the greeting audio and its transcript. Later calls stream the recording to
+Twilio as soon as the media stream starts, and only seed the realtime conversation with the
+transcript so the model knows what it already said. The greeting may name the customer, so a
+recording is only replayed to calls made for the same customer. The negotiation strategy in the
+session instructions changes between calls but not the opening, it is left out of the key.
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from integrations.metrics import REGISTRY
+
+DEFAULT_CACHE_DIR = os.getenv("GREETING_CACHE_DIR", "./voice/greeting_cache")
+FRAME_BYTES = 160  # 20ms of 8kHz g711 u-law
+
+GREETING_LOOKUPS = REGISTRY.counter("greeting_cache_lookups_total", "Greeting cache lookups, by result")
+
+
+def normalize_greeting(text: str) -> str:
+    """Unicode-normalize and collapse whitespace, so trivially different templates share a recording."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def greeting_key(text: str, customer: Optional[str], voice: str, audio_format: str) -> str:
+    key = f"{normalize_greeting(text)}\x00{normalize_greeting(customer).casefold()}\x00{voice}\x00{audio_format}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class CachedGreeting(BaseModel):
+    """A recorded greeting"""
+    key: str = Field(description="Cache key of the greeting")
+    text: str = Field(description="Normalized conversation text the greeting was generated from")
+    transcript: str = Field(description="What the assistant said in the recording")
+    voice: str = Field(description="Realtime API voice of the recording")
+    audio_format: str = Field(description="Realtime API audio format of the recording")
+    created_at: float = Field(default_factory=time.time, description="Unix time the greeting was recorded")
+
+    _audio: bytes = PrivateAttr(default=b"")
+    _frames: Optional[List[str]] = PrivateAttr(default=None)
+
+    @property
+    def audio(self) -> bytes:
+        return self._audio
+
+    def frames(self) -> List[str]:
+        """The audio as base64 20ms frames, ready for Twilio media messages."""
+        if self._frames is None:
+            self._frames = [
+                base64.b64encode(self._audio[start:start + FRAME_BYTES]).decode()
+                for start in range(0, len(self._audio), FRAME_BYTES)
+            ]
+        return self._frames
+
+
+class GreetingCache:
+    """Greeting recordings on disk, `<key>.ulaw` audio next to `<key>.json` metadata, with an in-memory copy."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._greetings: Dict[str, CachedGreeting] = {}
+        self._lock = threading.Lock()
+
+    def get(self, text: str, customer: Optional[str], voice: str, audio_format: str) -> Optional[CachedGreeting]:
+        """The greeting recorded for a conversation text and customer. Blocking file I/O on a miss, run it off the event loop."""
+        greeting = self.load(greeting_key(text, customer, voice, audio_format))
+        GREETING_LOOKUPS.inc(result="hit" if greeting else "miss")
+        return greeting
+
+    def load(self, key: str) -> Optional[CachedGreeting]:
+        """Look a greeting up by its key, reading it from disk the first time."""
+        greeting = self._greetings.get(key)
+        if greeting is not None:
+            return greeting
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(f"{path}.json") as f:
+                greeting = CachedGreeting(**json.load(f))
+            with open(f"{path}.ulaw", "rb") as f:
+                greeting._audio = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading cached greeting {key}: {e}")
+            return None
+        with self._lock:
+            return self._greetings.setdefault(key, greeting)
+
+    def put(self, text: str, customer: Optional[str], voice: str, audio_format: str, audio: bytes, transcript: str) -> CachedGreeting:
+        """Record a greeting. Blocking file I/O, run it off the event loop."""
+        key = greeting_key(text, customer, voice, audio_format)
+        greeting = CachedGreeting(key=key, text=normalize_greeting(text), transcript=transcript, voice=voice, audio_format=audio_format)
+        greeting._audio = audio
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, key)
+        # Audio first, metadata last: a greeting is only visible once both are complete
+        for suffix, content, mode in ((".ulaw", audio, "wb"), (".json", greeting.model_dump_json(), "w")):
+            temp_path = f"{path}{suffix}.{os.getpid()}.tmp"
+            with open(temp_path, mode) as f:
+                f.write(content)
+            os.replace(temp_path, f"{path}{suffix}")
+
+        with self._lock:
+            self._greetings[key] = greeting
+        print(f"Cached greeting {key[:12]}: {transcript}")
+        return greeting
+
+
+class GreetingRecorder:
+    """Collects the audio of a call's live-generated greeting, the first response of the call."""
+
+    def __init__(self):
+        self.item_id: Optional[str] = None
+        self.deltas: List[str] = []
+        self.abandoned = False
+
+    def add(self, item_id: Optional[str], delta: str):
+        if self.item_id is None:
+            self.item_id = item_id
+        if item_id == self.item_id:
+            self.deltas.append(delta)
+
+    def abandon(self):
+        """The greeting was interrupted, the recording is incomplete."""
+        self.abandoned = True
+
+    def finish(self, response: Dict) -> Optional[tuple]:
+        """
+        Complete the recording from the greeting's `response.done` event.
+
+        Returns:
+            (audio, transcript), or None if the recording is unusable
+        """
+        if self.abandoned or not self.deltas or response.get("status", "completed") != "completed":
+            return None
+        for item in response.get("output", []):
+            if item.get("id", self.item_id) == self.item_id and item.get("role") == "assistant":
+                transcript = " ".join(content["transcript"] for content in item.get("content", []) if content.get("transcript"))
+                if transcript:
+                    return b"".join(base64.b64decode(delta) for delta in self.deltas), transcript
+        return None
@@ -0,0 +1,136 @@
+"""
+Conversational latency measurements for one call.
+
+Every measurement goes to a process-wide histogram and into a per-call summary stored
+with the call data, so a slow call can be looked at on its own:
+
+- first audio: media stream start to the first audio frame sent to the caller
+- turn gap: OpenAI's `speech_stopped` to the first audio delta of the reply (upstream)
+- forward: receiving that first delta to having sent it to Twilio (us)
+- mark round trip: sending a mark to Twilio echoing it, i.e. playback lag on the Twilio side
+- barge-in: OpenAI's `speech_started` to the caller's playback being cleared
+- frames in/out, and outbound frames dropped unplayed by a barge-in
+"""
+
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from integrations.metrics import REGISTRY
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+FIRST_AUDIO = REGISTRY.histogram("voice_first_audio_seconds", "Media stream start to the first audio sent to the caller", LATENCY_BUCKETS)
+TURN_GAP = REGISTRY.histogram("voice_turn_gap_seconds", "Caller stopped speaking to the first audio delta of the reply", LATENCY_BUCKETS)
+FORWARD = REGISTRY.histogram("voice_forward_seconds", "First audio delta of a reply received to sent to Twilio", LATENCY_BUCKETS)
+MARK_ROUND_TRIP = REGISTRY.histogram("voice_mark_round_trip_seconds", "Mark sent to Twilio to its echo", LATENCY_BUCKETS)
+BARGE_IN = REGISTRY.histogram("voice_barge_in_seconds", "Caller started speaking to the assistant's audio being cleared", LATENCY_BUCKETS)
+FRAMES = REGISTRY.counter("voice_frames_total", "Media frames by direction: in, out, and out frames dropped unplayed on barge-in")
+
+# Mark round trips kept per call for the summary
+MAX_MARK_SAMPLES = 2048
+
+
+def _summarize(samples) -> Optional[Dict]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class CallLatency:
+    """Latency tracker of one media stream, fed from `handle_media_stream`."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.started_at = clock()
+        self.frames_in = 0
+        self.frames_out = 0
+        self.frames_dropped = 0
+        self.first_audio: Optional[float] = None
+        self.turn_gaps: List[float] = []
+        self.forwards: List[float] = []
+        self.barge_ins: List[float] = []
+        self.mark_round_trips: Deque[float] = deque(maxlen=MAX_MARK_SAMPLES)
+        self._marks_sent: Deque[float] = deque()
+        self._cleared_marks = 0
+        self._speech_stopped_at: Optional[float] = None
+        self._awaiting_reply = False
+
+    def frame_in(self):
+        self.frames_in += 1
+
+    def frames_sent(self, count: int = 1):
+        """Audio frames sent to the caller."""
+        if self.first_audio is None:
+            self.first_audio = self._clock() - self.started_at
+            FIRST_AUDIO.observe(self.first_audio)
+        self.frames_out += count
+
+    def speech_stopped(self):
+        self._speech_stopped_at = self._clock()
+        self._awaiting_reply = True
+
+    def reply_delta(self, received_at: float):
+        """The first audio delta of a reply was received at `received_at` and has just been sent to Twilio."""
+        if not self._awaiting_reply:
+            return
+        self._awaiting_reply = False
+        forward = self._clock() - received_at
+        self.forwards.append(forward)
+        FORWARD.observe(forward)
+        if self._speech_stopped_at is not None:
+            gap = received_at - self._speech_stopped_at
+            self.turn_gaps.append(gap)
+            TURN_GAP.observe(gap)
+
+    @property
+    def awaiting_reply(self) -> bool:
+        return self._awaiting_reply
+
+    def mark_sent(self):
+        self._marks_sent.append(self._clock())
+
+    def mark_received(self):
+        # Twilio echoes marks in the order they were sent, and echoes cleared ones right away
+        if self._cleared_marks:
+            self._cleared_marks -= 1
+        elif self._marks_sent:
+            round_trip = self._clock() - self._marks_sent.popleft()
+            self.mark_round_trips.append(round_trip)
+            MARK_ROUND_TRIP.observe(round_trip)
+
+    def barge_in(self, speech_started_at: float, frames_dropped: int, unsent_marks: int = 0):
+        """
+        Playback was cleared in reaction to speech that OpenAI detected at `speech_started_at`.
+
+        `unsent_marks` of the marks were still queued on our side, Twilio never echoes those.
+        """
+        reaction = self._clock() - speech_started_at
+        self.barge_ins.append(reaction)
+        BARGE_IN.observe(reaction)
+        self.frames_dropped += frames_dropped
+        self._cleared_marks += max(len(self._marks_sent) - unsent_marks, 0)
+        self._marks_sent.clear()
+
+    def finish(self) -> Dict:
+        """Count the call's frames and return its summary, once the media stream has ended."""
+        FRAMES.inc(self.frames_in, direction="in")
+        FRAMES.inc(self.frames_out, direction="out")
+        FRAMES.inc(self.frames_dropped, direction="dropped")
+        return {
+            "duration_s": round(self._clock() - self.started_at, 1),
+            "first_audio_ms": round(self.first_audio * 1000, 1) if self.first_audio is not None else None,
+            "turn_gap": _summarize(self.turn_gaps),
+            "forward": _summarize(self.forwards),
+            "mark_round_trip": _summarize(self.mark_round_trips),
+            "barge_in": _summarize(self.barge_ins),
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "frames_dropped": self.frames_dropped,
+        }
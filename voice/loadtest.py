@@ -0,0 +1,336 @@
+"""
+Media stream load generator for the voice server.
+
+Measures how many concurrent calls one voice server process carries. The voice server runs
+as its own uvicorn process, against a local `FakeRealtimeServer` in place of OpenAI. Every
+simulated call then behaves like a Twilio media stream:
+
+- the call is registered in the shared SQLite call store, as the dialing worker would
+- `start`, then recorded μ-law audio (looped) in 20ms `media` frames at real-time pacing,
+  then `stop`; `mark` messages are echoed right away, as if playback kept up
+- the fake ends the caller's turn after every `turn_ms` of audio with server VAD and
+  transcription events, and answers with scripted audio deltas
+
+Per call it records the time from each frame being sent to it reaching the fake realtime
+API (the frame deadline), the turn round trip (last frame of a turn sent to the first
+reply frame received) and the time to the first greeting frame. Load is ramped through the
+given call counts until frame deadlines are missed.
+
+Usage:
+    python -m voice.loadtest --calls 10 25 50 100 --seconds 20
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import List, Optional
+
+import websockets
+from pydantic import BaseModel, Field
+
+from .call_store import SQLiteCallStore
+from .fakes import FakeRealtimeServer
+from .sessions import CallContext
+
+FRAME_BYTES = 160  # 20ms of 8kHz g711 u-law
+FRAME_SECONDS = 0.02
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "speech.ulaw")
+
+
+def worker_app():
+    """One voice server worker, for `uvicorn --factory voice.loadtest:worker_app`."""
+    from fastapi import FastAPI
+
+    import voice_server
+
+    app = FastAPI()
+    app.include_router(voice_server.router)
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_env(store_path: str, realtime_url: str) -> dict:
+    """Environment of a voice server worker using the given call store and realtime API, with dummy credentials."""
+    return dict(
+        os.environ,
+        CALL_STORE="sqlite", CALL_STORE_PATH=store_path, OPENAI_REALTIME_URL=realtime_url,
+        GREETING_CACHE="false", REALTIME_PREWARM="false",
+        OPENAI_API_KEY="loadtest", TWILIO_ACCOUNT_SID="ACloadtest", TWILIO_AUTH_TOKEN="loadtest",
+        TWILIO_PHONE_NUMBER="+15550000000", SERVER_ENDPOINT="https://voice.loadtest",
+    )
+
+
+def spawn_worker(port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--factory", "voice.loadtest:worker_app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(port: int, timeout: float = 30.0):
+    """Wait for a worker to accept connections."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time used by a process so far (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class CallResult(BaseModel):
+    """Timings of one simulated call"""
+    call_sid: str = Field(description="Call SID the call was registered under")
+    served: bool = Field(default=False, description="Whether the voice server answered the media stream with audio")
+    first_audio_ms: Optional[float] = Field(default=None, description="Stream start to the first audio frame received")
+    frames_sent: int = Field(default=0, description="Media frames sent")
+    frames_sent_late: int = Field(default=0, description="Frames the generator itself sent more than a frame late")
+    frames_received: int = Field(default=0, description="Media frames received from the voice server")
+    delivery_ms: List[float] = Field(default_factory=list, description="Per frame, sent to reaching the realtime API")
+    frames_undelivered: int = Field(default=0, description="Frames that never reached the realtime API")
+    round_trips_ms: List[float] = Field(default_factory=list, description="Per turn, last frame sent to the first reply frame")
+
+
+class LevelReport(BaseModel):
+    """Results of one load level"""
+    calls: int = Field(description="Concurrent calls")
+    served: int = Field(description="Calls answered with audio")
+    server_cpu: Optional[float] = Field(default=None, description="Voice server CPU use, in cores")
+    deadline_miss_rate: float = Field(description="Frames past the deadline or never delivered, of all frames sent")
+    delivery_p50_ms: Optional[float] = None
+    delivery_p99_ms: Optional[float] = None
+    round_trip_p50_ms: Optional[float] = None
+    round_trip_p95_ms: Optional[float] = None
+    first_audio_p50_ms: Optional[float] = None
+    generator_late_rate: float = Field(description="Frames the load generator sent late, above ~1% it is the bottleneck")
+
+
+def audio_payloads(audio: bytes) -> List[str]:
+    """The audio as base64 20ms frames, encoded once and shared by all calls."""
+    return [base64.b64encode(audio[start:start + FRAME_BYTES]).decode() for start in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+
+async def simulate_call(url: str, call_sid: str, payloads: List[str], seconds: float, turn_ms: int, start_delay: float = 0.0) -> tuple:
+    """
+    Run one call's media stream.
+
+    Returns:
+        (CallResult, send time of every frame) - deliveries are matched up afterwards
+    """
+    await asyncio.sleep(start_delay)
+    result = CallResult(call_sid=call_sid)
+    sent_at: List[float] = []
+    frames = int(seconds / FRAME_SECONDS)
+    frames_per_turn = max(turn_ms // 20, 1)
+    turn_ended_at: Optional[float] = None
+
+    async with websockets.connect(url, max_queue=None) as twilio_ws:
+        started = time.perf_counter()
+
+        async def receive():
+            nonlocal turn_ended_at
+            async for message in twilio_ws:
+                # Media is nearly all of the traffic, only marks need parsing
+                if message.startswith('{"event":"media"'):
+                    now = time.perf_counter()
+                    result.frames_received += 1
+                    if result.first_audio_ms is None:
+                        result.first_audio_ms = (now - started) * 1000
+                    if turn_ended_at is not None:
+                        result.round_trips_ms.append((now - turn_ended_at) * 1000)
+                        turn_ended_at = None
+                elif message.startswith('{"event":"mark"'):
+                    event = json.loads(message)
+                    await twilio_ws.send(json.dumps({"event": "mark", "streamSid": event["streamSid"], "mark": event["mark"]}))
+
+        await twilio_ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await twilio_ws.send(json.dumps({
+            "event": "start",
+            "start": {"streamSid": f"MZ{call_sid[2:]}", "callSid": call_sid, "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                      "customParameters": {"callSid": call_sid}},
+        }))
+        receiver = asyncio.create_task(receive())
+        stream_sid = f"MZ{call_sid[2:]}"
+        try:
+            for frame in range(frames):
+                due = started + frame * FRAME_SECONDS
+                now = time.perf_counter()
+                if now > due + FRAME_SECONDS:
+                    result.frames_sent_late += 1
+                await twilio_ws.send(
+                    '{"event":"media","streamSid":"' + stream_sid + '","media":{"track":"inbound","chunk":"' + str(frame + 1)
+                    + '","timestamp":"' + str(frame * 20) + '","payload":"' + payloads[frame % len(payloads)] + '"}}'
+                )
+                sent_at.append(time.perf_counter())
+                result.frames_sent += 1
+                if (frame + 1) % frames_per_turn == 0:
+                    turn_ended_at = sent_at[-1]
+                delay = started + (frame + 1) * FRAME_SECONDS - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await twilio_ws.send(json.dumps({"event": "stop", "streamSid": f"MZ{call_sid[2:]}"}))
+            # Let the last chunk and reply get through
+            await asyncio.sleep(0.5)
+        finally:
+            receiver.cancel()
+    result.served = result.frames_received > 0
+    return result, sent_at
+
+
+def match_deliveries(result: CallResult, sent_at: List[float], arrivals: List[tuple]):
+    """Fill in when each frame reached the realtime API, from the fake's (time, running byte count) log."""
+    index = 0
+    for frame, sent in enumerate(sent_at):
+        needed = (frame + 1) * FRAME_BYTES
+        while index < len(arrivals) and arrivals[index][1] < needed:
+            index += 1
+        if index == len(arrivals):
+            result.frames_undelivered = len(sent_at) - frame
+            return
+        result.delivery_ms.append((arrivals[index][0] - sent) * 1000)
+
+
+async def run_level(calls: int, seconds: float, turn_ms: int, deadline_ms: float, payloads: List[str], port: int, pid: int, store, realtime, level: int) -> LevelReport:
+    url = f"ws://127.0.0.1:{port}/media-stream"
+    call_sids = [f"CA{level:04d}{index:028d}" for index in range(calls)]
+    for call_sid in call_sids:
+        await asyncio.to_thread(store.register, CallContext(call_sid=call_sid, prompt=f"Load test call {call_sid}", conversation_text="Hello"))
+
+    cpu_before, started = process_cpu_seconds(pid), time.perf_counter()
+    # Calls start spread over a second, real calls don't send their frames in lockstep
+    outcomes = await asyncio.gather(*(
+        simulate_call(url, call_sid, payloads, seconds, turn_ms, random.uniform(0, 1.0)) for call_sid in call_sids
+    ), return_exceptions=True)
+    cpu_after, elapsed = process_cpu_seconds(pid), time.perf_counter() - started
+
+    results = []
+    for call_sid, outcome in zip(call_sids, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"  call {call_sid} failed: {outcome}")
+            results.append(CallResult(call_sid=call_sid))
+            continue
+        result, sent_at = outcome
+        match_deliveries(result, sent_at, realtime.audio_arrivals.get(f"Load test call {call_sid}", []))
+        results.append(result)
+
+    deliveries = [delay for result in results for delay in result.delivery_ms]
+    round_trips = [round_trip for result in results for round_trip in result.round_trips_ms]
+    first_audio = [result.first_audio_ms for result in results if result.first_audio_ms is not None]
+    frames_sent = sum(result.frames_sent for result in results) or 1
+    missed = sum(delay > deadline_ms for delay in deliveries) + sum(result.frames_undelivered for result in results)
+    return LevelReport(
+        calls=calls,
+        served=sum(result.served for result in results),
+        server_cpu=(cpu_after - cpu_before) / elapsed if cpu_before is not None and cpu_after is not None else None,
+        deadline_miss_rate=missed / frames_sent,
+        delivery_p50_ms=percentile(deliveries, 0.5),
+        delivery_p99_ms=percentile(deliveries, 0.99),
+        round_trip_p50_ms=percentile(round_trips, 0.5),
+        round_trip_p95_ms=percentile(round_trips, 0.95),
+        first_audio_p50_ms=percentile(first_audio, 0.5),
+        generator_late_rate=sum(result.frames_sent_late for result in results) / frames_sent,
+    )
+
+
+def print_level(report: LevelReport):
+    def ms(value):
+        return f"{value:>6.0f}ms" if value is not None else "     -  "
+
+    cpu = f"{report.server_cpu:>5.0%}" if report.server_cpu is not None else "    -"
+    print(
+        f"  {report.calls:>5} calls  served {report.served:>5}  server CPU {cpu}  missed {report.deadline_miss_rate:>6.2%}  "
+        f"delivery p50 {ms(report.delivery_p50_ms)} p99 {ms(report.delivery_p99_ms)}  "
+        f"round trip p50 {ms(report.round_trip_p50_ms)} p95 {ms(report.round_trip_p95_ms)}  "
+        f"first audio {ms(report.first_audio_p50_ms)}  generator late {report.generator_late_rate:.1%}"
+    )
+
+
+async def run(levels: List[int], seconds: float, turn_ms: int, deadline_ms: float, max_miss_rate: float, audio: bytes) -> List[LevelReport]:
+    realtime = FakeRealtimeServer(connect_delay=0.05, first_audio_delay=0.0, audio_frames=25, turn_ms=turn_ms)
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, "calls.db")
+        port = free_port()
+        worker = spawn_worker(port, worker_env(store_path, await realtime.start()))
+        store = SQLiteCallStore(store_path)
+        reports = []
+        try:
+            await wait_until_ready(port)
+            print(f"Voice server load test: {seconds:.0f}s calls, a turn every {turn_ms}ms, frame deadline {deadline_ms:.0f}ms, {os.cpu_count()} CPUs")
+            for level, calls in enumerate(levels):
+                report = await run_level(calls, seconds, turn_ms, deadline_ms, audio_payloads(audio), port, worker.pid, store, realtime, level)
+                print_level(report)
+                reports.append(report)
+                if report.deadline_miss_rate > max_miss_rate or report.served < report.calls:
+                    break
+        finally:
+            worker.terminate()
+            worker.wait()
+            store.close()
+            await realtime.close()
+    return reports
+
+
+def summarize(reports: List[LevelReport], max_miss_rate: float):
+    passed = [report for report in reports if report.deadline_miss_rate <= max_miss_rate and report.served == report.calls]
+    if not passed:
+        print("No load level met the frame deadline")
+        return
+    best = passed[-1]
+    print(f"Max concurrent calls per core before frame deadlines are missed: {best.calls}" + (" (not reached)" if best is reports[-1] else ""))
+    if best.server_cpu:
+        print(f"  at {best.server_cpu:.0%} of a core, ~{best.calls / best.server_cpu:.0f} calls per fully used core")
+    if max(report.generator_late_rate for report in reports) > 0.01:
+        print("  The load generator fell behind its own pacing, run it on a separate CPU for an upper bound")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, nargs="+", default=[10, 25, 50, 100, 200], help="Concurrent call counts to ramp through")
+    parser.add_argument("--seconds", type=float, default=20, help="Length of each call")
+    parser.add_argument("--turn-ms", type=int, default=3000, help="Caller audio per turn before the fake realtime API replies")
+    parser.add_argument("--deadline-ms", type=float, default=250, help="Longest a frame may take to reach the realtime API (includes AUDIO_CHUNK_MS buffering)")
+    parser.add_argument("--max-miss-rate", type=float, default=0.01, help="Share of frames allowed past the deadline")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="Raw 8kHz u-law audio replayed as the caller")
+    args = parser.parse_args()
+
+    with open(args.audio, "rb") as f:
+        audio = f.read()
+    reports = asyncio.run(run(args.calls, args.seconds, args.turn_ms, args.deadline_ms, args.max_miss_rate, audio))
+    summarize(reports, args.max_miss_rate)
+
+
+if __name__ == "__main__":
+    main()
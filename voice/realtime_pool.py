@@ -0,0 +1,144 @@
+"""
+Pool of OpenAI realtime sessions opened while outbound calls ring.
+
+Connecting to the realtime API and configuring the session takes a second or more. Done
+after Twilio connects the media stream, the callee hears it as dead air. Instead, a session
+is opened and configured as soon as a call is dialed, keyed by call SID, and handed to the
+media stream when the callee answers. Sessions of calls that end unanswered are closed when
+the call's terminal status arrives, and any left over are reaped after `ttl_seconds`.
+
+The pool runs on the server's event loop. Dialing happens on worker threads, so `prewarm`
+and `discard` are thread-safe and schedule their work onto that loop.
+"""
+
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from integrations.metrics import REGISTRY
+from .sessions import CallContext
+
+POOL_SESSIONS = REGISTRY.gauge("realtime_pool_sessions", "Pre-warmed realtime sessions waiting for their call to be answered")
+POOL_LOOKUPS = REGISTRY.counter("realtime_pool_lookups_total", "Media stream lookups of a pre-warmed session, by result")
+POOL_DISCARDED = REGISTRY.counter("realtime_pool_discarded_total", "Pre-warmed sessions closed unused, by reason")
+
+
+class _PooledSession:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.created_at = time.monotonic()
+
+
+class RealtimeSessionPool:
+    """Pre-warmed realtime sessions keyed by call SID."""
+
+    def __init__(
+        self,
+        open_session: Callable[[CallContext], Awaitable[Any]],
+        ttl_seconds: float = 120,
+        reap_interval: float = 10,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            open_session: Coroutine function opening and configuring a realtime session for a call
+            ttl_seconds: Age after which an unclaimed session is closed
+            reap_interval: Seconds between checks for expired sessions
+        """
+        self._open_session = open_session
+        self.ttl_seconds = ttl_seconds
+        self.reap_interval = reap_interval
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None and not self._loop.is_closed()
+
+    def start(self):
+        """Bind the pool to the running event loop. Until then `prewarm` does nothing."""
+        self._loop = asyncio.get_running_loop()
+        self._reaper = self._loop.create_task(self._reap_periodically())
+
+    async def close(self):
+        if self._reaper:
+            self._reaper.cancel()
+        for call_sid in list(self._sessions):
+            self._discard(call_sid, "shutdown")
+        self._loop = None
+
+    def prewarm(self, context: CallContext) -> bool:
+        """Start opening a session for a call that was just dialed. Returns False if the pool isn't running."""
+        if not self.running:
+            return False
+        self._call_soon(self._prewarm, context)
+        return True
+
+    async def acquire(self, call_sid: str):
+        """Take the call's pre-warmed session, waiting for it to finish opening. None if there is none."""
+        session = self._sessions.pop(call_sid, None)
+        POOL_SESSIONS.set(len(self._sessions))
+        if session is None:
+            POOL_LOOKUPS.inc(result="miss")
+            return None
+        try:
+            openai_ws = await session.task
+        except Exception as e:
+            print(f"Pre-warmed realtime session for {call_sid} failed: {e}")
+            POOL_LOOKUPS.inc(result="failed")
+            return None
+        if not openai_ws.open:
+            POOL_LOOKUPS.inc(result="closed")
+            return None
+        POOL_LOOKUPS.inc(result="hit")
+        return openai_ws
+
+    def discard(self, call_sid: str, reason: str = "unanswered"):
+        """Close a call's session if it is still unclaimed, e.g. once the call ended without being answered."""
+        if self.running:
+            self._call_soon(self._discard, call_sid, reason)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _call_soon(self, callback, *args):
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _prewarm(self, context: CallContext):
+        if context.call_sid in self._sessions:
+            return
+        self._sessions[context.call_sid] = _PooledSession(self._loop.create_task(self._open_session(context)))
+        POOL_SESSIONS.set(len(self._sessions))
+
+    def _discard(self, call_sid: str, reason: str):
+        session = self._sessions.pop(call_sid, None)
+        POOL_SESSIONS.set(len(self._sessions))
+        if session is not None:
+            POOL_DISCARDED.inc(reason=reason)
+            self._loop.create_task(self._close(call_sid, session))
+
+    async def _close(self, call_sid: str, session: _PooledSession):
+        if not session.task.done():
+            session.task.cancel()
+        try:
+            openai_ws = await session.task
+        except (asyncio.CancelledError, Exception):
+            return
+        await openai_ws.close()
+        print(f"Closed unused realtime session for {call_sid}")
+
+    async def _reap_periodically(self):
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            cutoff = time.monotonic() - self.ttl_seconds
+            for call_sid in [sid for sid, session in self._sessions.items() if session.created_at < cutoff]:
+                self._discard(call_sid, "expired")
@@ -0,0 +1,275 @@
+"""
+Streaming call recorder.
+
+Writes both legs of a call to a stereo WAV file as the call happens: the caller on the
+left channel, the assistant on the right. The media stream only enqueues the base64
+frames it already has, without blocking. A writer task decodes, aligns and writes them
+on a worker thread every `flush_interval`, so disk latency never reaches the media path.
+
+Memory per call is bounded. The queue holds at most `queue_frames` frames, and frames
+beyond that are dropped and counted rather than waited for. The assistant's audio is
+held only until the caller's timeline catches up with it, and at most `max_ahead_ms` of
+it. Files are rotated at `max_file_bytes`.
+
+Alignment follows Twilio's clock. Caller frames carry media timestamps, and gaps are
+filled with silence. Assistant audio is placed where Twilio would start playing it: at
+the caller's current timestamp, or after assistant audio already queued. A `clear`
+(barge-in) discards assistant audio that was never played.
+"""
+
+import os
+import time
+import base64
+import struct
+import asyncio
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from integrations.metrics import REGISTRY
+
+from .audio import ULAW_SILENCE, ulaw_to_pcm
+
+SAMPLE_RATE = 8000
+SAMPLES_PER_MS = SAMPLE_RATE // 1000
+
+RECORDER_FRAMES_DROPPED = REGISTRY.counter("recorder_frames_dropped_total", "Audio frames the call recorder dropped because its queue was full")
+RECORDER_BYTES_WRITTEN = REGISTRY.counter("recorder_bytes_written_total", "Bytes of audio written by the call recorder")
+RECORDER_WRITE_SECONDS = REGISTRY.histogram(
+    "recorder_batch_write_seconds",
+    "Time to align and write one batch of recorded frames",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_MULAW = 7
+
+
+class WavWriter:
+    """Stereo 8kHz WAV file writer (μ-law or 16-bit PCM), rotating to a new part at `max_file_bytes`."""
+
+    def __init__(self, path_prefix: str, audio_format: str = "ulaw", max_file_bytes: int = 50 * 1024 * 1024):
+        if audio_format not in ("ulaw", "pcm"):
+            raise ValueError(f"Unsupported recording format: {audio_format}")
+        self.path_prefix = path_prefix
+        self.audio_format = audio_format
+        self.sample_width = 1 if audio_format == "ulaw" else 2
+        self.block_align = 2 * self.sample_width
+        # Whole stereo samples only, so a part never ends mid-sample
+        self.max_data_bytes = max(self.block_align, max_file_bytes - self._header_size()) // self.block_align * self.block_align
+        self.paths: List[str] = []
+        self._file = None
+        self._data_bytes = 0
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            if self._file is None:
+                self._open_part()
+            room = self.max_data_bytes - self._data_bytes
+            chunk = view[:room]
+            self._file.write(chunk)
+            self._data_bytes += len(chunk)
+            view = view[len(chunk):]
+            if self._data_bytes >= self.max_data_bytes:
+                self._close_part()
+
+    def close(self):
+        if self._file is not None:
+            self._close_part()
+
+    def _open_part(self):
+        part = len(self.paths)
+        path = f"{self.path_prefix}.wav" if part == 0 else f"{self.path_prefix}.part{part + 1}.wav"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(self._header(0))
+        self._data_bytes = 0
+        self.paths.append(path)
+
+    def _close_part(self):
+        # Sizes are only known at the end, rewrite the header in place
+        self._file.seek(0)
+        self._file.write(self._header(self._data_bytes))
+        self._file.close()
+        self._file = None
+
+    def _header_size(self) -> int:
+        return len(self._header(0))
+
+    def _header(self, data_bytes: int) -> bytes:
+        channels = 2
+        if self.audio_format == "ulaw":
+            # Non-PCM formats carry a cbSize field and a fact chunk with the sample count
+            fmt = struct.pack("<HHIIHHH", WAVE_FORMAT_MULAW, channels, SAMPLE_RATE, SAMPLE_RATE * self.block_align, self.block_align, 8, 0)
+            extra = b"fact" + struct.pack("<II", 4, data_bytes // self.block_align)
+        else:
+            fmt = struct.pack("<HHIIHH", WAVE_FORMAT_PCM, channels, SAMPLE_RATE, SAMPLE_RATE * self.block_align, self.block_align, 16)
+            extra = b""
+        chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra + b"data" + struct.pack("<I", data_bytes)
+        return b"RIFF" + struct.pack("<I", 4 + len(chunks) + data_bytes) + b"WAVE" + chunks
+
+
+class _StereoAligner:
+    """Lines the two legs up on the caller's timeline and interleaves them, one μ-law byte per sample."""
+
+    def __init__(self, max_ahead_samples: int):
+        self.max_ahead_samples = max_ahead_samples
+        self.written = 0        # Samples written out, per channel
+        self.inbound_end = 0    # Caller timeline position after the latest caller frame
+        self._inbound = bytearray()
+        self._outbound = bytearray()  # Assistant audio from position `written` on
+        self.dropped_samples = 0
+
+    def add_inbound(self, audio: bytes, timestamp_ms: int):
+        start = timestamp_ms * SAMPLES_PER_MS
+        pending_end = self.written + len(self._inbound)
+        if start < pending_end:
+            # Overlaps audio we already have, keep only the new part
+            audio = audio[pending_end - start:]
+        elif start > pending_end:
+            self._inbound += bytes([ULAW_SILENCE]) * (start - pending_end)
+        self._inbound += audio
+        self.inbound_end = self.written + len(self._inbound)
+
+    def add_outbound(self, audio: bytes):
+        # Playback starts now, or after the assistant audio already queued at Twilio
+        if self.written + len(self._outbound) < self.inbound_end:
+            self._outbound += bytes([ULAW_SILENCE]) * (self.inbound_end - self.written - len(self._outbound))
+        room = self.max_ahead_samples - (self.written + len(self._outbound) - self.inbound_end)
+        if room < len(audio):
+            self.dropped_samples += len(audio) - max(room, 0)
+            audio = audio[:max(room, 0)]
+        self._outbound += audio
+
+    def clear(self):
+        # Assistant audio past the caller's current position was never played
+        del self._outbound[max(self.inbound_end - self.written, 0):]
+
+    def take(self) -> bytearray:
+        """Interleaved stereo for everything up to the caller's current position."""
+        count = len(self._inbound)
+        if not count:
+            return b""
+        right = bytes(self._outbound[:count])
+        if len(right) < count:
+            right += bytes([ULAW_SILENCE]) * (count - len(right))
+        stereo = bytearray(2 * count)
+        stereo[0::2] = self._inbound
+        stereo[1::2] = right
+        self._inbound = bytearray()
+        del self._outbound[:count]
+        self.written += count
+        return stereo
+
+
+class CallRecorder:
+    """Records one call's media stream to disk without blocking it."""
+
+    def __init__(
+        self,
+        path_prefix: str,
+        audio_format: str = "ulaw",
+        max_file_bytes: int = 50 * 1024 * 1024,
+        queue_frames: int = 500,
+        max_ahead_ms: int = 30_000,
+        flush_interval: float = 0.25,
+    ):
+        """
+        Initialize the recorder.
+
+        Args:
+            path_prefix: Path of the recording without extension, e.g. ./recordings/<call SID>
+            audio_format: "ulaw" (as received, 8 bits per sample) or "pcm" (16 bits, needs numpy)
+            max_file_bytes: Size at which the recording continues in a new `.partN.wav` file
+            queue_frames: Frames that may wait for the writer before new ones are dropped (500 = 10s of one leg)
+            max_ahead_ms: Assistant audio kept ahead of the caller's timeline, beyond which it is dropped
+            flush_interval: Seconds between writes, frames queued in between are written as one batch
+        """
+        self.writer = WavWriter(path_prefix, audio_format, max_file_bytes)
+        self.queue_frames = queue_frames
+        self.flush_interval = flush_interval
+        self.frames_dropped = 0
+        self._aligner = _StereoAligner(max_ahead_ms * SAMPLES_PER_MS)
+        self.audio_format = audio_format
+        if audio_format == "pcm" and np is None:
+            raise ImportError("PCM recordings require numpy")
+        self._items: Deque[Tuple[str, Optional[str], int]] = deque()
+        self._frames_queued = 0
+        self._closed = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def paths(self) -> List[str]:
+        return self.writer.paths
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def inbound(self, payload: str, timestamp: int):
+        """Queue a caller frame (base64 μ-law as received from Twilio)."""
+        self._enqueue(("in", payload, timestamp))
+
+    def outbound(self, payload: str):
+        """Queue an assistant frame (base64 μ-law as sent to Twilio)."""
+        self._enqueue(("out", payload, 0))
+
+    def clear(self):
+        """Playback was cleared, drop assistant audio that was not played yet."""
+        self._items.append(("clear", None, 0))
+
+    async def close(self):
+        """Write out everything queued and finalize the file."""
+        self._closing = True
+        self._closed.set()
+        if self._task is not None:
+            await self._task
+
+    def _enqueue(self, item):
+        if self._frames_queued >= self.queue_frames or self._closing:
+            self.frames_dropped += 1
+            RECORDER_FRAMES_DROPPED.inc()
+            return
+        self._frames_queued += 1
+        self._items.append(item)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._closed.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                if self._items:
+                    batch = list(self._items)
+                    self._items.clear()
+                    self._frames_queued = 0
+                    await asyncio.to_thread(self._write_batch, batch)
+                if self._closing and not self._items:
+                    break
+        except Exception as e:
+            print(f"Error recording call to {self.writer.path_prefix}: {e}")
+        finally:
+            await asyncio.to_thread(self.writer.close)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        for kind, payload, timestamp in batch:
+            if kind == "in":
+                self._aligner.add_inbound(base64.b64decode(payload), timestamp)
+            elif kind == "out":
+                self._aligner.add_outbound(base64.b64decode(payload))
+            else:
+                self._aligner.clear()
+        stereo = self._aligner.take()
+        if stereo:
+            if self.audio_format == "pcm":
+                stereo = ulaw_to_pcm(stereo).tobytes()
+            self.writer.write(stereo)
+            RECORDER_BYTES_WRITTEN.inc(len(stereo))
+        RECORDER_WRITE_SECONDS.observe(time.perf_counter() - started)
@@ -0,0 +1,173 @@
+"""
+Outbound send queue of one Twilio media stream.
+
+OpenAI streams a reply's audio faster than real time, and sending every delta inline
+means a slow Twilio leg stalls the loop reading OpenAI's socket: barge-in events, marks and
+transcripts queue up behind audio. The sender decouples the two with a writer task:
+
+- Audio (media messages and the marks that follow them) goes into a bounded queue, in
+  order, since Twilio echoes a mark once playback reaches it. Beyond `audio_high_water`
+  frames new audio is dropped and counted instead of growing the queue or blocking.
+- Control messages (`clear`) go into a second, small queue that the writer always empties
+  first, so a barge-in is not stuck behind seconds of queued audio. Producers wait when it
+  holds `control_high_water` messages; control messages are never dropped.
+- `clear` drops the audio still queued, it would only be cleared on Twilio's side anyway.
+"""
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from integrations.metrics import REGISTRY
+
+SEND_QUEUE_DEPTH = REGISTRY.gauge("twilio_send_queue_depth", "Messages waiting to be sent to Twilio, by queue")
+SEND_DROPPED = REGISTRY.counter("twilio_send_dropped_total", "Outbound audio frames dropped before reaching Twilio, by reason")
+
+MEDIA, MARK = "media", "mark"
+
+
+class TwilioSender:
+    """Prioritized, bounded send queue in front of a Twilio media stream WebSocket."""
+
+    def __init__(self, send: Callable[[str], Awaitable], audio_high_water: int = 3000, control_high_water: int = 50):
+        """
+        Initialize the sender.
+
+        Args:
+            send: Coroutine function sending a text message to Twilio, e.g. `websocket.send_text`
+            audio_high_water: Queued audio frames (20ms each, 3000 = 60s) beyond which new audio is dropped
+            control_high_water: Queued control messages at which `control` waits for the writer
+        """
+        self._send = send
+        self.audio_high_water = audio_high_water
+        self.control_high_water = control_high_water
+        self._audio: Deque[Tuple[str, str]] = deque()
+        self._control: Deque[str] = deque()
+        self._frames_queued = 0
+        self._ready = asyncio.Event()
+        self._control_space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.error: Optional[Exception] = None
+
+        # Per-call stats, stored with the call data
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_cleared = 0
+        self.max_audio_depth = 0
+
+    @property
+    def audio_depth(self) -> int:
+        """Audio frames waiting to be sent."""
+        return self._frames_queued
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def media(self, message: str) -> bool:
+        """
+        Queue a media message behind the audio already queued.
+
+        Returns:
+            False if it was dropped, the queue being at its high-water mark or the sender closed
+        """
+        if self._closed or self._frames_queued >= self.audio_high_water:
+            self.frames_dropped += 1
+            SEND_DROPPED.inc(reason="high_water" if not self._closed else "closed")
+            return False
+        self._audio.append((MEDIA, message))
+        self._frames_queued += 1
+        self.max_audio_depth = max(self.max_audio_depth, self._frames_queued)
+        SEND_QUEUE_DEPTH.inc(queue="audio")
+        self._ready.set()
+        return True
+
+    def mark(self, message: str):
+        """Queue a mark message, sent once the audio queued before it has been sent."""
+        if self._closed:
+            return
+        self._audio.append((MARK, message))
+        self._ready.set()
+
+    async def control(self, message: str):
+        """Queue a control message ahead of all queued audio, waiting while the control queue is full."""
+        while len(self._control) >= self.control_high_water and not self._closed:
+            self._control_space.clear()
+            await self._control_space.wait()
+        if self._closed:
+            return
+        self._control.append(message)
+        SEND_QUEUE_DEPTH.inc(queue="control")
+        self._ready.set()
+
+    async def clear(self, message: str) -> Tuple[int, int]:
+        """
+        Drop the queued audio and send `message` (a Twilio `clear`) ahead of everything else.
+
+        Returns:
+            (audio frames, marks) dropped from the queue, never sent to Twilio
+        """
+        frames = sum(1 for kind, _ in self._audio if kind == MEDIA)
+        marks = len(self._audio) - frames
+        self._audio.clear()
+        self._frames_queued = 0
+        self.frames_cleared += frames
+        SEND_QUEUE_DEPTH.dec(frames, queue="audio")
+        SEND_DROPPED.inc(frames, reason="barge_in")
+        await self.control(message)
+        return frames, marks
+
+    async def close(self, drain: bool = False):
+        """Stop the writer, after sending what is queued if `drain`."""
+        if drain and self._task is not None and self.error is None:
+            while self._control or self._audio:
+                await asyncio.sleep(0.01)
+        self._closed = True
+        self._control_space.set()
+        SEND_QUEUE_DEPTH.dec(self._frames_queued, queue="audio")
+        SEND_QUEUE_DEPTH.dec(len(self._control), queue="control")
+        self._audio.clear()
+        self._control.clear()
+        self._frames_queued = 0
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "frames_cleared": self.frames_cleared,
+            "max_audio_depth": self.max_audio_depth,
+        }
+
+    async def _write_loop(self):
+        while True:
+            if self._control:
+                message = self._control.popleft()
+                SEND_QUEUE_DEPTH.dec(queue="control")
+                self._control_space.set()
+            elif self._audio:
+                kind, message = self._audio.popleft()
+                if kind == MEDIA:
+                    self._frames_queued -= 1
+                    self.frames_sent += 1
+                    SEND_QUEUE_DEPTH.dec(queue="audio")
+            else:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                await self._send(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The WebSocket is gone, nothing queued can be delivered any more
+                print(f"Error sending to Twilio: {e}")
+                self.error = e
+                self._closed = True
+                self._control_space.set()
+                return
@@ -0,0 +1,24 @@
+"""
+Per-call context for the voice server.
+
+Everything a media stream needs to know about its call (prompt, greeting, whose call it is)
+is registered in the call store (`voice.call_store`) under the call SID when the call is
+dialed, and looked up by the media stream from the call SID Twilio passes back in the
+`<Stream>` custom parameters.
+"""
+
+import time
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+
+class CallContext(BaseModel):
+    """State of one outbound call, shared by its status callbacks and media stream"""
+    call_sid: str = Field(description="The Twilio call SID")
+    user_id: Optional[str] = Field(default=None, description="The user the call is made for, owner of the call data")
+    prompt: str = Field(description="Session instructions for the realtime model")
+    conversation_text: str = Field(description="Opening text the assistant starts the conversation from")
+    customer_name: Optional[str] = Field(default=None, description="The customer the call is made for, who the greeting may name")
+    greeting_key: Optional[str] = Field(default=None, description="Cache key of the recorded greeting played to the callee, None while it is generated live")
+    created_at: float = Field(default_factory=time.time, description="Unix time the call was dialed")
@@ -0,0 +1,121 @@
+"""
+Local voice activity detection on the caller's μ-law audio.
+
+Barge-in normally waits for OpenAI's server VAD: the caller's audio travels to OpenAI, is
+analyzed there, and `input_audio_buffer.speech_started` travels back before playback is
+cleared. Running a small detector on the inbound frames as they arrive lets the voice
+server interrupt the assistant a few hundred milliseconds sooner. Server VAD stays
+authoritative for turn-taking; local detections are only counted as confirmed once the
+server reports the same speech.
+
+Each 20ms frame is decoded with `voice.audio` and classified from its
+energy against an adaptive noise floor and its zero-crossing rate, which rejects hiss
+and other broadband noise. Speech must last `attack_frames` to start, so clicks and
+pops don't trigger, and ends after `hangover_frames` of non-speech, so the short pauses
+within an utterance don't end it.
+
+Requires NumPy.
+"""
+
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from integrations.metrics import REGISTRY
+
+from .audio import level_dbfs, ulaw_to_pcm
+
+SPEECH_STARTED = "speech_started"
+SPEECH_STOPPED = "speech_stopped"
+
+FRAME_SAMPLES = 160  # 20ms at 8kHz
+
+LOCAL_VAD_TRIGGERS = REGISTRY.counter("local_vad_triggers_total", "Local VAD barge-ins, by whether server VAD confirmed them")
+LOCAL_VAD_LEAD = REGISTRY.histogram(
+    "local_vad_lead_seconds",
+    "How much sooner local VAD detected speech than the server's speech_started",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0),
+)
+
+
+class LocalVAD:
+    """Energy and zero-crossing voice activity detector for one call's inbound audio."""
+
+    def __init__(
+        self,
+        margin_db: float = 12.0,
+        min_level_db: float = -45.0,
+        max_zero_crossing_rate: float = 0.35,
+        attack_frames: int = 3,
+        hangover_frames: int = 15,
+    ):
+        """
+        Initialize the detector.
+
+        Args:
+            margin_db: How far above the noise floor a frame must be to count as speech
+            min_level_db: Level (dBFS) below which a frame is never speech
+            max_zero_crossing_rate: Zero crossings per sample above which a frame is noise
+            attack_frames: Consecutive speech frames needed to start speech (3 = 60ms)
+            hangover_frames: Consecutive non-speech frames needed to end speech (15 = 300ms)
+        """
+        if np is None:
+            raise ImportError("LocalVAD requires numpy")
+        self.margin_db = margin_db
+        self.min_level_db = min_level_db
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.attack_frames = attack_frames
+        self.hangover_frames = hangover_frames
+        self.noise_floor_db = min_level_db - margin_db
+        self.speaking = False
+        self._run = 0
+        self._remainder = b""
+
+    @staticmethod
+    def features(frame: bytes):
+        """(level in dBFS, zero crossings per sample) of a μ-law frame."""
+        samples = ulaw_to_pcm(frame)
+        signs = np.signbit(samples)
+        zero_crossing_rate = np.count_nonzero(signs[1:] != signs[:-1]) / len(samples)
+        return level_dbfs(samples), zero_crossing_rate
+
+    def process(self, audio: bytes) -> Optional[str]:
+        """
+        Feed inbound μ-law audio, any length.
+
+        Returns:
+            SPEECH_STARTED or SPEECH_STOPPED on a transition, otherwise None
+        """
+        audio = self._remainder + audio
+        usable = len(audio) - len(audio) % FRAME_SAMPLES
+        self._remainder = audio[usable:]
+        transition = None
+        view = memoryview(audio)
+        for start in range(0, usable, FRAME_SAMPLES):
+            transition = self._process_frame(view[start:start + FRAME_SAMPLES]) or transition
+        return transition
+
+    def _process_frame(self, frame) -> Optional[str]:
+        level_db, zero_crossing_rate = self.features(frame)
+        is_speech = (
+            level_db > max(self.noise_floor_db + self.margin_db, self.min_level_db)
+            and zero_crossing_rate < self.max_zero_crossing_rate
+        )
+
+        if not self.speaking:
+            # The floor drops quickly to quieter frames and rises slowly, so speech barely moves it
+            rate = 0.2 if level_db < self.noise_floor_db else 0.01
+            self.noise_floor_db += rate * (level_db - self.noise_floor_db)
+            self._run = self._run + 1 if is_speech else 0
+            if self._run >= self.attack_frames:
+                self.speaking, self._run = True, 0
+                return SPEECH_STARTED
+        else:
+            self._run = 0 if is_speech else self._run + 1
+            if self._run >= self.hangover_frames:
+                self.speaking, self._run = False, 0
+                return SPEECH_STOPPED
+        return None
@@ -1,8 +1,13 @@
 import os
 import json
+import time
 import base64
 import asyncio
+import weakref
+import threading
 import websockets
+from contextlib import asynccontextmanager
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.websockets import WebSocketDisconnect
@@ -10,21 +15,44 @@ from fastapi import BackgroundTasks
 # from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
 from twilio.twiml.voice_response import VoiceResponse, Gather, Connect, Say, Stream
 from twilio.rest import Client
+from twilio.request_validator import RequestValidator
 from dotenv import load_dotenv
 # from flask import Blueprint, request, jsonify  # Not needed - using FastAPI
 from fastapi import APIRouter, Request, HTTPException
 from agents import firebase
 from agents.firebase import CallStatus
+from integrations.rate_limiter import Priority, get_scheduler
+from voice.aggregator import FrameAggregator
+from voice.call_store import create_call_store
+from voice.call_data_writer import CallDataWriter
+from voice.codec import FrameCodec
+from voice.greetings import GreetingCache, GreetingRecorder
+from voice.latency import CallLatency
+from voice.realtime_pool import RealtimeSessionPool
+from voice.recorder import CallRecorder
+from voice.sender import TwilioSender
+from voice.frames import AudioRetention, twilio_clear, twilio_mark, twilio_media
+from voice.sessions import CallContext
+from voice.vad import LOCAL_VAD_LEAD, LOCAL_VAD_TRIGGERS, SPEECH_STARTED, LocalVAD
 
 import openai
-import io
 # from pydub import AudioSegment  # Requires audioop - commented out for Python 3.13+ compatibility
 
-router = APIRouter()
+@asynccontextmanager
+async def lifespan(app):
+    # Realtime sessions are pre-warmed on the server's event loop
+    realtime_pool.start()
+    yield
+    await realtime_pool.close()
+    await call_data_writer.flush()
+
+router = APIRouter(lifespan=lifespan)
 
 load_dotenv()
 
 twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
+# Status callbacks settle calls, only trust those signed by Twilio with our auth token
+twilio_request_validator = RequestValidator(os.getenv('TWILIO_AUTH_TOKEN') or "")
 client = openai.OpenAI()
 
 
@@ -32,8 +60,18 @@ client = openai.OpenAI()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 SERVER_ENDPOINT = os.getenv('SERVER_ENDPOINT')
 PORT = int(os.getenv('PORT', 5050))
+OPENAI_REALTIME_URL = os.getenv('OPENAI_REALTIME_URL', 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2025-06-03')
+# Open and configure the realtime session while the call rings, instead of once it is answered
+REALTIME_PREWARM = os.getenv('REALTIME_PREWARM', 'true').lower() == 'true'
+# Detect the caller talking over the assistant locally, without waiting for OpenAI's server VAD (needs numpy)
+LOCAL_VAD = os.getenv('LOCAL_VAD', 'false').lower() == 'true'
+# Seconds within which server VAD must report speech for a local detection to count as confirmed
+LOCAL_VAD_CONFIRM_SECONDS = float(os.getenv('LOCAL_VAD_CONFIRM_SECONDS', 1.0))
+# Play greetings recorded on earlier calls instead of generating them live
+GREETING_CACHE = os.getenv('GREETING_CACHE', 'true').lower() == 'true'
 
 VOICE = 'alloy'
+AUDIO_FORMAT = 'g711_ulaw'
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
@@ -41,8 +79,28 @@ LOG_EVENT_TYPES = [
     'session.created', 'transcript.final'
 ]
 SHOW_TIMING_MATH = False
-
-# Define the prompt at the top of the file
+# Number of most recent inbound 20ms frames to keep in memory per call, 0 keeps none
+AUDIO_RETENTION_FRAMES = int(os.getenv('AUDIO_RETENTION_FRAMES', 0))
+# Record both legs of every call to a stereo WAV file (caller left, assistant right)
+CALL_RECORDING = os.getenv('CALL_RECORDING', 'false').lower() == 'true'
+RECORDINGS_DIR = os.getenv('RECORDINGS_DIR', './recordings')
+# "ulaw" keeps the audio as received, "pcm" writes 16-bit samples (needs numpy)
+RECORDING_FORMAT = os.getenv('RECORDING_FORMAT', 'ulaw')
+RECORDING_MAX_FILE_MB = int(os.getenv('RECORDING_MAX_FILE_MB', 50))
+# Where call contexts and statuses live: "memory" for a single worker, "sqlite" to share them between the workers of a host
+CALL_STORE = os.getenv('CALL_STORE', 'memory')
+CALL_STORE_PATH = os.getenv('CALL_STORE_PATH', './voice/call_store.db')
+# How often waiters check the store for a status delivered to another worker
+CALL_STATUS_POLL_SECONDS = float(os.getenv('CALL_STATUS_POLL_SECONDS', 1.0))
+# Audio queued for a slow Twilio leg beyond this many 20ms frames is dropped, and control messages wait beyond this many
+TWILIO_SEND_HIGH_WATER_FRAMES = int(os.getenv('TWILIO_SEND_HIGH_WATER_FRAMES', 3000))
+TWILIO_CONTROL_HIGH_WATER = int(os.getenv('TWILIO_CONTROL_HIGH_WATER', 50))
+# Inbound audio is sent to OpenAI in chunks of this many ms (20-200), 20 forwards every Twilio frame
+AUDIO_CHUNK_MS = int(os.getenv('AUDIO_CHUNK_MS', 100))
+# Longest an inbound frame may wait for its chunk to fill, defaults to AUDIO_CHUNK_MS
+AUDIO_CHUNK_MAX_LATENCY_MS = int(os.getenv('AUDIO_CHUNK_MAX_LATENCY_MS', 0)) or None
+
+# Default prompts, used for calls dialed without their own
 INITIAL_PROMPT = (
                 "You are an AI assistant initiating a conversation to enquire about moving services."
                 "Your goal is to inquire about the moving services, asking for details, "
@@ -53,9 +111,25 @@ INITIAL_CONVERSATION_TEXT = (
         "Hello! I'm interested in scheduling moving services. "
         "you have available?"
 )
-call_sid = None
+# Context and latest status of every call, keyed by call SID
+call_store = create_call_store(CALL_STORE, CALL_STORE_PATH)
+
+# Status and transcript updates are persisted in the background, off the event loop
+call_data_writer = CallDataWriter()
+
+# Parses media stream frames, skipping full JSON parsing of audio frames
+codec = FrameCodec()
+
+# Greeting audio recorded per conversation text, voice and audio format
+greeting_cache = GreetingCache()
 
-current_user_id = None
+TERMINAL_CALL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+# Per-call (future, created at) pairs, the future is resolved when a terminal status reaches this worker
+call_completions = {}
+call_completions_lock = threading.Lock()
+# Seconds after which the future of a call nobody waited on, and that never ended, is dropped
+CALL_COMPLETION_TTL = float(os.getenv('CALL_COMPLETION_TTL', 4 * 60 * 60))
 
 app = FastAPI()
 
@@ -66,38 +140,66 @@ if not OPENAI_API_KEY:
 @router.api_route("/outgoing-call-twiml", methods=["GET", "POST"])
 async def outgoing_call_twiml(request: Request):
     """Provide TwiML instructions for the outgoing call."""
+    params = await request.form() if request.method == "POST" else request.query_params
     response = VoiceResponse()
     response.say("Please wait while we connect your call to my assistant")
     response.pause(length=1)
     # response.say("Hi, How's it going?")
     connect = Connect()
-    connect.stream(url=f'wss://{request.url.hostname}/media-stream')
+    stream = connect.stream(url=f'wss://{request.url.hostname}/media-stream')
+    # Passed back in the stream's start event so the media stream can find its call context
+    stream.parameter(name="callSid", value=params.get("CallSid", ""))
     response.append(connect)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
+@router.post("/call-status")
+async def call_status_callback(request: Request):
+    """Twilio status callback: record the call's progress and wake up anyone waiting for it to end."""
+    form = await request.form()
+    # Twilio signs the URL it was given, not the one behind our proxy
+    url = f"{SERVER_ENDPOINT}/call-status" if SERVER_ENDPOINT else str(request.url)
+    if not twilio_request_validator.validate(url, dict(form), request.headers.get("X-Twilio-Signature", "")):
+        print(f"Rejected a status callback without a valid Twilio signature for call {form.get('CallSid')}")
+        return HTMLResponse(content="", status_code=403)
+    await asyncio.to_thread(resolve_call_status, form.get("CallSid"), form.get("CallStatus"))
+    return HTMLResponse(content="", status_code=204)
+
 @router.api_route("/")
 async def index_page():
     return {"message": "Voice Server is running!"}
 
-def handle_outgoing_call_sync(to_number):
+def handle_outgoing_call_sync(to_number, user_id=None, initial_prompt=INITIAL_PROMPT, conversation_text=INITIAL_CONVERSATION_TEXT, customer_name=None):
     """Initiate an outgoing call and return status."""
 
-    global call_sid
-
     if not to_number or not os.getenv('TWILIO_PHONE_NUMBER'):
         return JSONResponse(content={"error": "Missing 'to' or 'from' number"}, status_code=400)
 
     # Function to initiate the call
-    call = twilio_client.calls.create(
-        to=to_number,
-        from_=os.getenv('TWILIO_PHONE_NUMBER'),
-        url=f'{os.getenv("SERVER_ENDPOINT")}/outgoing-call-twiml'
-    )
+    with get_scheduler().slot("twilio", "calls", priority=Priority.LIVE_CALL):
+        call = twilio_client.calls.create(
+            to=to_number,
+            from_=os.getenv('TWILIO_PHONE_NUMBER'),
+            url=f'{os.getenv("SERVER_ENDPOINT")}/outgoing-call-twiml',
+            status_callback=f'{os.getenv("SERVER_ENDPOINT")}/call-status',
+            status_callback_event=["initiated", "ringing", "answered", "completed"],
+            status_callback_method="POST"
+        )
     print(f"Call initiated: {call.sid}")
 
     call_sid = call.sid
-
-    firebase.update_call_data(current_user_id, call_sid, {
+    context = call_store.register(CallContext(
+        call_sid=call_sid,
+        user_id=user_id,
+        prompt=initial_prompt,
+        conversation_text=conversation_text,
+        customer_name=customer_name,
+    ))
+    call_store.set_status(call_sid, call.status)
+    if REALTIME_PREWARM:
+        realtime_pool.prewarm(context)
+    completion_future(call_sid)
+
+    firebase.update_call_data(user_id, call_sid, {
         "status": CallStatus.CALL_INITIATED
     })
 
@@ -105,140 +207,376 @@ def handle_outgoing_call_sync(to_number):
     return call.sid
 
 def check_call_status(call_sid):
-    call = twilio_client.calls(call_sid).fetch()
+    with get_scheduler().slot("twilio", priority=Priority.LIVE_CALL):
+        call = twilio_client.calls(call_sid).fetch()
         
     return call.status
 
+def resolve_call_status(call_sid, status):
+    """Record a call status, resolving the call's completion future once it is terminal."""
+    if not call_sid or not status:
+        return
+    call_store.set_status(call_sid, status)
+    if status in TERMINAL_CALL_STATUSES:
+        # A session still in the pool means the call ended without its media stream connecting
+        realtime_pool.discard(call_sid)
+        # Waiters already hold the future, later ones see the terminal status in the store
+        with call_completions_lock:
+            completion, _ = call_completions.pop(call_sid, (None, None))
+        if completion is not None and not completion.done():
+            completion.set_result(status)
+
+def completion_future(call_sid):
+    """The future resolved when the call ends, created if needed. Expired futures are dropped on the way."""
+    now = time.monotonic()
+    with call_completions_lock:
+        for expired in [sid for sid, (_, created_at) in call_completions.items() if now - created_at > CALL_COMPLETION_TTL]:
+            del call_completions[expired]
+        return call_completions.setdefault(call_sid, (Future(), now))[0]
+
+def status_wait(deadline):
+    """Seconds to wait for a call's completion before checking the store again, None for no limit."""
+    # Only a shared store gets statuses posted to other workers, an in-memory one resolves the future itself
+    poll = CALL_STATUS_POLL_SECONDS if call_store.shared else None
+    if deadline is None:
+        return poll
+    remaining = max(deadline - time.monotonic(), 0)
+    return remaining if poll is None else min(poll, remaining)
+
+def wait_for_call_completion(call_sid, timeout=None):
+    """
+    Block until Twilio reports that the call ended, without polling.
+
+    :param call_sid: The SID of the call.
+    :param timeout: Seconds to wait, None to wait forever.
+    :return: The terminal call status, or None if it did not arrive within the timeout.
+    """
+    completion = completion_future(call_sid)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # The status callback may reach another worker, check the store between waits
+    while (status := call_store.get_status(call_sid)) not in TERMINAL_CALL_STATUSES:
+        try:
+            status = completion.result(status_wait(deadline))
+            break
+        except FutureTimeoutError:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+    with call_completions_lock:
+        call_completions.pop(call_sid, None)
+    return status
+
+async def await_call_completion(call_sid, timeout=None):
+    """Async version of wait_for_call_completion."""
+    completion = completion_future(call_sid)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while (status := await asyncio.to_thread(call_store.get_status, call_sid)) not in TERMINAL_CALL_STATUSES:
+        try:
+            status = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(completion)), status_wait(deadline))
+            break
+        except asyncio.TimeoutError:
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+    with call_completions_lock:
+        call_completions.pop(call_sid, None)
+    return status
+
+def hangup_call(call_sid, status=None):
+    """Hang up an in-progress call, or cancel it if it has not been answered yet."""
+    status = status or call_store.get_status(call_sid)
+    # An answered call ends as completed, the mover did pick up
+    final_status = "canceled" if status in ("queued", "initiated", "ringing") else "completed"
+    with get_scheduler().slot("twilio", priority=Priority.LIVE_CALL):
+        twilio_client.calls(call_sid).update(status=final_status)
+    # Don't rely on the status callback to release waiters for a call we ended ourselves
+    resolve_call_status(call_sid, final_status)
+
 def get_call_data(call_sid):
     try:
-        call_data = firebase.get_call_data_as_json(current_user_id, call_sid)
+        context = call_store.get(call_sid)
+        if context is None:
+            print(f"No context for call {call_sid}")
+            return None
+        call_data_writer.flush_threadsafe(call_sid)
+        call_data = firebase.get_call_data_as_json(context.user_id, call_sid)
         return call_data
     except Exception as e:
         print(f"Error getting call data: {e}")
         return None
 
-def initiate_call_with_prompt(phone_number, initial_prompt, conversation_text, user_id):
+def initiate_call_with_prompt(phone_number, initial_prompt, conversation_text, user_id, customer_name=None):
     """Function to initiate a call with specific prompts."""
 
 
     print(f"Initial prompt: {initial_prompt}")
     print(f"Conversation text: {conversation_text}")
     print(f"Phone number: {phone_number}")
-    # Set the initial prompt and conversation text
-    global INITIAL_PROMPT, INITIAL_CONVERSATION_TEXT, current_user_id
-    INITIAL_PROMPT = initial_prompt
-    INITIAL_CONVERSATION_TEXT = conversation_text
-    current_user_id = user_id
 
     print(f"Initiating call to {phone_number}")
 
     # Call the handle_outgoing_call function
-    response =  handle_outgoing_call_sync(phone_number)
+    response =  handle_outgoing_call_sync(phone_number, user_id, initial_prompt, conversation_text, customer_name)
     return response
 
 
+async def open_realtime_session(context):
+    """Connect to the OpenAI realtime API and configure the session for a call."""
+    async with get_scheduler().slot_async("openai", "realtime", priority=Priority.LIVE_CALL):
+        openai_ws = await websockets.connect(
+            OPENAI_REALTIME_URL,
+            extra_headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "OpenAI-Beta": "realtime=v1"
+            },
+            # Once a call is over nobody reads the socket, a reply still streaming can keep the
+            # closing handshake from completing. Give up after a short wait instead of 3x10s
+            close_timeout=2,
+        )
+    try:
+        await initialize_session(openai_ws, context)
+    except Exception:
+        await openai_ws.close()
+        raise
+    return openai_ws
+
+# Realtime sessions opened at dial time, handed to the media stream when the call is answered
+realtime_pool = RealtimeSessionPool(open_realtime_session)
+
+# Sessions of the calls streaming on this worker, by call SID, for instruction updates mid-call
+live_sessions = {}
+live_sessions_lock = threading.Lock()
+# Instructions each open session was last given
+session_prompts = weakref.WeakKeyDictionary()
+
+@asynccontextmanager
+async def realtime_session(context):
+    """
+    The call's pre-warmed realtime session, or a new one if it has none, with the call's current context.
+
+    The context is read again once the session is open: pre-warming may have found a recorded
+    greeting, and the prompt may have been updated while the call was ringing.
+    """
+    openai_ws = await realtime_pool.acquire(context.call_sid)
+    if openai_ws is None:
+        openai_ws = await open_realtime_session(context)
+    else:
+        print(f"Using pre-warmed realtime session for {context.call_sid}")
+    with live_sessions_lock:
+        live_sessions[context.call_sid] = (asyncio.get_running_loop(), openai_ws)
+    try:
+        # Prompt updates from here on reach the live session directly
+        context = await asyncio.to_thread(call_store.get, context.call_sid) or context
+        if session_prompts.get(openai_ws) != context.prompt:
+            await update_session_instructions(openai_ws, context.prompt)
+        yield openai_ws, context
+    finally:
+        with live_sessions_lock:
+            live_sessions.pop(context.call_sid, None)
+        await openai_ws.close()
+
+async def update_session_instructions(openai_ws, prompt):
+    """Replace the instructions of an open session, the conversation so far is kept."""
+    try:
+        await openai_ws.send(json.dumps({"type": "session.update", "session": {"instructions": prompt}}))
+        session_prompts[openai_ws] = prompt
+    except Exception as e:
+        print(f"Error updating session instructions: {e}")
+
+def update_call_prompt(call_sid, prompt):
+    """
+    Give a call new instructions, e.g. a negotiation strategy adapted while it was dialed.
+
+    A call not answered yet starts with them. A call streaming on this worker gets them
+    mid-conversation through a `session.update`; one streaming on another worker keeps its
+    instructions. Safe to call from any thread.
+
+    :return: True if a live session was updated.
+    """
+    if call_store.update(call_sid, {"prompt": prompt}) is None:
+        return False
+    with live_sessions_lock:
+        live = live_sessions.get(call_sid)
+    if live is None:
+        return False
+    loop, openai_ws = live
+    asyncio.run_coroutine_threadsafe(update_session_instructions(openai_ws, prompt), loop)
+    return True
+
 @router.websocket("/media-stream")
 async def handle_media_stream(websocket: WebSocket):
     """Handle WebSocket connections between Twilio and OpenAI."""
     print("Client connected")
     await websocket.accept()
 
-    # Initialize transcripts list
-    transcripts = []
+    # Twilio sends 'connected' then 'start', which carries the call SID we need to find the call's context
+    context = None
+    stream_sid = None
+    async for message in websocket.iter_text():
+        data = codec.decode_twilio(message).data
+        if data['event'] == 'start':
+            stream_sid = data['start']['streamSid']
+            custom_parameters = data['start'].get('customParameters') or {}
+            context = await asyncio.to_thread(call_store.get, custom_parameters.get('callSid') or data['start'].get('callSid'))
+            print(f"Incoming stream has started {stream_sid}")
+            break
+
+    if context is None:
+        print("No call context for media stream, closing")
+        await websocket.close()
+        return
+
+    user_id, call_sid = context.user_id, context.call_sid
+    latency = CallLatency()
+    recorder = None
+    if CALL_RECORDING:
+        recorder = CallRecorder(os.path.join(RECORDINGS_DIR, call_sid), RECORDING_FORMAT, RECORDING_MAX_FILE_MB * 1024 * 1024)
+        recorder.start()
+    # Audio back to Twilio goes through a queue, so a slow Twilio leg never stalls reading from OpenAI
+    sender = TwilioSender(websocket.send_text, TWILIO_SEND_HIGH_WATER_FRAMES, TWILIO_CONTROL_HIGH_WATER)
+    sender.start()
 
     try:
-        async with websockets.connect(
-            'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2025-06-03',
-            extra_headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "OpenAI-Beta": "realtime=v1"
-            }
-        ) as openai_ws:
+        async with realtime_session(context) as (openai_ws, context):
             # When call is picked up, update status
-            firebase.update_call_data(current_user_id, call_sid, {
+            call_data_writer.update(user_id, call_sid, {
                 "status": CallStatus.CALL_INPROGRESS
             })
 
-            await initialize_session(openai_ws)
-
             # Connection specific state
-            stream_sid = None
             latest_media_timestamp = 0
             last_assistant_item = None
             mark_queue = []
             response_start_timestamp_twilio = None
             
-            audio_buffer = []  # Global state for accumulating audio data
+            audio_retention = AudioRetention(AUDIO_RETENTION_FRAMES)
+            audio_aggregator = FrameAggregator(openai_ws.send, AUDIO_CHUNK_MS, AUDIO_CHUNK_MAX_LATENCY_MS)
+
+            # Either the greeting was recorded on an earlier call, or this call records the one generated live
+            greeting = await asyncio.to_thread(greeting_cache.load, context.greeting_key) if context.greeting_key else None
+            greeting_recorder = GreetingRecorder() if GREETING_CACHE and greeting is None else None
+            greeting_cache_tasks = []
+
+            local_vad = None
+            if LOCAL_VAD:
+                try:
+                    local_vad = LocalVAD()
+                except ImportError as e:
+                    print(f"Local VAD disabled: {e}")
+            # Assistant item interrupted on a local detection, and when, until server VAD confirms it
+            locally_interrupted_item = None
+            local_speech_started_at = None
 
             async def receive_from_twilio():
                 """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-                nonlocal stream_sid, latest_media_timestamp, transcripts
+                nonlocal stream_sid, latest_media_timestamp, last_assistant_item, response_start_timestamp_twilio
+                nonlocal locally_interrupted_item, local_speech_started_at
 
                 try:
                     async for message in websocket.iter_text():
-                        data = json.loads(message)
-
-                        if data['event'] == 'media':
-                            latest_media_timestamp = int(data['media']['timestamp'])
-                            
-                            audio_buffer.append(base64.b64decode(data['media']['payload']))  # Accumulate audio data
-
-                            # Decode the base64 audio data to bytes
-                            audio_bytes = base64.b64decode(data['media']['payload'])
-
-                            # Create an in-memory file-like object for the binary audio data
-                            audio_stream = io.BytesIO(audio_bytes)
-
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": data['media']['payload']
-                            }
-
-                            # print("sending audio_append")
-                            await openai_ws.send(json.dumps(audio_append))
-
-                        elif data['event'] == 'start':
+                        frame = codec.decode_twilio(message)
+
+                        if frame.event == 'media':
+                            latency.frame_in()
+                            latest_media_timestamp = frame.timestamp
+                            audio_retention.append(frame.payload)
+                            if recorder is not None:
+                                recorder.inbound(frame.payload, frame.timestamp)
+
+                            if local_vad is not None:
+                                if local_speech_started_at and time.monotonic() - local_speech_started_at > LOCAL_VAD_CONFIRM_SECONDS:
+                                    LOCAL_VAD_TRIGGERS.inc(result="unconfirmed")
+                                    local_speech_started_at = None
+                                # Only the caller talking over audio still playing needs an interruption
+                                if local_vad.process(base64.b64decode(frame.payload)) == SPEECH_STARTED and last_assistant_item and mark_queue:
+                                    print(f"Local VAD: interrupting response with id: {last_assistant_item}")
+                                    locally_interrupted_item = last_assistant_item
+                                    local_speech_started_at = time.monotonic()
+                                    # Stop generation too, deltas already on their way are dropped
+                                    await openai_ws.send(codec.encode({"type": "response.cancel"}))
+                                    await handle_speech_started_event(local_speech_started_at)
+
+                            # Both sides speak g711 u-law, audio is only re-chunked on the way through
+                            await audio_aggregator.add(frame.payload, frame.timestamp)
+
+                        elif frame.event == 'start':
+                            await audio_aggregator.flush("start")
+                            data = frame.data
                             stream_sid = data['start']['streamSid']
                             print(f"Incoming stream has started {stream_sid}")
                             response_start_timestamp_twilio = None
                             latest_media_timestamp = 0
                             last_assistant_item = None
-                        elif data['event'] == 'mark':
+                        elif frame.event == 'mark':
+                            await audio_aggregator.flush("mark")
+                            latency.mark_received()
                             if mark_queue:
                                 mark_queue.pop(0)
+                        elif frame.event == 'stop':
+                            await audio_aggregator.flush("stop")
                 except WebSocketDisconnect:
-                    print("Client disconnected.")
-                    if openai_ws.open:
-                        await openai_ws.close()
-                    # Update Firestore status to call disconnected
-                    firebase.update_call_data(current_user_id, call_sid, {
-                        "status": CallStatus.CALL_COMPLETED
-                    })
+                    pass
+                # iter_text() also ends without raising once Twilio closes the stream
+                print("Client disconnected.")
+                audio_aggregator.close()
+                if openai_ws.open:
+                    await openai_ws.close()
+                # Update Firestore status to call disconnected, and write out everything still queued
+                call_data_writer.update(user_id, call_sid, {
+                    "status": CallStatus.CALL_COMPLETED
+                })
+                await call_data_writer.flush(call_sid)
 
             async def send_to_twilio():
                 """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
-                nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, transcripts
+                nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, greeting_recorder, local_speech_started_at
                 try:
                     async for openai_message in openai_ws:
-                        response = json.loads(openai_message)
+                        event = codec.decode_realtime(openai_message)
+
+                        # Audio deltas are most of the traffic, handle them without parsing the whole event
+                        if event.type == 'response.audio.delta' and event.delta is not None:
+                            if locally_interrupted_item is not None and event.item_id == locally_interrupted_item:
+                                continue
+                            received_at = time.monotonic() if latency.awaiting_reply else None
+                            queued = sender.media(twilio_media(stream_sid, event.delta))
+                            if queued:
+                                latency.frames_sent()
+                                if recorder is not None:
+                                    recorder.outbound(event.delta)
+                            if received_at is not None:
+                                latency.reply_delta(received_at)
+                            if greeting_recorder is not None:
+                                greeting_recorder.add(event.item_id, event.delta)
+
+                            if response_start_timestamp_twilio is None:
+                                response_start_timestamp_twilio = latest_media_timestamp
+                                if SHOW_TIMING_MATH:
+                                    print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
+
+                            # Update last_assistant_item safely
+                            if event.item_id:
+                                last_assistant_item = event.item_id
+
+                            if queued:
+                                await send_mark(sender, stream_sid)
+                            continue
+
+                        response = event.data
                         # print(f"Received event: {response['type']}", response)
 
                         # Log the conversation.item.input_audio_transcription.completed event
                         if response['type'] == 'conversation.item.input_audio_transcription.completed':
                             print(f"User input: {response['transcript']}")
 
-                            transcripts.append({
-                                "role": "user",
-                                "message": response['transcript']
-                            })
-
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "transcripts": transcripts
-                            })
+                            call_data_writer.append_transcript(user_id, call_sid, "user", response['transcript'])
 
                         if response['type'] in LOG_EVENT_TYPES:                            
                             # Parse transcript from response.done event
                             if response['type'] == 'response.done':
+                                if greeting_recorder is not None:
+                                    recording = greeting_recorder.finish(response.get('response', {}))
+                                    greeting_recorder = None
+                                    if recording:
+                                        greeting_cache_tasks.append(asyncio.create_task(cache_greeting(context, *recording)))
                                 try:
                                     output = response['response']['output']
                                     for item in output:
@@ -246,79 +584,54 @@ async def handle_media_stream(websocket: WebSocket):
                                             for content in item['content']:
                                                 if content.get('transcript'):
                                                     print(f"\n\nAI said: {content['transcript']}\n\n")
-                                                    transcripts.append({
-                                                        "role": "assistant",
-                                                        "message": content['transcript']
-                                                    })
-                                                    firebase.update_call_data(current_user_id, call_sid, {
-                                                        "status": CallStatus.CALL_INPROGRESS,
-                                                        "transcripts": transcripts
+                                                    call_data_writer.append_transcript(user_id, call_sid, "assistant", content['transcript'], {
+                                                        "status": CallStatus.CALL_INPROGRESS
                                                     })
                                 except KeyError as e:
                                     print(f"Error parsing response.done event: {e}")
 
                         if response.get('type') == 'transcript.final':
                             print(f"\n\nUser said: {response['text']}\n\n")
-                            transcripts.append({
-                                "role": "user",
-                                "message": response['text']
-                            })
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "status": CallStatus.CALL_INPROGRESS,
-                                "transcripts": transcripts
+                            call_data_writer.append_transcript(user_id, call_sid, "user", response['text'], {
+                                "status": CallStatus.CALL_INPROGRESS
                             })
 
-                        if response.get('type') == 'response.audio.delta' and 'delta' in response:
-                            audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-                            audio_delta = {
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {
-                                    "payload": audio_payload
-                                }
-                            }
-                            await websocket.send_json(audio_delta)
-
-                            if response_start_timestamp_twilio is None:
-                                response_start_timestamp_twilio = latest_media_timestamp
-                                if SHOW_TIMING_MATH:
-                                    print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
-
-                            # Update last_assistant_item safely
-                            if response.get('item_id'):
-                                last_assistant_item = response['item_id']
-
-                            await send_mark(websocket, stream_sid)
-
                         # Print AI response for debugging
                         if response.get('type') == 'response.text' and 'text' in response:
                             print(f"\n\nAI has send a message: {response['text']}\n\n")
-                            transcripts.append({
-                                "role": "assistant",
-                                "message": response['text']
-                            })
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "status": CallStatus.CALL_INPROGRESS,
-                                "transcripts": transcripts
+                            call_data_writer.append_transcript(user_id, call_sid, "assistant", response['text'], {
+                                "status": CallStatus.CALL_INPROGRESS
                             })
 
+                        if response.get('type') == 'input_audio_buffer.speech_stopped':
+                            latency.speech_stopped()
+
                         # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
                         if response.get('type') == 'input_audio_buffer.speech_started':
+                            speech_started_at = time.monotonic()
                             print("Speech started detected.")
+                            if local_speech_started_at is not None:
+                                # Server VAD confirms the local detection, which already interrupted the response
+                                LOCAL_VAD_TRIGGERS.inc(result="confirmed")
+                                LOCAL_VAD_LEAD.observe(speech_started_at - local_speech_started_at)
+                                local_speech_started_at = None
                             if last_assistant_item:
                                 print(f"Interrupting response with id: {last_assistant_item}")
-                                await handle_speech_started_event()
+                                await handle_speech_started_event(speech_started_at)
                 except Exception as e:
                     print(f"Error in send_to_twilio: {e}")
 
-            async def handle_speech_started_event():
+            async def handle_speech_started_event(speech_started_at):
                 """Handle interruption when the caller's speech starts."""
                 nonlocal response_start_timestamp_twilio, last_assistant_item
                 print("Handling speech started event.")
+                if greeting_recorder is not None:
+                    greeting_recorder.abandon()
                 if mark_queue and response_start_timestamp_twilio is not None:
                     elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
                     if SHOW_TIMING_MATH:
                         print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
+                        print(f"Caller audio delivered to OpenAI up to {audio_aggregator.delivered_timestamp}ms, {audio_aggregator.pending_ms}ms buffered")
 
                     if last_assistant_item:
                         if SHOW_TIMING_MATH:
@@ -331,12 +644,13 @@ async def handle_media_stream(websocket: WebSocket):
                             "audio_end_ms": elapsed_time
                         }
                         # print(f"Sending truncate event: {truncate_event}")
-                        await openai_ws.send(json.dumps(truncate_event))
+                        await openai_ws.send(codec.encode(truncate_event))
 
-                    await websocket.send_json({
-                        "event": "clear",
-                        "streamSid": stream_sid
-                    })
+                    # Audio still queued here is dropped along with what Twilio has buffered
+                    _, unsent_marks = await sender.clear(twilio_clear(stream_sid))
+                    if recorder is not None:
+                        recorder.clear()
+                    latency.barge_in(speech_started_at, len(mark_queue), unsent_marks)
 
                     mark_queue.clear()
                     last_assistant_item = None
@@ -344,28 +658,42 @@ async def handle_media_stream(websocket: WebSocket):
 
             async def send_mark(connection, stream_sid):
                 if stream_sid:
-                    mark_event = {
-                        "event": "mark",
-                        "streamSid": stream_sid,
-                        "mark": {"name": "responsePart"}
-                    }
-                    await connection.send_json(mark_event)
+                    connection.mark(twilio_mark(stream_sid, "responsePart"))
                     mark_queue.append('responsePart')
+                    latency.mark_sent()
+
+            if greeting:
+                # Play the recorded greeting right away, interruptible like any other response
+                response_start_timestamp_twilio = latest_media_timestamp
+                for payload in greeting.frames():
+                    if sender.media(twilio_media(stream_sid, payload)) and recorder is not None:
+                        recorder.outbound(payload)
+                latency.frames_sent(len(greeting.frames()))
+                await send_mark(sender, stream_sid)
 
             await asyncio.gather(receive_from_twilio(), send_to_twilio())
     finally:
+        await sender.close()
+        call_data_writer.update(user_id, call_sid, {"latency": latency.finish(), "send_queue": sender.stats()})
+        if recorder is not None:
+            await recorder.close()
+            call_data_writer.update(user_id, call_sid, {
+                "recording": {"paths": recorder.paths, "frames_dropped": recorder.frames_dropped}
+            })
+        await call_data_writer.flush(call_sid)
+        call_data_writer.finish_call(call_sid)
         print("CALL OVER")
 
-async def initialize_session(openai_ws):
+async def initialize_session(openai_ws, context):
     """Control initial session with OpenAI."""
     session_update = {
         "type": "session.update",
         "session": {
             "turn_detection": {"type": "server_vad"},
-            "input_audio_format": "g711_ulaw",
-            "output_audio_format": "g711_ulaw",
+            "input_audio_format": AUDIO_FORMAT,
+            "output_audio_format": AUDIO_FORMAT,
             "voice": VOICE,
-            "instructions": INITIAL_PROMPT,
+            "instructions": context.prompt,
             "modalities": ["text", "audio"],
             "temperature": 0.7,
             "input_audio_transcription": {
@@ -375,12 +703,13 @@ async def initialize_session(openai_ws):
     }
     print('Sending session update:', json.dumps(session_update))
     await openai_ws.send(json.dumps(session_update))
+    session_prompts[openai_ws] = context.prompt
 
     # Ensure the AI starts the conversation
-    await send_initial_conversation_item(openai_ws)
+    await send_initial_conversation_item(openai_ws, context)
 
-async def send_initial_conversation_item(openai_ws):
-    """Send initial conversation item if AI talks first."""
+async def send_initial_conversation_item(openai_ws, context):
+    """Send initial conversation item if AI talks first. A recorded greeting is seeded instead of generated."""
     initial_conversation_item = {
         "type": "conversation.item.create",
         "item": {
@@ -389,13 +718,45 @@ async def send_initial_conversation_item(openai_ws):
             "content": [
                 {
                     "type": "input_text",
-                    "text": INITIAL_CONVERSATION_TEXT
+                    "text": context.conversation_text
                 }
             ]
         }
     }
     await openai_ws.send(json.dumps(initial_conversation_item))
-    await openai_ws.send(json.dumps({"type": "response.create"}))
+
+    greeting = None
+    if GREETING_CACHE:
+        greeting = await asyncio.to_thread(greeting_cache.get, context.conversation_text, context.customer_name, VOICE, AUDIO_FORMAT)
+    if greeting is None:
+        await openai_ws.send(json.dumps({"type": "response.create"}))
+        return
+
+    # The media stream plays the recording, the model only needs to know what it said
+    context.greeting_key = greeting.key
+    # The media stream may be served by another worker
+    await asyncio.to_thread(call_store.update, context.call_sid, {"greeting_key": greeting.key})
+    greeting_item = {
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": "assistant",
+            "content": [
+                {
+                    "type": "input_text",
+                    "text": greeting.transcript
+                }
+            ]
+        }
+    }
+    await openai_ws.send(json.dumps(greeting_item))
+
+async def cache_greeting(context, audio, transcript):
+    """Store a greeting recorded on a call, for the next calls with the same conversation text and customer."""
+    try:
+        await asyncio.to_thread(greeting_cache.put, context.conversation_text, context.customer_name, VOICE, AUDIO_FORMAT, audio, transcript)
+    except Exception as e:
+        print(f"Error caching greeting: {e}")
 
 
 test_prompt= (''' general negotiation script based on common practices that can be adapted once specific details are available. Here’s a concise plan: